@@ -15,6 +15,8 @@ from app.core.config import settings
 # Import all models here for Alembic to detect them
 from app.models.user import User, Account, Session, VerificationToken
 from app.models.invoice import Invoice, InvoiceItem
+from app.models.vendor_template import VendorTemplate
+from app.models.email_credential import EmailCredential, EmailProcessingLog
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,29 @@
+"""Order the content hash index by created_at
+
+Revision ID: a4e7b2c9d315
+Revises: f3b9c1d7a264
+Create Date: 2026-10-17 21:12:08.530614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e7b2c9d315'
+down_revision = 'f3b9c1d7a264'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_invoices_user_id_content_sha256_created_at', 'invoices', ['user_id', 'content_sha256', 'created_at'],
+        unique=False
+    )
+    op.drop_index('ix_invoices_user_id_content_sha256', table_name='invoices')
+
+
+def downgrade() -> None:
+    op.create_index('ix_invoices_user_id_content_sha256', 'invoices', ['user_id', 'content_sha256'], unique=False)
+    op.drop_index('ix_invoices_user_id_content_sha256_created_at', table_name='invoices')
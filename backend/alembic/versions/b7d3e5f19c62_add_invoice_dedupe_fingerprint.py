@@ -0,0 +1,103 @@
+"""Add invoice dedupe fingerprint
+
+Revision ID: b7d3e5f19c62
+Revises: 8e4b2d7c1a95
+Create Date: 2026-10-17 16:41:05.734120
+
+"""
+import hashlib
+import re
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e5f19c62'
+down_revision = '8e4b2d7c1a95'
+branch_labels = None
+depends_on = None
+
+
+# Frozen copy of app/services/invoice_fingerprint.py as of this revision, so
+# later changes to the app's normalization never alter what this backfill wrote
+def _normalize_vendor(vendor_name):
+    if not vendor_name:
+        return None
+    return " ".join(re.sub(r"[\W_]+", " ", vendor_name.casefold()).split()) or None
+
+
+def _normalize_amount(amount_due):
+    if not amount_due:
+        return None
+    return f"{round(amount_due, 2):.2f}"
+
+
+def _normalize_date(invoice_date):
+    if not invoice_date or not invoice_date.strip():
+        return None
+    value = invoice_date.strip()
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        return value
+
+
+def invoice_fingerprint(vendor_name, amount_due, invoice_date):
+    parts = (_normalize_vendor(vendor_name), _normalize_amount(amount_due), _normalize_date(invoice_date))
+    if None in parts:
+        return None
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _backfill_fingerprints() -> None:
+    """Fingerprint existing invoices; among existing duplicates only the oldest gets one"""
+    bind = op.get_bind()
+    invoices = sa.table(
+        'invoices',
+        sa.column('id', sa.String()),
+        sa.column('user_id', sa.String()),
+        sa.column('vendor_name', sa.String()),
+        sa.column('amount_due', sa.Float()),
+        sa.column('invoice_date', sa.String()),
+        sa.column('created_at', sa.DateTime()),
+        sa.column('dedupe_fingerprint', sa.String()),
+    )
+    rows = bind.execute(
+        sa.select(invoices.c.id, invoices.c.user_id, invoices.c.vendor_name, invoices.c.amount_due,
+                  invoices.c.invoice_date)
+        .order_by(invoices.c.created_at)
+    )
+    seen = set()
+    updates = []
+    for invoice_id, user_id, vendor_name, amount_due, invoice_date in rows:
+        fingerprint = invoice_fingerprint(vendor_name, amount_due, invoice_date)
+        if fingerprint and (user_id, fingerprint) not in seen:
+            seen.add((user_id, fingerprint))
+            updates.append({'row_id': invoice_id, 'fingerprint': fingerprint})
+    if updates:
+        bind.execute(
+            invoices.update()
+            .where(invoices.c.id == sa.bindparam('row_id'))
+            .values(dedupe_fingerprint=sa.bindparam('fingerprint')),
+            updates
+        )
+
+
+def upgrade() -> None:
+    op.add_column('invoices', sa.Column('dedupe_fingerprint', sa.String(length=64), nullable=True))
+    if not op.get_context().as_sql:
+        _backfill_fingerprints()
+    op.create_index(
+        'ux_invoices_user_id_dedupe_fingerprint', 'invoices', ['user_id', 'dedupe_fingerprint'], unique=True,
+        postgresql_where=sa.text('dedupe_fingerprint IS NOT NULL'),
+        sqlite_where=sa.text('dedupe_fingerprint IS NOT NULL')
+    )
+    op.create_index('ix_invoices_user_id_original_filename', 'invoices', ['user_id', 'original_filename'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_invoices_user_id_original_filename', table_name='invoices')
+    op.drop_index('ux_invoices_user_id_dedupe_fingerprint', table_name='invoices')
+    op.drop_column('invoices', 'dedupe_fingerprint')
@@ -0,0 +1,47 @@
+"""Add composite indexes for invoice and email log queries
+
+Revision ID: d2a6f8c4e173
+Revises: b7d3e5f19c62
+Create Date: 2026-10-17 18:22:49.061537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f8c4e173'
+down_revision = 'b7d3e5f19c62'
+branch_labels = None
+depends_on = None
+
+
+def _has_email_logs() -> bool:
+    # email_processing_logs is created by the app at startup (an earlier
+    # revision dropped it), so it may not exist yet
+    return op.get_context().as_sql or sa.inspect(op.get_bind()).has_table('email_processing_logs')
+
+
+def upgrade() -> None:
+    op.create_index('ix_invoices_user_id_created_at', 'invoices', ['user_id', 'created_at'], unique=False)
+    op.create_index(
+        'ix_invoices_user_id_status_created_at', 'invoices', ['user_id', 'status', 'created_at'], unique=False,
+        postgresql_include=['amount_due']
+    )
+    if _has_email_logs():
+        op.create_index(
+            'ix_email_processing_logs_user_id_processed_at', 'email_processing_logs',
+            ['user_id', 'processed_at'], unique=False
+        )
+        op.create_index(
+            'ix_email_processing_logs_user_id_message_id_status', 'email_processing_logs',
+            ['user_id', 'email_message_id', 'status'], unique=False
+        )
+
+
+def downgrade() -> None:
+    if _has_email_logs():
+        op.drop_index('ix_email_processing_logs_user_id_message_id_status', table_name='email_processing_logs')
+        op.drop_index('ix_email_processing_logs_user_id_processed_at', table_name='email_processing_logs')
+    op.drop_index('ix_invoices_user_id_status_created_at', table_name='invoices')
+    op.drop_index('ix_invoices_user_id_created_at', table_name='invoices')
@@ -0,0 +1,40 @@
+"""Add unique index for in-progress uploads of the same file
+
+Revision ID: f3b9c1d7a264
+Revises: d2a6f8c4e173
+Create Date: 2026-10-17 20:05:37.418209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9c1d7a264'
+down_revision = 'd2a6f8c4e173'
+branch_labels = None
+depends_on = None
+
+IN_PROGRESS = "status IN ('PENDING', 'PROCESSING')"
+
+
+def upgrade() -> None:
+    # Existing concurrent duplicates: keep the oldest in-progress row per file
+    op.execute(
+        "UPDATE invoices SET status = 'FAILED', processing_error = 'Duplicate of an upload already in progress' "
+        f"WHERE {IN_PROGRESS} AND content_sha256 IS NOT NULL AND EXISTS ("
+        "SELECT 1 FROM invoices AS earlier "
+        "WHERE earlier.user_id = invoices.user_id AND earlier.content_sha256 = invoices.content_sha256 "
+        f"AND earlier.{IN_PROGRESS} "
+        "AND (earlier.created_at < invoices.created_at "
+        "OR (earlier.created_at = invoices.created_at AND earlier.id < invoices.id)))"
+    )
+    op.create_index(
+        'ux_invoices_user_id_content_sha256_in_progress', 'invoices', ['user_id', 'content_sha256'], unique=True,
+        postgresql_where=sa.text(IN_PROGRESS),
+        sqlite_where=sa.text(IN_PROGRESS)
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ux_invoices_user_id_content_sha256_in_progress', table_name='invoices')
@@ -5,6 +5,7 @@ Handles OAuth flow for Gmail authentication
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+import logging
 import secrets
 import json
 
@@ -15,6 +16,8 @@ from app.services.encryption import encryption_service
 from app.crud import email_credential
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -92,9 +95,7 @@ def handle_gmail_callback(
     Exchanges authorization code for tokens and stores in database
     """
     
-    print(f"🔔 Gmail OAuth callback received for user {current_user.id}")
-    print(f"   Code: {callback_data.code[:20]}...")
-    print(f"   State: {callback_data.state}")
+    logger.info("Gmail OAuth callback received for user %s", current_user.id)
     
     # TODO: Verify state token matches what we generated
     # For production, check against Redis/cache
@@ -140,8 +141,7 @@ def handle_gmail_callback(
         tokens_json = json.dumps(tokens)
         encrypted_tokens = encryption_service.encrypt(tokens_json)
         
-        print(f"✅ Got tokens for {email_address}")
-        print(f"   Token length: {len(encrypted_tokens)} chars (encrypted)")
+        logger.debug("Got tokens for %s", email_address)
         
         # Check if email config already exists
         existing = email_credential.get_email_credential(db, current_user.id)
@@ -151,7 +151,7 @@ def handle_gmail_callback(
             from app.schemas.email_credential import EmailCredentialUpdate
             from datetime import datetime
             
-            print(f"📝 Updating existing email credential for user {current_user.id}")
+            logger.debug("Updating existing email credential for user %s", current_user.id)
             
             update_data = EmailCredentialUpdate(
                 email_address=email_address,
@@ -164,8 +164,7 @@ def handle_gmail_callback(
                 imap_port=None,
                 imap_username=None
             )
-            
-            print(f"   OAuth token in update_data: {update_data.oauth_token[:50]}... (length: {len(update_data.oauth_token) if update_data.oauth_token else 0})")
+
             
             email_credential.update_email_credential(
                 db=db,
@@ -173,7 +172,7 @@ def handle_gmail_callback(
                 credential_update=update_data
             )
             
-            print(f"✅ Updated email credential with OAuth token")
+            logger.info("Updated email credential with OAuth token for user %s", current_user.id)
         else:
             # Create new configuration
             from app.schemas.email_credential import EmailCredentialCreate
@@ -203,7 +202,7 @@ def handle_gmail_callback(
         )
         
     except Exception as e:
-        print(f"❌ Gmail OAuth callback error: {e}")
+        logger.error("Gmail OAuth callback error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"OAuth callback failed: {str(e)}"
@@ -1,27 +1,38 @@
 """
 Invoice API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import csv
 import json
 import io
+import logging
 from app.db.session import get_db
+from app.core.metrics import track_stage
 from app.api.deps import get_current_active_user
 from app.models.user import User as UserModel
-from app.models.invoice import InvoiceStatus
+from app.models.invoice import Invoice as InvoiceModel, InvoiceStatus
 from app.schemas.invoice import (
     Invoice,
     InvoiceList,
     InvoiceUpdate,
     InvoiceUploadResponse,
-    InvoiceCreate
+    InvoiceJobResponse,
+    InvoiceCreate,
+    InvoiceExtractionResponse,
+    BulkUploadResponse
 )
 from app.crud import invoice as invoice_crud
-from app.services.invoice_processing import process_invoice_file, extract_text_from_pdf
+from app.services.invoice_processing import process_invoice_document_async
+from app.services.invoice_jobs import store_upload, remove_upload, run_invoice_job, stale_job_cutoff
+from app.services.bulk_upload import ingest_bulk_upload
+from app.services.upload_intake import receive_upload, stored_file_type
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -38,46 +49,39 @@ async def upload_invoice(
     - Extracts invoice data using Google Gemini AI
     - Stores invoice in database
     - Returns extracted information
+    - A file already uploaded (same bytes) returns the existing invoice
+      without extracting it again
     """
     
-    # Validate file type
-    allowed_types = ["application/pdf", "image/jpeg", "image/jpg", "image/png"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type {file.content_type} not supported. Please upload PDF, JPG, or PNG."
-        )
+    with track_stage("upload.read", file.content_type):
+        upload = await receive_upload(file)
     
-    # Validate file size (max 10MB)
-    file_contents = await file.read()
-    file_size = len(file_contents)
-    max_size = 10 * 1024 * 1024  # 10MB
-    
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File size ({file_size / (1024*1024):.2f}MB) exceeds maximum allowed size (10MB)"
+    existing_invoice = invoice_crud.find_invoice_by_content(db, current_user.id, upload.sha256)  # type: ignore
+    if existing_invoice:
+        return InvoiceUploadResponse(
+            message="Invoice already uploaded",
+            invoice=Invoice.model_validate(existing_invoice),
+            extraction_data=_stored_extraction(existing_invoice)
         )
     
-    print(f"--- 📤 Processing upload: {file.filename} ({file.content_type}, {file_size} bytes) ---")
+    logger.info("Processing upload: %s (%s, %d bytes)", file.filename, upload.content_type, upload.size)
     
     try:
-        # Process the invoice file with Gemini AI
-        extraction_result = process_invoice_file(file_contents, file.content_type)
-        
-        # Extract text if PDF (for search/reference)
-        extracted_text = None
-        if file.content_type == "application/pdf":
-            extracted_text = extract_text_from_pdf(file_contents)
-        
-        # Determine file type
-        file_type = "pdf" if file.content_type == "application/pdf" else file.content_type.split("/")[1]
+        # Process the invoice file with Gemini AI (PDF is parsed once;
+        # its text is kept for search/reference). Runs off the event loop
+        # so other requests on this worker keep being served.
+        with track_stage("upload.extract", upload.content_type):
+            processing_result = await process_invoice_document_async(
+                upload.data, upload.content_type, current_user.id, file_sha256=upload.sha256
+            )
+        extraction_result = processing_result.extraction
+        extracted_text = processing_result.extracted_text
         
         # Create invoice in database
         invoice_data = InvoiceCreate(
             original_filename=file.filename,
-            file_size=file_size,
-            file_type=file_type
+            file_size=upload.size,
+            file_type=stored_file_type(upload.content_type)
         )
         
         db_invoice = invoice_crud.create_invoice(
@@ -85,7 +89,8 @@ async def upload_invoice(
             user_id=current_user.id,  # type: ignore
             invoice_data=invoice_data,
             extraction_result=extraction_result,
-            extracted_text=extracted_text
+            extracted_text=extracted_text,
+            content_sha256=upload.sha256
         )
         
         return InvoiceUploadResponse(
@@ -97,13 +102,141 @@ async def upload_invoice(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"--- ❌ Error processing invoice: {e} ---")
+        logger.error("Error processing invoice: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing invoice: {str(e)}"
         )
 
 
+@router.post("/upload/async", response_model=InvoiceJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_invoice_async(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Upload an invoice file and process it in the background
+    
+    - Stores the file and creates a pending invoice
+    - Returns 202 with the invoice id immediately
+    - Poll GET /invoices/{id}/status until it is completed or failed
+    - A file already uploaded (same bytes) returns the existing invoice,
+      finished or still in progress, and starts no new job; an in-progress
+      invoice whose job was lost (see INVOICE_JOB_STALE_SECONDS) is
+      requeued with the new upload instead
+    """
+    
+    with track_stage("upload.read", file.content_type):
+        upload = await receive_upload(file)
+    
+    existing_invoice = invoice_crud.find_invoice_by_content(
+        db, current_user.id, upload.sha256, include_in_progress=True  # type: ignore
+    )
+    stale = existing_invoice is not None and existing_invoice.status != InvoiceStatus.COMPLETED \
+        and existing_invoice.updated_at < stale_job_cutoff()
+    if existing_invoice and not stale:
+        return _already_uploaded(existing_invoice)
+    
+    logger.info("Queueing upload: %s (%s, %d bytes)", file.filename, upload.content_type, upload.size)
+    
+    file_path = await asyncio.to_thread(store_upload, current_user.id, file.filename, upload.data)
+    try:
+        if stale:
+            db_invoice = _requeue_stale_invoice(db, existing_invoice, file_path)
+        else:
+            invoice_data = InvoiceCreate(
+                original_filename=file.filename,
+                file_size=upload.size,
+                file_type=stored_file_type(upload.content_type)
+            )
+            db_invoice = invoice_crud.create_pending_invoice(
+                db=db,
+                user_id=current_user.id,  # type: ignore
+                invoice_data=invoice_data,
+                file_path=file_path,
+                content_sha256=upload.sha256
+            )
+    except Exception:
+        remove_upload(file_path)
+        raise
+    
+    if db_invoice is None:
+        # A concurrent upload of the same file got there first
+        remove_upload(file_path)
+        existing_invoice = invoice_crud.find_invoice_by_content(
+            db, current_user.id, upload.sha256, include_in_progress=True  # type: ignore
+        )
+        if existing_invoice is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The same file is being uploaded right now, please retry shortly"
+            )
+        return _already_uploaded(existing_invoice)
+    
+    background_tasks.add_task(run_invoice_job, db_invoice.id, file_path, upload.content_type)
+    
+    return InvoiceJobResponse(
+        message="Invoice accepted for processing",
+        invoice_id=db_invoice.id,
+        status=db_invoice.status
+    )
+
+
+@router.post("/upload/bulk", response_model=BulkUploadResponse)
+async def upload_invoices_bulk(
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Upload many invoice files and/or ZIP archives at once
+    
+    - ZIP members are read one by one, never all in memory
+    - Extraction runs in parallel under a concurrency limit
+    - Returns a result (created, duplicate or failed) per invoice file
+    """
+    
+    return await ingest_bulk_upload(db, current_user.id, files)  # type: ignore
+
+
+def _already_uploaded(db_invoice: InvoiceModel) -> InvoiceJobResponse:
+    """Async upload response for a file the user already uploaded"""
+    completed = db_invoice.status == InvoiceStatus.COMPLETED
+    return InvoiceJobResponse(
+        message="Invoice already uploaded",
+        invoice_id=db_invoice.id,
+        status=db_invoice.status,
+        invoice=Invoice.model_validate(db_invoice) if completed else None
+    )
+
+
+def _requeue_stale_invoice(db: Session, db_invoice: InvoiceModel, file_path: str) -> Optional[InvoiceModel]:
+    """Take over an in-progress invoice whose job was lost, processing the new upload; None if another process got it"""
+    old_path = db_invoice.file_path
+    if not invoice_crud.claim_stale_invoice(db, db_invoice, file_path=file_path):
+        return None
+    if old_path and old_path != file_path:
+        remove_upload(old_path)
+    db.refresh(db_invoice)
+    return db_invoice
+
+
+def _stored_extraction(db_invoice: InvoiceModel) -> InvoiceExtractionResponse:
+    """Extraction fields of a stored invoice, shaped like a fresh extraction"""
+    return InvoiceExtractionResponse(
+        invoice_id=db_invoice.invoice_id,
+        vendor_name=db_invoice.vendor_name,
+        amount_due=db_invoice.amount_due,
+        due_date=db_invoice.due_date,
+        invoice_date=db_invoice.invoice_date,
+        currency_code=db_invoice.currency_code,
+        confidence_score=db_invoice.confidence_score or 0.0,
+        extraction_method=db_invoice.extraction_method
+    )
+
+
 @router.get("/", response_model=InvoiceList)
 def list_invoices(
     page: int = Query(1, ge=1, description="Page number"),
@@ -331,6 +464,46 @@ def get_invoice(
     return Invoice.model_validate(db_invoice)
 
 
+@router.get("/{invoice_id}/status", response_model=InvoiceJobResponse)
+def get_invoice_status(
+    invoice_id: str,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """
+    Get the processing status of an invoice (for async uploads)
+    
+    - Includes the invoice once processing has completed
+    """
+    
+    db_invoice = invoice_crud.get_invoice(
+        db=db,
+        invoice_id=invoice_id,
+        user_id=current_user.id  # type: ignore
+    )
+    
+    if not db_invoice:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invoice not found"
+        )
+    
+    messages = {
+        InvoiceStatus.PENDING: "Invoice is waiting to be processed",
+        InvoiceStatus.PROCESSING: "Invoice is being processed",
+        InvoiceStatus.COMPLETED: "Invoice processed successfully",
+        InvoiceStatus.FAILED: "Invoice processing failed",
+    }
+    
+    return InvoiceJobResponse(
+        message=messages[db_invoice.status],
+        invoice_id=db_invoice.id,
+        status=db_invoice.status,
+        processing_error=db_invoice.processing_error,
+        invoice=Invoice.model_validate(db_invoice) if db_invoice.status == InvoiceStatus.COMPLETED else None
+    )
+
+
 @router.put("/{invoice_id}", response_model=Invoice)
 def update_invoice(
     invoice_id: str,
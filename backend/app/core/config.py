@@ -1,6 +1,9 @@
+import logging
 from pydantic_settings import BaseSettings
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 
 class Settings(BaseSettings):
     # Database
@@ -28,7 +31,97 @@ class Settings(BaseSettings):
     
     # Google Gemini AI (for invoice processing)
     GOOGLE_API_KEY: Optional[str] = None
+    GEMINI_MODEL: str = "gemini-2.0-flash-exp"
+    GEMINI_BATCH_MAX_DOCUMENTS: int = 5  # Text invoices packed into one request (email polling)
+    GEMINI_BATCH_MAX_CHARS: int = 60_000
+    
+    # Extraction backend: gemini, local (rules only) or fake (offline load testing)
+    EXTRACTION_BACKEND: str = "gemini"
+    FAKE_EXTRACTION_LATENCY_SECONDS: float = 1.5  # Median simulated call latency
+    FAKE_EXTRACTION_LATENCY_SIGMA: float = 0.4  # Log-normal spread (0 = constant)
+    FAKE_EXTRACTION_ERROR_RATE: float = 0.0  # Share of calls failing with 503
+    FAKE_EXTRACTION_SEED: Optional[int] = None  # Fixed seed for repeatable runs
+    
+    # Gemini gateway (shared limits and retry policy for generate_content)
+    GEMINI_MAX_CONCURRENCY: int = 4  # Concurrent calls per process, 0 = unlimited
+    GEMINI_RATE_LIMIT_PER_MINUTE: float = 60.0  # 0 = unlimited
+    GEMINI_RATE_LIMIT_BURST: int = 10
+    GEMINI_MAX_RETRIES: int = 4
+    GEMINI_RETRY_BASE_DELAY_SECONDS: float = 1.0
+    GEMINI_RETRY_MAX_DELAY_SECONDS: float = 30.0
+    GEMINI_CALL_DEADLINE_SECONDS: float = 90.0  # Per call, including queueing and retries
+    
+    # Local rule-based extraction (skips Gemini for confident text-layer PDFs)
+    LOCAL_EXTRACTION_ENABLED: bool = True
+    LOCAL_EXTRACTION_MIN_CONFIDENCE: float = 0.85
+    LOCAL_EXTRACTION_REQUIRED_FIELDS: str = "invoice_id,vendor_name,amount_due,invoice_date"
+
+    # Prompt text compaction (whitespace, repeated headers/footers, boilerplate, size cap)
+    TEXT_COMPACTION_ENABLED: bool = True
+    TEXT_COMPACTION_MAX_CHARS: int = 12_000  # 0 = no cap
+
+    # Vendor templates (learned from confirmed invoices, applied before local rules and Gemini)
+    VENDOR_TEMPLATES_ENABLED: bool = True
+    VENDOR_TEMPLATE_CACHE_SIZE: int = 1024  # In-memory LRU index size
+    VENDOR_TEMPLATE_MAX_PER_USER: int = 200  # Least recently used templates are evicted beyond this
+
+    # Extraction cache (skips repeat Gemini calls for identical files)
+    EXTRACTION_CACHE_ENABLED: bool = True
+    EXTRACTION_CACHE_MAX_ENTRIES: int = 512  # In-memory LRU size
+    EXTRACTION_CACHE_DIR: Optional[str] = ".cache/extractions"  # Persistent tier, None to disable
+    EXTRACTION_CACHE_MAX_DISK_ENTRIES: int = 10000
+    EXTRACTION_CACHE_TTL_SECONDS: int = 30 * 24 * 3600  # 30 days
+    EXTRACTION_CACHE_WAIT_TIMEOUT_SECONDS: float = 120.0  # Max wait on a concurrent extraction of the same file
+
+    # Duplicate detection (normalized vendor + amount + date fingerprints)
+    DEDUPE_FINGERPRINT_CACHE_SIZE: int = 4096  # Recently stored fingerprints kept per process, 0 = off
     
+    # Uploaded files (kept for background processing via /invoices/upload/async)
+    UPLOAD_DIR: str = "uploads"
+    # Pending/processing invoices untouched for this long lost their job (requeued at startup, 0 = never)
+    INVOICE_JOB_STALE_SECONDS: int = 900
+    
+    # Bulk upload (many files or ZIP archives in one request)
+    BULK_UPLOAD_MAX_FILES: int = 500
+    BULK_UPLOAD_MAX_BYTES: int = 200 * 1024 * 1024  # Whole request body (files and archives)
+    BULK_UPLOAD_CONCURRENCY: int = 4  # Files extracted in parallel per request
+    BULK_UPLOAD_COMMIT_BATCH_SIZE: int = 25
+    
+    # Document engine (worker processes for PDF/image work, 0 = in-process)
+    DOCUMENT_ENGINE_WORKERS: int = 2
+    DOCUMENT_ENGINE_TASK_TIMEOUT_SECONDS: float = 30.0
+    DOCUMENT_ENGINE_MAX_TASKS_PER_CHILD: int = 50  # Recycle workers to bound leaks
+    DOCUMENT_ENGINE_WORKER_MEMORY_MB: int = 2048  # Per-worker address-space cap, 0 = unlimited
+    
+    # Image preparation for multimodal requests
+    IMAGE_PIXEL_BUDGET: int = 3_000_000  # Target pixels per page image
+    IMAGE_MAX_DPI: int = 200
+    IMAGE_MIN_DPI: int = 96
+    IMAGE_MAX_LONG_EDGE: int = 2400
+    IMAGE_FORMAT: str = "JPEG"  # JPEG or WEBP
+    IMAGE_QUALITY: int = 80
+    IMAGE_DETECT_GRAYSCALE: bool = True
+    IMAGE_AUTO_CROP: bool = False  # Crop phone photos to the document before encoding
+    IMAGE_EMBEDDED_PASSTHROUGH: bool = True  # Send single-JPEG scanned pages without rendering
+
+    # Mixed PDFs: send typed pages as text and only scanned pages as images
+    PDF_PAGE_ROUTING_ENABLED: bool = True
+
+    # Scanned PDFs: rasterize (page images), native (the PDF itself, trimmed to
+    # the selected pages) or auto (native unless every page is a pass-through JPEG)
+    PDF_SUBMISSION_MODE: str = "rasterize"
+
+    # Page selection for scanned PDFs (0 = send every page)
+    IMAGE_MAX_PAGES: int = 4
+    IMAGE_PREFER_FIRST_PAGE: bool = True
+    IMAGE_PREFER_LAST_PAGE: bool = True
+
+    # Logging (JSON lines on stdout, written by a background thread)
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""  # Per-logger overrides, e.g. "app.services.gemini_extraction=DEBUG,app.crud=WARNING"
+    LOG_FORMAT: str = "json"  # json or text
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0  # Share of DEBUG records kept per call site
+
     # Encryption (for email credentials)
     ENCRYPTION_KEY: Optional[str] = None
     
@@ -41,6 +134,6 @@ class Settings(BaseSettings):
 
 
 settings = Settings()  # type: ignore  # Reads from .env file
-print(settings.FRONTEND_URLS)
 # Parse CORS origins from comma-separated FRONTEND_URLS
 BACKEND_CORS_ORIGINS = [url.strip() for url in settings.FRONTEND_URLS.split(",") if url.strip()]
+logger.debug("CORS origins: %s", BACKEND_CORS_ORIGINS)
@@ -0,0 +1,141 @@
+"""
+Logging setup: JSON (or plain text) lines, per-logger levels, sampling of
+high-volume debug events and a non-blocking queue handler
+
+Request handlers only put records on an in-memory queue; a listener thread
+formats and writes them. Debug calls in the hot paths use lazy %-style
+arguments (and isEnabledFor() around expensive ones), so with the default
+INFO level they cost a level check and nothing else.
+
+Settings:
+    LOG_LEVEL: Root level (default INFO)
+    LOG_LEVELS: Per-logger overrides, e.g. "app.services.gemini_extraction=DEBUG,app.crud=WARNING"
+    LOG_FORMAT: "json" (default) or "text"
+    LOG_DEBUG_SAMPLE_RATE: Share of DEBUG records kept, per call site (1.0 = all)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from app.core.config import settings
+
+
+# Attributes every LogRecord has; anything else was passed through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, extra fields and exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text  # Rendered before the record was queued
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keep a fixed share of DEBUG records per call site (logger + message
+    template); INFO and above always pass
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = min(max(rate, 0.0), 1.0)
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        # Deterministic: passes when the running count crosses a multiple of 1/rate
+        return int((count + 1) * self.rate) > int(count * self.rate)
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps extra fields and leaves formatting to the listener"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        # Freeze the message now (arguments may change before the listener runs)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, int]:
+    """Parse "app.crud=WARNING,app.services.email_polling=DEBUG" into {logger: level}"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def setup_logging() -> None:
+    """
+    Route all logging through a queue to one stdout writer thread
+    (idempotent; call once at startup)
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        formatter = JsonFormatter() if settings.LOG_FORMAT.lower() == "json" else logging.Formatter(_TEXT_FORMAT)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(formatter)
+
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        enqueue = _EnqueueHandler(records)
+        enqueue.addFilter(DebugSampler(settings.LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(enqueue)
+        root.setLevel(settings.LOG_LEVEL.upper())
+        for name, level in _parse_levels(settings.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,165 @@
+"""
+Prometheus metrics for uploads, extraction stages and HTTP requests
+Stage timings share one histogram labeled by stage, content type and
+outcome, so a slow upload can be broken down into PDF parsing,
+rasterization, the model call, validation and the database work.
+Exposed in Prometheus text format on /metrics.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from fastapi import HTTPException
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Seconds; spans regex work (~ms) up to slow multimodal calls
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    "invox_stage_duration_seconds",
+    "Time spent in one stage of upload, extraction or email polling",
+    ["stage", "content_type", "outcome"],
+    buckets=STAGE_BUCKETS
+)
+
+# Prompt text compaction; rate(output) / rate(input) is the share of text kept
+PROMPT_TEXT_CHARS = Counter(
+    "invox_prompt_text_chars_total",
+    "Characters of PDF text before (input) and after (output) prompt compaction",
+    ["direction"]
+)
+
+PROMPT_TEXT_LINES_DROPPED = Counter(
+    "invox_prompt_text_lines_dropped_total",
+    "Repeated or boilerplate lines dropped by prompt compaction"
+)
+
+HTTP_REQUESTS = Counter(
+    "invox_http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"]
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "invox_http_request_duration_seconds",
+    "HTTP request latency by route and status",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS
+)
+
+HTTP_IN_PROGRESS = Gauge(
+    "invox_http_requests_in_progress",
+    "HTTP requests being served",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+
+
+# Stored invoices carry a file extension instead of a MIME type
+_IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tif", "tiff", "heic"}
+
+
+def content_type_label(content_type: Optional[str]) -> str:
+    """Collapse MIME types and file extensions into a few label values (keeps cardinality low)"""
+    if not content_type:
+        return "none"
+    content_type = content_type.lower()
+    if content_type == "application/pdf":
+        return "pdf"
+    if content_type.startswith("image/") or content_type in _IMAGE_EXTENSIONS:
+        return "image"
+    if content_type in ("text", "pdf", "image", "mixed", "none"):
+        return content_type
+    return "other"
+
+
+class StageTimer:
+    """Handle yielded by track_stage(); set outcome to override the default"""
+
+    def __init__(self):
+        self.outcome: Optional[str] = None
+
+
+@contextmanager
+def track_stage(stage: str, content_type: Optional[str] = None) -> Iterator[StageTimer]:
+    """
+    Time a block and record it in invox_stage_duration_seconds
+
+    The outcome is "success", "client_error" (4xx HTTPException) or "error",
+    unless the block sets timer.outcome (e.g. "hit" / "miss").
+
+    Args:
+        stage: Stage name, e.g. "analyze", "render", "model", "dedupe"
+        content_type: MIME type or label value ("pdf", "image", "text")
+    """
+    timer = StageTimer()
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield timer
+    except HTTPException as e:
+        outcome = "client_error" if e.status_code < 500 else "error"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.labels(
+            stage=stage,
+            content_type=content_type_label(content_type),
+            outcome=timer.outcome if outcome == "success" and timer.outcome else outcome
+        ).observe(time.perf_counter() - started)
+
+
+class _GatewayCollector:
+    """Exports the extraction gateway's counters at scrape time"""
+
+    def collect(self):
+        from app.services.extraction_gateway import extraction_gateway  # Avoid an import cycle
+
+        stats = extraction_gateway.stats()
+        for name in ("calls", "attempts", "retries", "throttled", "timeouts", "failures"):
+            yield CounterMetricFamily(
+                f"invox_gemini_gateway_{name}",
+                f"Gemini gateway {name} in this process",
+                value=stats[name]
+            )
+        yield GaugeMetricFamily("invox_gemini_gateway_in_flight", "Gemini calls in flight", value=stats["in_flight"])
+        yield GaugeMetricFamily(
+            "invox_gemini_gateway_queue_wait_max_seconds",
+            "Longest wait for a gateway slot",
+            value=stats["queue_wait_max_seconds"]
+        )
+
+
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    REGISTRY.register(_GatewayCollector())
+
+
+def render_metrics() -> tuple:
+    """
+    Current metrics in Prometheus text format
+
+    With several worker processes (PROMETHEUS_MULTIPROC_DIR set), samples
+    from all workers are aggregated; per-process gateway counters are then
+    left out.
+
+    Returns:
+        (body bytes, content type)
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
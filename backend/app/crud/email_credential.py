@@ -1,6 +1,7 @@
 """
 CRUD operations for email credentials
 """
+import logging
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime
@@ -9,6 +10,9 @@ from app.schemas.email_credential import EmailCredentialCreate, EmailCredentialU
 from app.services.encryption import encryption_service
 
 
+logger = logging.getLogger(__name__)
+
+
 def create_email_credential(
     db: Session,
     user_id: str,
@@ -52,7 +56,7 @@ def create_email_credential(
     db.commit()
     db.refresh(db_credential)
     
-    print(f"✅ Created email credential for {credential_data.email_address}")
+    logger.info("Created email credential", extra={"user_id": user_id, "provider": credential_data.provider})
     return db_credential
 
 
@@ -109,7 +113,7 @@ def update_email_credential(
     db.commit()
     db.refresh(db_credential)
     
-    print(f"✅ Updated email credential for user {user_id}")
+    logger.info("Updated email credential", extra={"user_id": user_id})
     return db_credential
 
 
@@ -133,7 +137,7 @@ def delete_email_credential(db: Session, user_id: str) -> bool:
     db.delete(db_credential)
     db.commit()
     
-    print(f"✅ Deleted email credential for user {user_id}")
+    logger.info("Deleted email credential", extra={"user_id": user_id})
     return True
 
 
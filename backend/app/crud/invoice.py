@@ -1,12 +1,26 @@
 """
 CRUD operations for invoices
 """
+import logging
+from contextlib import nullcontext
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import List, Optional
 from datetime import datetime
+from app.core.config import settings
+from app.core.metrics import track_stage
 from app.models.invoice import Invoice, InvoiceStatus
 from app.schemas.invoice import InvoiceCreate, InvoiceUpdate, InvoiceExtractionResponse
+from app.services.invoice_fingerprint import invoice_fingerprint, recent_fingerprints
+from app.services.vendor_templates import TEMPLATE_FIELDS, vendor_template_store
+
+
+logger = logging.getLogger(__name__)
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING against the fingerprint index
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 
 def create_invoice(
@@ -14,7 +28,9 @@ def create_invoice(
     user_id: str,
     invoice_data: InvoiceCreate,
     extraction_result: Optional[InvoiceExtractionResponse] = None,
-    extracted_text: Optional[str] = None
+    extracted_text: Optional[str] = None,
+    commit: bool = True,
+    content_sha256: Optional[str] = None
 ) -> Invoice:
     """
     Create a new invoice in the database
@@ -25,9 +41,14 @@ def create_invoice(
         invoice_data: Basic invoice information
         extraction_result: AI-extracted data from Gemini
         extracted_text: Raw text extracted from the document
+        commit: Commit right away; pass False to only flush (the caller
+            commits a batch of invoices at once)
+        content_sha256: SHA-256 of the file bytes (see find_invoice_by_content)
     
     Returns:
-        Created Invoice object
+        Created Invoice object, or the existing invoice it duplicates (also
+        when a concurrent worker inserts the same invoice first, or when an
+        unextracted upload of the same file is already in progress)
     """
     
     # Extract invoice details for duplicate checking
@@ -35,74 +56,40 @@ def create_invoice(
     vendor_name = extraction_result.vendor_name if extraction_result else invoice_data.vendor_name
     amount_due = extraction_result.amount_due if extraction_result else invoice_data.amount_due
     invoice_date = extraction_result.invoice_date if extraction_result else invoice_data.invoice_date
-    
-    # Strategy 1: Check for exact match on key fields (invoice_id, vendor, amount, date)
-    if invoice_id and vendor_name and amount_due and invoice_date:
-        existing_invoice = db.query(Invoice).filter(
-            Invoice.user_id == user_id,
-            Invoice.invoice_id == invoice_id,
-            Invoice.vendor_name == vendor_name,
-            Invoice.amount_due == amount_due,
-            Invoice.invoice_date == invoice_date
-        ).first()
-        
-        if existing_invoice:
-            print(f"⚠️  Duplicate invoice detected (exact match):")
-            print(f"   Invoice #: {invoice_id} | Vendor: {vendor_name}")
-            print(f"   Amount: {amount_due} | Date: {invoice_date}")
-            print(f"   Existing DB ID: {existing_invoice.id}")
-            print(f"   ⏭️  Skipping creation to prevent duplicate")
-            return existing_invoice  # Return existing invoice instead of creating duplicate
-    
-    # Strategy 2: Check for filename match (same file uploaded twice)
-    if invoice_data.original_filename:
-        existing_by_filename = db.query(Invoice).filter(
-            Invoice.user_id == user_id,
-            Invoice.original_filename == invoice_data.original_filename
-        ).first()
-        
-        if existing_by_filename:
-            # Double-check if it's really the same invoice by comparing amount
-            if amount_due and existing_by_filename.amount_due == amount_due:
-                print(f"⚠️  Duplicate invoice detected (same filename + amount):")
-                print(f"   Filename: {invoice_data.original_filename}")
-                print(f"   Amount: {amount_due}")
-                print(f"   Existing DB ID: {existing_by_filename.id}")
-                print(f"   ⏭️  Skipping creation to prevent duplicate")
-                return existing_by_filename
-    
-    # Strategy 3: Partial match - same vendor, amount, and date (even if invoice_id differs)
-    if vendor_name and amount_due and invoice_date:
-        existing_partial = db.query(Invoice).filter(
-            Invoice.user_id == user_id,
-            Invoice.vendor_name == vendor_name,
-            Invoice.amount_due == amount_due,
-            Invoice.invoice_date == invoice_date
-        ).first()
-        
-        if existing_partial:
-            print(f"⚠️  Likely duplicate invoice detected (vendor + amount + date match):")
-            print(f"   Vendor: {vendor_name} | Amount: {amount_due} | Date: {invoice_date}")
-            print(f"   New invoice #: {invoice_id} | Existing #: {existing_partial.invoice_id}")
-            print(f"   Existing DB ID: {existing_partial.id}")
-            print(f"   ⏭️  Skipping creation to prevent duplicate")
-            return existing_partial
+    fingerprint = invoice_fingerprint(vendor_name, amount_due, invoice_date)
+    
+    with track_stage("dedupe", invoice_data.file_type) as timer:
+        existing_invoice = find_duplicate_invoice(
+            db,
+            user_id=user_id,
+            invoice_id=invoice_id,
+            vendor_name=vendor_name,
+            amount_due=amount_due,
+            invoice_date=invoice_date,
+            original_filename=invoice_data.original_filename
+        )
+        timer.outcome = "duplicate" if existing_invoice else "unique"
+    if existing_invoice:
+        return existing_invoice  # Return existing invoice instead of creating duplicate
     
     # Create invoice with extracted data
-    db_invoice = Invoice(
+    values = dict(
         user_id=user_id,
         # From AI extraction
-        invoice_id=extraction_result.invoice_id if extraction_result else invoice_data.invoice_id,
-        vendor_name=extraction_result.vendor_name if extraction_result else invoice_data.vendor_name,
-        amount_due=extraction_result.amount_due if extraction_result else invoice_data.amount_due,
+        invoice_id=invoice_id,
+        vendor_name=vendor_name,
+        amount_due=amount_due,
         due_date=extraction_result.due_date if extraction_result else invoice_data.due_date,
-        invoice_date=extraction_result.invoice_date if extraction_result else invoice_data.invoice_date,
+        invoice_date=invoice_date,
         currency_code=extraction_result.currency_code if extraction_result else invoice_data.currency_code,
         confidence_score=extraction_result.confidence_score if extraction_result else 0.0,
+        extraction_method=(extraction_result.extraction_method or "gemini") if extraction_result else None,
         # File metadata
         original_filename=invoice_data.original_filename,
         file_size=invoice_data.file_size,
         file_type=invoice_data.file_type,
+        content_sha256=content_sha256,
+        dedupe_fingerprint=fingerprint,
         # Processing data
         status=InvoiceStatus.COMPLETED if extraction_result else InvoiceStatus.PENDING,
         extracted_text=extracted_text,
@@ -111,11 +98,392 @@ def create_invoice(
         notes=invoice_data.notes
     )
     
+    with track_stage("persist", invoice_data.file_type):
+        # A pending row also falls under ux_invoices_user_id_content_sha256_in_progress,
+        # which ON CONFLICT doesn't cover; a savepoint keeps the caller's batch intact
+        in_progress = extraction_result is None and content_sha256 is not None
+        try:
+            with db.begin_nested() if in_progress else nullcontext():
+                db_invoice = _insert_invoice(db, values)
+        except IntegrityError:
+            if not in_progress:
+                raise
+            existing_invoice = find_invoice_by_content(db, user_id, content_sha256, include_in_progress=True)
+            if existing_invoice is None:
+                raise
+            if commit:
+                db.commit()
+            return existing_invoice
+        if db_invoice is None:
+            # Another worker stored the same invoice between our lookup and insert
+            existing_invoice = _find_by_fingerprint(db, user_id, fingerprint)
+            if existing_invoice:
+                _log_duplicate("concurrent insert", existing_invoice, invoice_id, vendor_name, amount_due, invoice_date)
+                recent_fingerprints.remember(user_id, fingerprint, existing_invoice.id)
+                if commit:
+                    db.commit()  # End the transaction the insert attempt opened
+                return existing_invoice
+            raise RuntimeError("Invoice insert conflicted but no matching invoice was found")
+        if commit:
+            db.commit()
+            db.refresh(db_invoice)
+    
+    if fingerprint:
+        recent_fingerprints.remember(user_id, fingerprint, db_invoice.id)
+    logger.info("Created invoice", extra={"invoice_id": db_invoice.id, "user_id": user_id})
+    return db_invoice
+
+
+def find_invoice_by_content(
+    db: Session,
+    user_id: str,
+    content_sha256: str,
+    include_in_progress: bool = False
+) -> Optional[Invoice]:
+    """
+    Find the user's invoice made from a byte-identical file, so a re-upload
+    (or the same attachment in another email) skips extraction entirely
+    
+    Args:
+        db: Database session
+        user_id: ID of the user who owns the invoices
+        content_sha256: SHA-256 hex digest of the file bytes
+        include_in_progress: Also match pending and processing invoices
+            (background uploads of the same file still being extracted)
+    
+    Returns:
+        Existing Invoice or None (failed invoices never match)
+    """
+    statuses = [InvoiceStatus.COMPLETED]
+    if include_in_progress:
+        statuses += [InvoiceStatus.PENDING, InvoiceStatus.PROCESSING]
+    with track_stage("dedupe.content") as timer:
+        # A user has few rows per file, read in created_at order straight off
+        # ix_invoices_user_id_content_sha256_created_at; filtering status here
+        # keeps the planner from sorting them
+        candidates = db.query(Invoice).filter(
+            Invoice.user_id == user_id,
+            Invoice.content_sha256 == content_sha256
+        ).order_by(Invoice.created_at)
+        existing = next((invoice for invoice in candidates if invoice.status in statuses), None)
+        timer.outcome = "duplicate" if existing else "unique"
+    if existing:
+        logger.info(
+            "Known file content, returning the existing invoice",
+            extra={"existing_id": existing.id, "user_id": user_id, "content_sha256": content_sha256[:12]}
+        )
+    return existing
+
+
+def find_duplicate_invoice(
+    db: Session,
+    user_id: str,
+    invoice_id: Optional[str],
+    vendor_name: Optional[str],
+    amount_due: Optional[float],
+    invoice_date: Optional[str],
+    original_filename: Optional[str],
+    exclude_id: Optional[str] = None
+) -> Optional[Invoice]:
+    """
+    Find an existing invoice that the given extraction duplicates
+    
+    Args:
+        db: Database session
+        user_id: ID of the user who owns the invoices
+        invoice_id: Extracted invoice number
+        vendor_name: Extracted vendor name
+        amount_due: Extracted amount
+        invoice_date: Extracted invoice date
+        original_filename: Uploaded file name
+        exclude_id: Invoice row to ignore (the pending row being completed)
+    
+    Returns:
+        Existing Invoice or None
+    """
+    
+    fingerprint = invoice_fingerprint(vendor_name, amount_due, invoice_date)
+    if fingerprint:
+        existing_invoice = _recent_duplicate(db, user_id, fingerprint, exclude_id)
+        if existing_invoice:
+            _log_duplicate("recent fingerprint", existing_invoice, invoice_id, vendor_name, amount_due, invoice_date)
+            return existing_invoice
+    
+    # Index point lookups, no sorting: same normalized vendor + amount + date
+    # (which also covers an exact invoice number match), then the same file
+    # name and amount
+    if fingerprint:
+        existing_invoice = _excluding(db.query(Invoice).filter(
+            Invoice.user_id == user_id,
+            Invoice.dedupe_fingerprint == fingerprint
+        ), exclude_id).first()
+        if existing_invoice:
+            _log_duplicate("vendor + amount + date", existing_invoice, invoice_id, vendor_name, amount_due, invoice_date)
+            recent_fingerprints.remember(user_id, fingerprint, existing_invoice.id)
+            return existing_invoice
+    
+    if not (original_filename and amount_due):
+        return None
+    existing_invoice = _excluding(db.query(Invoice).filter(
+        Invoice.user_id == user_id,
+        Invoice.original_filename == original_filename,
+        Invoice.amount_due == amount_due
+    ), exclude_id).first()
+    if existing_invoice:
+        _log_duplicate("same filename + amount", existing_invoice, invoice_id, vendor_name, amount_due,
+                       invoice_date, original_filename=original_filename)
+    return existing_invoice
+
+
+def _recent_duplicate(db: Session, user_id: str, fingerprint: str, exclude_id: Optional[str]) -> Optional[Invoice]:
+    """The invoice a cached fingerprint points to, if it still has that fingerprint"""
+    cached_id = recent_fingerprints.get(user_id, fingerprint)
+    if cached_id is None or cached_id == exclude_id:
+        return None
+    existing_invoice = db.get(Invoice, cached_id)
+    if existing_invoice is None or existing_invoice.user_id != user_id or existing_invoice.dedupe_fingerprint != fingerprint:
+        recent_fingerprints.forget(user_id, fingerprint)  # Deleted, edited or rolled back since
+        return None
+    return existing_invoice
+
+
+def _find_by_fingerprint(db: Session, user_id: str, fingerprint: Optional[str]) -> Optional[Invoice]:
+    if not fingerprint:
+        return None
+    return db.query(Invoice).filter(
+        Invoice.user_id == user_id,
+        Invoice.dedupe_fingerprint == fingerprint
+    ).first()
+
+
+def _insert_invoice(db: Session, values: dict) -> Optional[Invoice]:
+    """
+    Insert an invoice row, doing nothing if the user already has one with its
+    fingerprint (INSERT ... ON CONFLICT DO NOTHING on PostgreSQL and SQLite)
+    
+    Returns:
+        The new Invoice (flushed, not committed) or None on a fingerprint conflict
+    """
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is None:
+        # The unique index still rejects a concurrent duplicate, as an IntegrityError
+        db_invoice = Invoice(**values)
+        db.add(db_invoice)
+        db.flush()
+        return db_invoice
+    
+    statement = insert(Invoice).values(**values).on_conflict_do_nothing(
+        index_elements=[Invoice.user_id, Invoice.dedupe_fingerprint],
+        index_where=Invoice.dedupe_fingerprint.isnot(None)
+    ).returning(Invoice)
+    return db.scalars(statement).first()
+
+
+def _log_duplicate(match: str, existing: Invoice, invoice_id, vendor_name, amount_due, invoice_date, **fields) -> None:
+    logger.info(
+        "Duplicate invoice detected (%s), skipping creation",
+        match,
+        extra={
+            "existing_id": existing.id,
+            "invoice_number": invoice_id,
+            "existing_invoice_number": existing.invoice_id,
+            "vendor_name": vendor_name,
+            "amount_due": amount_due,
+            "invoice_date": invoice_date,
+            **fields
+        }
+    )
+
+
+def _excluding(query, exclude_id: Optional[str]):
+    return query.filter(Invoice.id != exclude_id) if exclude_id else query
+
+
+def create_pending_invoice(
+    db: Session,
+    user_id: str,
+    invoice_data: InvoiceCreate,
+    file_path: Optional[str] = None,
+    content_sha256: Optional[str] = None
+) -> Optional[Invoice]:
+    """
+    Create an invoice row for an upload whose extraction runs in the background
+    
+    Args:
+        db: Database session
+        user_id: ID of the user who uploaded the invoice
+        invoice_data: Basic invoice information
+        file_path: Where the uploaded file is stored
+        content_sha256: SHA-256 of the file bytes
+    
+    Returns:
+        Created Invoice object in PENDING status, or None if the user's
+        upload of the same file is already pending or processing
+    """
+    db_invoice = Invoice(
+        user_id=user_id,
+        original_filename=invoice_data.original_filename,
+        file_size=invoice_data.file_size,
+        file_type=invoice_data.file_type,
+        file_path=file_path,
+        content_sha256=content_sha256,
+        status=InvoiceStatus.PENDING,
+        notes=invoice_data.notes
+    )
+    
     db.add(db_invoice)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost the race against a concurrent upload of the same bytes
+        # (ux_invoices_user_id_content_sha256_in_progress)
+        db.rollback()
+        return None
+    db.refresh(db_invoice)
+    
+    logger.info("Created pending invoice", extra={"invoice_id": db_invoice.id, "user_id": user_id})
+    return db_invoice
+
+
+def mark_invoice_processing(db: Session, invoice_id: str) -> Optional[Invoice]:
+    """
+    Move a pending invoice to PROCESSING
+    
+    Args:
+        db: Database session
+        invoice_id: Invoice ID
+    
+    Returns:
+        Updated Invoice or None if not found
+    """
+    db_invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    
+    if not db_invoice:
+        return None
+    
+    db_invoice.status = InvoiceStatus.PROCESSING
+    db_invoice.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_invoice)
+    return db_invoice
+
+
+def get_stale_invoices(db: Session, stale_before: datetime) -> List[Invoice]:
+    """
+    Pending and processing invoices that haven't changed since stale_before
+    (their background job was lost, e.g. to a worker restart)
+    
+    Args:
+        db: Database session
+        stale_before: Cutoff for updated_at
+    
+    Returns:
+        List of Invoice objects, oldest first
+    """
+    return db.query(Invoice).filter(
+        Invoice.status.in_([InvoiceStatus.PENDING, InvoiceStatus.PROCESSING]),
+        Invoice.updated_at < stale_before
+    ).order_by(Invoice.updated_at).all()
+
+
+def claim_stale_invoice(db: Session, db_invoice: Invoice, file_path: Optional[str] = None) -> bool:
+    """
+    Reset a stale invoice to PENDING unless it changed since it was read,
+    so only one worker process picks it up
+    
+    Args:
+        db: Database session
+        db_invoice: Stale pending or processing invoice
+        file_path: New stored file to process instead of the old one
+    
+    Returns:
+        True if this session claimed the invoice
+    """
+    values = {Invoice.status: InvoiceStatus.PENDING, Invoice.updated_at: datetime.utcnow()}
+    if file_path is not None:
+        values[Invoice.file_path] = file_path
+    claimed = db.query(Invoice).filter(
+        Invoice.id == db_invoice.id,
+        Invoice.status == db_invoice.status,
+        Invoice.updated_at == db_invoice.updated_at
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def complete_invoice(
+    db: Session,
+    invoice_id: str,
+    extraction_result: InvoiceExtractionResponse,
+    extracted_text: Optional[str] = None
+) -> Optional[Invoice]:
+    """
+    Store the extraction for a background-processed invoice and mark it COMPLETED.
+    If the extraction duplicates an existing invoice, the row is marked FAILED
+    and points at the original instead.
+    
+    Args:
+        db: Database session
+        invoice_id: Invoice ID
+        extraction_result: AI-extracted data from Gemini
+        extracted_text: Raw text extracted from the document
+    
+    Returns:
+        Updated Invoice or None if not found
+    """
+    db_invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    
+    if not db_invoice:
+        return None
     
-    print(f"--- ✅ Created invoice {db_invoice.id} for user {user_id} ---")
+    with track_stage("dedupe", db_invoice.file_type) as timer:
+        existing_invoice = find_duplicate_invoice(
+            db,
+            user_id=db_invoice.user_id,
+            invoice_id=extraction_result.invoice_id,
+            vendor_name=extraction_result.vendor_name,
+            amount_due=extraction_result.amount_due,
+            invoice_date=extraction_result.invoice_date,
+            original_filename=db_invoice.original_filename,
+            exclude_id=db_invoice.id
+        )
+        timer.outcome = "duplicate" if existing_invoice else "unique"
+    if existing_invoice:
+        return mark_invoice_failed(db, invoice_id, f"Duplicate of invoice {existing_invoice.id}")
+    
+    fingerprint = invoice_fingerprint(
+        extraction_result.vendor_name, extraction_result.amount_due, extraction_result.invoice_date
+    )
+    db_invoice.invoice_id = extraction_result.invoice_id
+    db_invoice.vendor_name = extraction_result.vendor_name
+    db_invoice.amount_due = extraction_result.amount_due
+    db_invoice.due_date = extraction_result.due_date
+    db_invoice.invoice_date = extraction_result.invoice_date
+    db_invoice.currency_code = extraction_result.currency_code
+    db_invoice.confidence_score = extraction_result.confidence_score
+    db_invoice.extraction_method = extraction_result.extraction_method or "gemini"
+    db_invoice.extracted_text = extracted_text
+    db_invoice.status = InvoiceStatus.COMPLETED
+    db_invoice.processing_error = None
+    db_invoice.processed_at = datetime.utcnow()
+    db_invoice.updated_at = datetime.utcnow()
+    db_invoice.dedupe_fingerprint = fingerprint
+    
+    with track_stage("persist", db_invoice.file_type):
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker completed the same invoice since the duplicate check
+            db.rollback()
+            existing_invoice = _find_by_fingerprint(db, db_invoice.user_id, fingerprint)
+            if existing_invoice is None:
+                raise
+            return mark_invoice_failed(db, invoice_id, f"Duplicate of invoice {existing_invoice.id}")
+        db.refresh(db_invoice)
+    
+    if fingerprint:
+        recent_fingerprints.remember(db_invoice.user_id, fingerprint, db_invoice.id)
+    logger.info("Completed invoice", extra={"invoice_id": invoice_id})
     return db_invoice
 
 
@@ -185,6 +553,9 @@ def update_invoice(
 ) -> Optional[Invoice]:
     """
     Update an invoice
+    The saved field values count as confirmed: they (re)train the vendor
+    template for the invoice's layout, and a correction to a templated
+    extraction invalidates that template first.
     
     Args:
         db: Database session
@@ -203,18 +574,57 @@ def update_invoice(
     
     # Update fields
     update_data = invoice_update.model_dump(exclude_unset=True)
+    corrected = [
+        field for field in TEMPLATE_FIELDS
+        if field in update_data and update_data[field] != getattr(db_invoice, field)
+    ]
     for field, value in update_data.items():
         setattr(db_invoice, field, value)
     
+    if {"vendor_name", "amount_due", "invoice_date"} & update_data.keys():
+        _refingerprint(db, db_invoice)
+    
+    if corrected and db_invoice.extraction_method == "template":
+        vendor_template_store.invalidate(db, user_id, db_invoice.extracted_text)
+    if corrected:
+        db_invoice.extraction_method = "manual"
+    
     db_invoice.updated_at = datetime.utcnow()
     
     db.commit()
     db.refresh(db_invoice)
     
-    print(f"--- ✅ Updated invoice {invoice_id} ---")
+    logger.info("Updated invoice", extra={"invoice_id": invoice_id})
+    
+    if settings.VENDOR_TEMPLATES_ENABLED and db_invoice.status == InvoiceStatus.COMPLETED:
+        try:
+            vendor_template_store.learn(db, db_invoice)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Could not learn vendor template: %s", e, extra={"invoice_id": invoice_id})
+    
     return db_invoice
 
 
+def _refingerprint(db: Session, db_invoice: Invoice) -> None:
+    """
+    Recompute an edited invoice's fingerprint. If the edit makes it match
+    another invoice, the user has confirmed they are different invoices, so
+    this one is left without a fingerprint rather than rejected.
+    """
+    if db_invoice.dedupe_fingerprint:
+        recent_fingerprints.forget(db_invoice.user_id, db_invoice.dedupe_fingerprint)
+    fingerprint = invoice_fingerprint(db_invoice.vendor_name, db_invoice.amount_due, db_invoice.invoice_date)
+    if fingerprint:
+        other = _excluding(db.query(Invoice.id).filter(
+            Invoice.user_id == db_invoice.user_id,
+            Invoice.dedupe_fingerprint == fingerprint
+        ), db_invoice.id).first()
+        if other:
+            fingerprint = None
+    db_invoice.dedupe_fingerprint = fingerprint
+
+
 def delete_invoice(db: Session, invoice_id: str, user_id: str) -> bool:
     """
     Delete an invoice
@@ -233,10 +643,12 @@ def delete_invoice(db: Session, invoice_id: str, user_id: str) -> bool:
     if not db_invoice:
         return False
     
+    if db_invoice.dedupe_fingerprint:
+        recent_fingerprints.forget(user_id, db_invoice.dedupe_fingerprint)
     db.delete(db_invoice)
     db.commit()
     
-    print(f"--- ✅ Deleted invoice {invoice_id} ---")
+    logger.info("Deleted invoice", extra={"invoice_id": invoice_id})
     return True
 
 
@@ -269,7 +681,7 @@ def mark_invoice_failed(
     db.commit()
     db.refresh(db_invoice)
     
-    print(f"--- ⚠️ Marked invoice {invoice_id} as failed: {error_message} ---")
+    logger.warning("Marked invoice as failed: %s", error_message, extra={"invoice_id": invoice_id})
     return db_invoice
 
 
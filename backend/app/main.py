@@ -1,13 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
+import time
 
 from app.core.config import settings, BACKEND_CORS_ORIGINS
+from app.core.logging import setup_logging
+from app.core.metrics import HTTP_IN_PROGRESS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, render_metrics
 from app.api.v1.api import api_router
 from app.db.session import engine
 from app.db.base import Base
 from app.workers import start_background_polling, stop_background_polling
+from app.services.document_engine import document_engine
+from app.services.extraction_gateway import extraction_gateway
+from app.services.invoice_jobs import resume_stale_jobs
+from app.services.upload_intake import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware
+
+setup_logging()
 
 # Create tables
 Base.metadata.create_all(bind=engine)
@@ -24,10 +33,19 @@ async def lifespan(app: FastAPI):
     # Startup: No automatic polling
     # polling_task = asyncio.create_task(start_background_polling())
     
+    # Startup: Spawn document engine workers so the first upload is warm
+    await asyncio.to_thread(document_engine.start)
+    
+    # Startup: Requeue async uploads whose background job died with a previous process
+    resume_task = asyncio.create_task(resume_stale_jobs()) if settings.INVOICE_JOB_STALE_SECONDS > 0 else None
+    
     yield
     
     # Shutdown: Stop any running polling workers
+    if resume_task is not None:
+        resume_task.cancel()
     stop_background_polling()
+    document_engine.shutdown()
     # polling_task.cancel()
     # try:
     #     await polling_task
@@ -41,6 +59,24 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Reject oversized single-file uploads before their body is parsed
+# (added first so CORS wraps its 413 responses)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=[
+        f"{settings.API_V1_PREFIX}/invoices/upload",
+        f"{settings.API_V1_PREFIX}/invoices/upload/async",
+    ],
+    max_body_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+)
+# Bulk uploads carry many files, so their cap is on the whole body
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=[f"{settings.API_V1_PREFIX}/invoices/upload/bulk"],
+    max_body_bytes=settings.BULK_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+    subject="Upload"
+)
+
 # Set up CORS
 app.add_middleware(
     CORSMiddleware,
@@ -54,6 +90,32 @@ app.add_middleware(
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Count and time every request, labeled by route template (not the raw
+    path, so invoice ids don't explode label cardinality)
+    """
+    method = request.method
+    started = time.perf_counter()
+    status_code = 500
+    HTTP_IN_PROGRESS.labels(method=method).inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        HTTP_IN_PROGRESS.labels(method=method).dec()
+        route = request.scope.get("route")
+        labels = {
+            "method": method,
+            "route": getattr(route, "path", "unmatched"),
+            "status": str(status_code)
+        }
+        HTTP_REQUESTS.labels(**labels).inc()
+        HTTP_REQUEST_SECONDS.labels(**labels).observe(time.perf_counter() - started)
+
+
 @app.get("/")
 async def root():
     return {
@@ -65,4 +127,11 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "extraction_gateway": extraction_gateway.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,7 +1,7 @@
 """
 Email credentials model for storing encrypted OAuth tokens and IMAP settings
 """
-from sqlalchemy import Column, String, Text, Boolean, Integer, DateTime
+from sqlalchemy import Column, String, Text, Boolean, Integer, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -83,5 +83,11 @@ class EmailProcessingLog(Base):
     # Timestamp
     processed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
+    __table_args__ = (
+        # Processing log (newest first) and the already-processed check when polling
+        Index("ix_email_processing_logs_user_id_processed_at", "user_id", "processed_at"),
+        Index("ix_email_processing_logs_user_id_message_id_status", "user_id", "email_message_id", "status"),
+    )
+    
     def __repr__(self):
         return f"<EmailProcessingLog {self.email_subject} - {self.status}>"
@@ -1,7 +1,7 @@
 """
 Invoice database models for storing extracted invoice data
 """
-from sqlalchemy import Column, String, Float, Integer, DateTime, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, String, Float, Integer, DateTime, Text, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -37,13 +37,19 @@ class Invoice(Base):
     invoice_date = Column(String, nullable=True)  # Stored as YYYY-MM-DD string
     currency_code = Column(String(3), nullable=True, default="USD")
     confidence_score = Column(Float, nullable=True, default=0.0)
+    extraction_method = Column(String(20), nullable=True)  # gemini, local, template, manual
     
     # File metadata
     original_filename = Column(String, nullable=False)
     file_size = Column(Integer, nullable=True)  # Size in bytes
     file_type = Column(String, nullable=True)  # pdf, jpg, png, etc.
     file_path = Column(String, nullable=True)  # Storage path if files are saved
-    
+    content_sha256 = Column(String(64), nullable=True)  # Hash of the file bytes (re-uploads skip extraction)
+
+    # Duplicate detection: hash of normalized vendor, amount and date (see services/invoice_fingerprint.py),
+    # unique per user; set once all three are known
+    dedupe_fingerprint = Column(String(64), nullable=True)
+
     # Processing status
     status = Column(SQLEnum(InvoiceStatus), nullable=False, default=InvoiceStatus.PENDING)
     processing_error = Column(Text, nullable=True)
@@ -63,6 +69,30 @@ class Invoice(Base):
     user = relationship("User", back_populates="invoices")
     items = relationship("InvoiceItem", back_populates="invoice", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Re-upload lookup, oldest match first
+        Index("ix_invoices_user_id_content_sha256_created_at", "user_id", "content_sha256", "created_at"),
+        # At most one pending/processing invoice per user and file, so concurrent
+        # async uploads of the same bytes can't both start a job
+        Index(
+            "ux_invoices_user_id_content_sha256_in_progress", "user_id", "content_sha256",
+            unique=True,
+            postgresql_where=status.in_([InvoiceStatus.PENDING, InvoiceStatus.PROCESSING]),
+            sqlite_where=status.in_([InvoiceStatus.PENDING, InvoiceStatus.PROCESSING])
+        ),
+        Index(
+            "ux_invoices_user_id_dedupe_fingerprint", "user_id", "dedupe_fingerprint",
+            unique=True,
+            postgresql_where=dedupe_fingerprint.isnot(None),
+            sqlite_where=dedupe_fingerprint.isnot(None)
+        ),
+        Index("ix_invoices_user_id_original_filename", "user_id", "original_filename"),
+        # Invoice list (newest first), optionally filtered by status, and the status counts/totals
+        Index("ix_invoices_user_id_created_at", "user_id", "created_at"),
+        Index("ix_invoices_user_id_status_created_at", "user_id", "status", "created_at",
+              postgresql_include=["amount_due"]),
+    )
+    
     def __repr__(self):
         return f"<Invoice {self.invoice_id} - {self.vendor_name}>"
 
@@ -0,0 +1,43 @@
+"""
+Vendor template model for learned per-vendor extraction layouts
+"""
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Index
+from datetime import datetime
+import uuid
+from app.db.base import Base
+
+
+class VendorTemplate(Base):
+    """
+    Where each invoice field appears in one vendor's PDF layout, learned from
+    an invoice the user confirmed or corrected
+    """
+    __tablename__ = "vendor_templates"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Hash of the layout's stable (digit-free) header lines
+    fingerprint = Column(String(64), nullable=False)
+    vendor_name = Column(String, nullable=True)
+
+    # JSON list of field rules (anchor line, offset, occurrence, value kind)
+    field_rules = Column(Text, nullable=False)
+
+    # Invoice the template was learned from
+    source_invoice_id = Column(String, ForeignKey("invoices.id", ondelete="SET NULL"), nullable=True)
+
+    # Usage (drives LRU eviction)
+    hit_count = Column(Integer, nullable=False, default=0)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Timestamps
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_vendor_templates_user_id_fingerprint", "user_id", "fingerprint", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<VendorTemplate {self.vendor_name} ({self.fingerprint[:8]})>"
@@ -28,6 +28,7 @@ class InvoiceExtractionResponse(BaseModel):
     invoice_date: Optional[str] = None  # YYYY-MM-DD format
     currency_code: Optional[str] = "USD"
     confidence_score: float = 0.0
+    extraction_method: Optional[str] = None  # Set for non-Gemini extractions: "local", "template"
     
     class Config:
         json_schema_extra = {
@@ -110,6 +111,7 @@ class Invoice(InvoiceBase):
     status: InvoiceStatus
     processing_error: Optional[str] = None
     extracted_text: Optional[str] = None
+    extraction_method: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     processed_at: Optional[datetime] = None
@@ -152,3 +154,30 @@ class InvoiceUploadResponse(BaseModel):
     message: str
     invoice: Invoice
     extraction_data: InvoiceExtractionResponse
+
+
+class InvoiceJobResponse(BaseModel):
+    """Status of an invoice uploaded for background processing"""
+    message: str
+    invoice_id: str  # Database ID of the invoice row
+    status: InvoiceStatus
+    processing_error: Optional[str] = None
+    invoice: Optional[Invoice] = None  # Set once processing has completed
+
+
+class BulkUploadItemResult(BaseModel):
+    """Outcome for one file of a bulk upload"""
+    filename: str
+    status: str  # created, duplicate or failed
+    invoice_id: Optional[str] = None  # New invoice, or the existing one for duplicates
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    """Response after a bulk upload"""
+    batch_id: str
+    total: int
+    created: int
+    duplicates: int
+    failed: int
+    results: List[BulkUploadItemResult]
@@ -0,0 +1,256 @@
+"""
+Bulk invoice ingestion for many files or ZIP archives
+Files are read one at a time as extraction slots free up (ZIP members are
+decompressed only when their turn comes), extracted in parallel under a
+concurrency limit, and persisted with batched commits.
+"""
+import asyncio
+import logging
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import Awaitable, Callable, List, Optional
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud.invoice import create_invoice, find_invoice_by_content
+from app.schemas.invoice import BulkUploadItemResult, BulkUploadResponse, InvoiceCreate
+from app.services.invoice_processing import process_invoice_document_async
+from app.services.upload_intake import MAX_UPLOAD_BYTES, content_sha256, sniff_content_type, stored_file_type
+
+logger = logging.getLogger(__name__)
+
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed", "application/x-zip"}
+
+# Supported invoice files by extension (ZIP members carry no MIME type)
+CONTENT_TYPES_BY_EXTENSION = {
+    ".pdf": "application/pdf",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+MAX_FILE_SIZE = MAX_UPLOAD_BYTES  # Same limit as single uploads
+
+
+class BulkUploadItem:
+    """One invoice file from a bulk upload, read lazily"""
+
+    def __init__(
+        self,
+        filename: str,
+        content_type: Optional[str],
+        read: Callable[[], Awaitable[bytes]],
+        size: Optional[int] = None
+    ):
+        """
+        Args:
+            filename: Name shown in results (archive members include their path)
+            content_type: MIME type, or None if unsupported
+            read: Coroutine function returning the file bytes
+            size: Declared size if known up front
+        """
+        self.filename = filename
+        self.content_type = content_type
+        self.read = read
+        self.size = size
+
+
+def _is_zip(upload: UploadFile) -> bool:
+    return upload.content_type in ZIP_CONTENT_TYPES or (upload.filename or "").lower().endswith(".zip")
+
+
+def _content_type_for(filename: str) -> Optional[str]:
+    return CONTENT_TYPES_BY_EXTENSION.get(PurePosixPath(filename).suffix.lower())
+
+
+def _zip_items(upload: UploadFile, archive: zipfile.ZipFile, read_lock: asyncio.Lock) -> List[BulkUploadItem]:
+    """List an archive's invoice members without decompressing them"""
+    items = []
+    for info in archive.infolist():
+        path = PurePosixPath(info.filename)
+        if info.is_dir() or path.name.startswith(".") or "__MACOSX" in path.parts:
+            continue
+
+        async def read(info: zipfile.ZipInfo = info) -> bytes:
+            # ZipFile shares one file handle, so members are read one at a time
+            async with read_lock:
+                return await asyncio.to_thread(_read_member, archive, info)
+
+        items.append(BulkUploadItem(
+            filename=f"{upload.filename}/{info.filename}",
+            content_type=_content_type_for(info.filename),
+            read=read,
+            size=info.file_size
+        ))
+    return items
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    # Don't trust the declared size: stop reading one byte past the limit
+    with archive.open(info) as member:
+        return member.read(MAX_FILE_SIZE + 1)
+
+
+def collect_items(uploads: List[UploadFile]) -> List[BulkUploadItem]:
+    """
+    Expand uploaded files and ZIP archives into invoice items
+
+    Args:
+        uploads: Files from the multipart request
+
+    Returns:
+        Items in upload order (archive members in archive order)
+
+    Raises:
+        HTTPException: 400 for unreadable archives or too many files
+    """
+    items: List[BulkUploadItem] = []
+    for upload in uploads:
+        if _is_zip(upload):
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid ZIP archive")
+            items.extend(_zip_items(upload, archive, asyncio.Lock()))
+        else:
+            content_type = upload.content_type if upload.content_type in CONTENT_TYPES_BY_EXTENSION.values() \
+                else _content_type_for(upload.filename or "")
+            items.append(BulkUploadItem(upload.filename or "upload", content_type, upload.read, upload.size))
+
+    if len(items) > settings.BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bulk upload contains {len(items)} files; the limit is {settings.BULK_UPLOAD_MAX_FILES}"
+        )
+    return items
+
+
+async def ingest_bulk_upload(db: Session, user_id: str, uploads: List[UploadFile]) -> BulkUploadResponse:
+    """
+    Extract and store every invoice in a bulk upload
+
+    Args:
+        db: Database session
+        user_id: Owner of the invoices
+        uploads: Files and/or ZIP archives from the request
+
+    Returns:
+        BulkUploadResponse with one result per invoice file
+    """
+    batch_id = str(uuid.uuid4())
+    started_at = datetime.utcnow()
+    items = collect_items(uploads)
+    logger.info("Bulk upload %s: %d file(s) from %d upload(s)", batch_id, len(items), len(uploads))
+
+    semaphore = asyncio.Semaphore(settings.BULK_UPLOAD_CONCURRENCY)
+    uncommitted: List[BulkUploadItemResult] = []
+    seen_invoice_ids = set()
+
+    def commit_pending() -> None:
+        if not uncommitted:
+            return
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Bulk upload %s: commit failed: %s", batch_id, e)
+            for result in uncommitted:
+                result.status = "failed"
+                result.invoice_id = None
+                result.error = f"Database error: {e}"
+        uncommitted.clear()
+
+    async def process(item: BulkUploadItem) -> BulkUploadItemResult:
+        result = BulkUploadItemResult(filename=item.filename, status="failed")
+        if item.content_type is None:
+            result.error = "Unsupported file type. Please upload PDF, JPG, or PNG."
+            return result
+        if item.size is not None and item.size > MAX_FILE_SIZE:
+            result.error = "File exceeds maximum allowed size (10MB)"
+            return result
+
+        async with semaphore:
+            try:
+                file_contents = await item.read()
+                if len(file_contents) > MAX_FILE_SIZE:
+                    result.error = "File exceeds maximum allowed size (10MB)"
+                    return result
+                # Trust the file's magic bytes, not its name or declared type
+                content_type = sniff_content_type(file_contents[:1024])
+                if content_type is None:
+                    result.error = "File content is not a supported type. Please upload PDF, JPG, or PNG."
+                    return result
+                file_hash = content_sha256(file_contents)
+                existing_invoice = find_invoice_by_content(db, user_id, file_hash)
+                if existing_invoice:
+                    result.status = "duplicate"
+                    result.invoice_id = existing_invoice.id
+                    return result
+                processing_result = await process_invoice_document_async(
+                    file_contents, content_type, user_id, file_sha256=file_hash
+                )
+            except HTTPException as e:
+                result.error = str(e.detail)
+                return result
+            except Exception as e:
+                result.error = f"Error processing invoice: {e}"
+                return result
+
+        # No awaits from here on, so concurrent tasks never interleave on the session
+        try:
+            db_invoice = create_invoice(
+                db=db,
+                user_id=user_id,
+                invoice_data=InvoiceCreate(
+                    original_filename=PurePosixPath(item.filename).name,
+                    file_size=len(file_contents),
+                    file_type=stored_file_type(content_type)
+                ),
+                extraction_result=processing_result.extraction,
+                extracted_text=processing_result.extracted_text,
+                commit=False,
+                content_sha256=file_hash
+            )
+        except Exception as e:
+            db.rollback()
+            for pending in uncommitted:
+                pending.status = "failed"
+                pending.invoice_id = None
+                pending.error = f"Database error: {e}"
+            uncommitted.clear()
+            result.error = f"Database error: {e}"
+            return result
+
+        result.invoice_id = db_invoice.id
+        if db_invoice.id in seen_invoice_ids or db_invoice.created_at < started_at:
+            result.status = "duplicate"
+            return result
+
+        seen_invoice_ids.add(db_invoice.id)
+        result.status = "created"
+        uncommitted.append(result)
+        if len(uncommitted) >= settings.BULK_UPLOAD_COMMIT_BATCH_SIZE:
+            commit_pending()
+        return result
+
+    try:
+        results = await asyncio.gather(*(process(item) for item in items))
+    finally:
+        commit_pending()
+
+    created = sum(1 for result in results if result.status == "created")
+    duplicates = sum(1 for result in results if result.status == "duplicate")
+    failed = len(results) - created - duplicates
+    logger.info("Bulk upload %s: %d created, %d duplicate(s), %d failed", batch_id, created, duplicates, failed)
+
+    return BulkUploadResponse(
+        batch_id=batch_id,
+        total=len(results),
+        created=created,
+        duplicates=duplicates,
+        failed=failed,
+        results=results
+    )
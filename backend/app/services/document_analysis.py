@@ -0,0 +1,327 @@
+"""
+Single-pass document analysis for invoice files
+Opens a PDF once and keeps its text, per-page stats and (lazily) page images
+so the extraction and persistence steps don't re-parse the same bytes.
+Parsing and rendering run on the document engine's worker processes.
+"""
+import logging
+from typing import List, Optional
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.metrics import track_stage
+from app.services import document_tasks
+from app.services.document_engine import document_engine
+from app.services.image_preparation import ImagePreparationOptions, PreparedImage, summarize
+from app.services.page_selection import PageSelectionOptions
+
+logger = logging.getLogger(__name__)
+
+
+# A PDF with at least this much text is treated as having a text layer
+MIN_TEXT_CHARS = 50
+
+# Within such a PDF, a page with fewer non-whitespace characters that holds
+# an image is treated as scanned (sent as an image alongside the text)
+MIN_PAGE_TEXT_CHARS = 30
+
+
+def image_options() -> ImagePreparationOptions:
+    """Image preparation options from settings"""
+    return ImagePreparationOptions(
+        pixel_budget=settings.IMAGE_PIXEL_BUDGET,
+        max_dpi=settings.IMAGE_MAX_DPI,
+        min_dpi=settings.IMAGE_MIN_DPI,
+        max_long_edge=settings.IMAGE_MAX_LONG_EDGE,
+        image_format=settings.IMAGE_FORMAT,
+        quality=settings.IMAGE_QUALITY,
+        detect_grayscale=settings.IMAGE_DETECT_GRAYSCALE,
+        auto_crop=settings.IMAGE_AUTO_CROP,
+        embedded_passthrough=settings.IMAGE_EMBEDDED_PASSTHROUGH
+    )
+
+
+def page_selection_options() -> PageSelectionOptions:
+    """Page selection options from settings"""
+    return PageSelectionOptions(
+        max_pages=settings.IMAGE_MAX_PAGES,
+        prefer_first=settings.IMAGE_PREFER_FIRST_PAGE,
+        prefer_last=settings.IMAGE_PREFER_LAST_PAGE
+    )
+
+
+def _pdf_submission_mode() -> str:
+    """
+    How scanned PDFs are sent to the model (PDF_SUBMISSION_MODE)
+
+    Raises:
+        ValueError: If the setting names an unknown mode
+    """
+    mode = settings.PDF_SUBMISSION_MODE.strip().lower()
+    if mode not in document_tasks.PDF_SUBMISSION_MODES:
+        raise ValueError(
+            f"Unknown PDF_SUBMISSION_MODE '{settings.PDF_SUBMISSION_MODE}'. "
+            f"Choose one of: {', '.join(document_tasks.PDF_SUBMISSION_MODES)}"
+        )
+    return mode
+
+
+def _min_page_chars() -> int:
+    """Per-page text threshold for page classification (0 = route whole documents)"""
+    return MIN_PAGE_TEXT_CHARS if settings.PDF_PAGE_ROUTING_ENABLED else 0
+
+
+def is_pdf(content_type: str) -> bool:
+    """Check whether a MIME type denotes a PDF"""
+    return content_type == "application/pdf" or content_type.endswith("/pdf")
+
+
+class DocumentAnalysis:
+    """
+    Everything we learn from one pass over an invoice file
+
+    - text / page_texts: PDF text layer ("" for images)
+    - page_count and per-page text density (non-whitespace chars per page)
+    - images: encoded page images, prepared on first access only (scanned
+      PDFs are prepared during the analysis pass itself, while the PDF is open)
+    - selected_pages: zero-based indices of the PDF pages behind images
+      (long scans are trimmed to the pages most likely to hold totals)
+    - page_kinds: text / scanned / blank per page of a text-layer PDF; a
+      mixed PDF (typed pages plus scanned ones) is extracted from the text
+      of its text pages and images of its scanned pages only
+    - native_pdf: for scanned PDFs in native (or auto) PDF submission mode,
+      the PDF trimmed to its selected pages, sent instead of page images
+    """
+
+    def __init__(
+        self,
+        file_contents: bytes,
+        content_type: str,
+        page_texts: List[str],
+        rendered_pages: Optional[document_tasks.PreparedPages] = None,
+        page_kinds: Optional[List[str]] = None,
+        native_pdf: Optional[document_tasks.NativePdf] = None
+    ):
+        """
+        Initialize a document analysis (use analyze_document() instead)
+
+        Args:
+            file_contents: Raw file bytes
+            content_type: MIME type of the file
+            page_texts: Text extracted from each page
+            rendered_pages: (page indices, images) already prepared during analysis
+            page_kinds: Kind of each page (None if pages were not classified)
+            native_pdf: Trimmed PDF to send instead of page images
+        """
+        self.file_contents = file_contents
+        self.content_type = content_type
+        self.page_texts = page_texts
+        self.page_count = len(page_texts)
+        self.page_text_density = [len("".join(t.split())) for t in page_texts]
+        self.page_kinds = page_kinds
+        self.native_pdf = native_pdf
+        self._rendered_pages = rendered_pages
+        self._images: Optional[List[PreparedImage]] = None
+        self.selected_pages: Optional[List[int]] = None
+
+    @property
+    def is_pdf(self) -> bool:
+        return is_pdf(self.content_type)
+
+    @property
+    def text(self) -> str:
+        """Full text layer, all pages concatenated"""
+        return "".join(self.page_texts)
+
+    @property
+    def has_text_layer(self) -> bool:
+        """True if the document has enough text to skip image extraction"""
+        return len(self.text.strip()) > MIN_TEXT_CHARS
+
+    @property
+    def scanned_pages(self) -> List[int]:
+        """Zero-based indices of the scanned pages of a classified text-layer PDF"""
+        if not self.page_kinds:
+            return []
+        return [index for index, kind in enumerate(self.page_kinds) if kind == document_tasks.SCANNED_PAGE]
+
+    @property
+    def is_mixed(self) -> bool:
+        """True for a text-layer PDF that also has scanned pages"""
+        return self.is_pdf and self.has_text_layer and bool(self.scanned_pages)
+
+    @property
+    def text_page_texts(self) -> List[str]:
+        """Page texts with scanned pages left empty (their images stand in for them)"""
+        scanned = set(self.scanned_pages)
+        return ["" if index in scanned else text for index, text in enumerate(self.page_texts)]
+
+    @property
+    def images(self) -> List[PreparedImage]:
+        """Encoded page images for multimodal extraction, prepared on first access"""
+        if self._images is None:
+            if self._rendered_pages is None:
+                self._rendered_pages = self._render()
+            self._images = self._report(self._rendered_pages)
+        return self._images
+
+    async def images_async(self) -> List[PreparedImage]:
+        """Like images, but waits for the worker without blocking the event loop"""
+        if self._images is None:
+            if self._rendered_pages is None:
+                self._rendered_pages = await self._render_async()
+            self._images = self._report(self._rendered_pages)
+        return self._images
+
+    def _render_task(self):
+        if self.is_pdf:
+            return document_tasks.render_pdf_pages, (
+                self.file_contents,
+                image_options(),
+                page_selection_options(),
+                self.scanned_pages if self.is_mixed else None
+            )
+        return document_tasks.prepare_image, (self.file_contents, image_options())
+
+    def _render(self) -> document_tasks.PreparedPages:
+        fn, args = self._render_task()
+        try:
+            with track_stage("render", self.content_type):
+                result = document_engine.run(fn, *args)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise self._render_error(e)
+        return result if self.is_pdf else ([0], [result])
+
+    async def _render_async(self) -> document_tasks.PreparedPages:
+        fn, args = self._render_task()
+        try:
+            with track_stage("render", self.content_type):
+                result = await document_engine.arun(fn, *args)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise self._render_error(e)
+        return result if self.is_pdf else ([0], [result])
+
+    def _render_error(self, e: Exception) -> HTTPException:
+        if self.is_pdf:
+            logger.error("Error converting PDF to images: %s", e)
+            return HTTPException(
+                status_code=400,
+                detail=f"Error processing PDF file for scanning: {e}"
+            )
+        logger.error("Error loading image: %s", e)
+        return HTTPException(
+            status_code=400,
+            detail=f"Error processing image file: {e}"
+        )
+
+    def _report(self, rendered_pages: document_tasks.PreparedPages) -> List[PreparedImage]:
+        self.selected_pages, images = rendered_pages
+        if self.is_pdf and len(self.selected_pages) < self.page_count:
+            logger.debug(
+                "Selected pages %s of %d for extraction",
+                ", ".join(str(index + 1) for index in self.selected_pages), self.page_count
+            )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Prepared %s", summarize(images))
+        return images
+
+    def close(self) -> None:
+        """Release rendered images and the native PDF copy (text is kept)"""
+        self._rendered_pages = None
+        self._images = None
+        self.native_pdf = None
+
+    def __enter__(self) -> "DocumentAnalysis":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _from_analysis(file_contents: bytes, content_type: str, result) -> DocumentAnalysis:
+    page_texts, page_kinds, prepared = result
+    if isinstance(prepared, document_tasks.NativePdf):
+        analysis = DocumentAnalysis(file_contents, content_type, page_texts, page_kinds=page_kinds, native_pdf=prepared)
+    else:
+        analysis = DocumentAnalysis(file_contents, content_type, page_texts, prepared, page_kinds)
+    logger.debug("Analyzed PDF: %d page(s), %d chars", analysis.page_count, len(analysis.text))
+    if analysis.native_pdf is not None:
+        native = analysis.native_pdf
+        logger.debug(
+            "Sending PDF natively: %d of %d page(s), %d bytes",
+            len(native.pages), native.page_count, len(native.data)
+        )
+    if analysis.is_mixed:
+        logger.debug(
+            "Mixed PDF: page(s) %s scanned, the rest sent as text",
+            ", ".join(str(index + 1) for index in analysis.scanned_pages)
+        )
+    return analysis
+
+
+def analyze_document(file_contents: bytes, content_type: str) -> DocumentAnalysis:
+    """
+    Open a document once and collect its text and page statistics.
+    Scanned PDFs are rasterized (or, in native PDF mode, trimmed) in the
+    same pass.
+
+    Args:
+        file_contents: Raw file bytes
+        content_type: MIME type of the file
+
+    Returns:
+        DocumentAnalysis
+    """
+    if not is_pdf(content_type):
+        return DocumentAnalysis(file_contents, content_type, page_texts=[""])
+
+    pdf_mode = _pdf_submission_mode()
+    try:
+        with track_stage("analyze", content_type):
+            result = document_engine.run(
+                document_tasks.analyze_pdf,
+                file_contents,
+                MIN_TEXT_CHARS,
+                image_options(),
+                page_selection_options(),
+                _min_page_chars(),
+                pdf_mode
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning("Error extracting PDF text (file might be image-only): %s", e)
+        return DocumentAnalysis(file_contents, content_type, page_texts=[])
+
+    return _from_analysis(file_contents, content_type, result)
+
+
+async def analyze_document_async(file_contents: bytes, content_type: str) -> DocumentAnalysis:
+    """
+    Async variant of analyze_document for use on the event loop
+    """
+    if not is_pdf(content_type):
+        return DocumentAnalysis(file_contents, content_type, page_texts=[""])
+
+    pdf_mode = _pdf_submission_mode()
+    try:
+        with track_stage("analyze", content_type):
+            result = await document_engine.arun(
+                document_tasks.analyze_pdf,
+                file_contents,
+                MIN_TEXT_CHARS,
+                image_options(),
+                page_selection_options(),
+                _min_page_chars(),
+                pdf_mode
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning("Error extracting PDF text (file might be image-only): %s", e)
+        return DocumentAnalysis(file_contents, content_type, page_texts=[])
+
+    return _from_analysis(file_contents, content_type, result)
@@ -0,0 +1,202 @@
+"""
+Process-pool engine for PDF text extraction, rasterization and image decoding
+Keeps a bounded set of warm worker processes so PyMuPDF/Pillow work doesn't
+hold the API process's GIL, and recycles workers that crash, hang or leak
+"""
+import asyncio
+import logging
+import multiprocessing
+import resource
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from app.core.config import settings
+from app.services import document_tasks
+
+logger = logging.getLogger(__name__)
+
+
+WARM_UP_TIMEOUT_SECONDS = 60.0
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    """
+    Worker initializer: cap address space so a malformed PDF raises
+    MemoryError inside the worker instead of exhausting the host
+    """
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+
+
+class DocumentEngine:
+    """
+    Bounded pool of warm worker processes for CPU-bound document work
+
+    - workers == 0 disables the pool (callers run work in-process)
+    - each task has a timeout; a hung worker is killed and the pool rebuilt
+    - workers are replaced after max_tasks_per_child tasks to bound leaks
+    - a crashed pool (BrokenProcessPool) is rebuilt transparently
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        task_timeout: float = 30.0,
+        max_tasks_per_child: int = 50,
+        memory_limit_mb: int = 0
+    ):
+        """
+        Initialize document engine (workers start on first use or start())
+
+        Args:
+            workers: Number of worker processes (0 = run in-process)
+            task_timeout: Seconds a single task may run before its worker is killed
+            max_tasks_per_child: Tasks a worker handles before it is replaced
+            memory_limit_mb: Address-space limit per worker (0 = unlimited)
+        """
+        self.workers = workers
+        self.task_timeout = task_timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.memory_limit_mb = memory_limit_mb
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                    max_tasks_per_child=self.max_tasks_per_child or None
+                )
+            return self._pool
+
+    def _restart(self, pool: ProcessPoolExecutor, kill: bool) -> None:
+        """Discard a broken or hung pool; the next task creates a fresh one"""
+        with self._lock:
+            if self._pool is not pool:
+                return  # Another caller already replaced it
+            self._pool = None
+            self.restarts += 1
+
+        if kill:
+            for process in list((pool._processes or {}).values()):
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Document engine pool restarted (kill=%s)", kill)
+
+    def start(self) -> None:
+        """Spawn all workers now so the first request doesn't pay startup cost"""
+        if not self.enabled:
+            return
+        pool = self._get_pool()
+        try:
+            futures = [pool.submit(document_tasks.warm_up) for _ in range(self.workers)]
+            for future in futures:
+                # Spawning a worker and importing PyMuPDF takes a few seconds
+                future.result(timeout=max(self.task_timeout, WARM_UP_TIMEOUT_SECONDS))
+        except (BrokenProcessPool, FutureTimeoutError) as e:
+            # Not fatal: the next task builds a fresh pool
+            logger.warning("Document engine warm-up failed: %r", e)
+            self._restart(pool, kill=True)
+            return
+        logger.info("Document engine started with %d worker(s)", self.workers)
+
+    def shutdown(self) -> None:
+        """Stop all workers"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args) in a worker process and wait for the result
+
+        Args:
+            fn: Module-level function from document_tasks
+            *args: Picklable arguments
+
+        Returns:
+            The function's return value
+
+        Raises:
+            HTTPException: 400 if the task timed out or crashed its worker twice
+        """
+        if not self.enabled:
+            return fn(*args)
+
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                future = pool.submit(fn, *args)
+                return future.result(timeout=self.task_timeout)
+            except FutureTimeoutError:
+                self._restart(pool, kill=True)
+                raise self._timeout_error(fn)
+            except BrokenProcessPool:
+                # The crash may have been caused by another task sharing the
+                # pool, so retry once on a fresh pool before giving up
+                self._restart(pool, kill=False)
+                if attempt == 1:
+                    raise self._crash_error(fn)
+
+    async def arun(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Async variant of run() that awaits the worker without blocking the loop
+        """
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                future = asyncio.wrap_future(pool.submit(fn, *args))
+                return await asyncio.wait_for(future, timeout=self.task_timeout)
+            except asyncio.TimeoutError:
+                self._restart(pool, kill=True)
+                raise self._timeout_error(fn)
+            except BrokenProcessPool:
+                self._restart(pool, kill=False)
+                if attempt == 1:
+                    raise self._crash_error(fn)
+
+    def _timeout_error(self, fn: Callable) -> HTTPException:
+        logger.error("Document task %s timed out after %ss", fn.__name__, self.task_timeout)
+        return HTTPException(
+            status_code=400,
+            detail=f"Document processing timed out after {self.task_timeout:.0f}s; the file may be malformed"
+        )
+
+    def _crash_error(self, fn: Callable) -> HTTPException:
+        logger.error("Document task %s crashed its worker", fn.__name__)
+        return HTTPException(
+            status_code=400,
+            detail="Document processing failed; the file may be malformed"
+        )
+
+
+# Global document engine instance
+document_engine = DocumentEngine(
+    workers=settings.DOCUMENT_ENGINE_WORKERS,
+    task_timeout=settings.DOCUMENT_ENGINE_TASK_TIMEOUT_SECONDS,
+    max_tasks_per_child=settings.DOCUMENT_ENGINE_MAX_TASKS_PER_CHILD,
+    memory_limit_mb=settings.DOCUMENT_ENGINE_WORKER_MEMORY_MB
+)
@@ -0,0 +1,198 @@
+"""
+CPU-bound document work executed inside document engine worker processes
+Functions here take and return plain picklable values and import nothing
+from the app settings, so spawned workers start quickly
+"""
+from typing import List, Optional, Tuple, Union
+import fitz  # PyMuPDF
+from PIL import Image
+from app.services.image_preparation import (
+    ImagePreparationOptions,
+    PreparedImage,
+    prepare_embedded_image,
+    prepare_pdf_page,
+    prepare_photo
+)
+from app.services.page_selection import PageSelectionOptions, select_pages
+
+
+def warm_up() -> int:
+    """No-op task used to start workers and load Pillow plugins up front"""
+    Image.init()
+    return 1
+
+
+# Prepared pages of a PDF: (zero-based page indices, one image per index)
+PreparedPages = Tuple[List[int], List[PreparedImage]]
+
+# Page kinds, see classify_pages()
+TEXT_PAGE = "text"
+SCANNED_PAGE = "scanned"
+BLANK_PAGE = "blank"
+
+# How scanned PDFs reach the model, see analyze_pdf()
+RASTERIZE = "rasterize"
+NATIVE = "native"
+AUTO = "auto"
+PDF_SUBMISSION_MODES = (RASTERIZE, NATIVE, AUTO)
+
+# Inline request data is capped at 20MB; leave room for the prompt
+NATIVE_PDF_MAX_BYTES = 18 * 1024 * 1024
+
+
+class NativePdf:
+    """A scanned PDF, trimmed to its selected pages, to send to the model as-is"""
+
+    def __init__(self, pages: List[int], data: bytes, page_count: int):
+        """
+        Args:
+            pages: Zero-based indices (in the original PDF) of the pages kept
+            data: PDF bytes (the original file when every page is kept)
+            page_count: Pages in the original PDF
+        """
+        self.pages = pages
+        self.data = data
+        self.page_count = page_count
+
+
+def classify_pages(pdf_document: fitz.Document, page_texts: List[str], min_page_chars: int) -> List[str]:
+    """
+    Label each page as text (usable text layer), scanned (too little text
+    but images to look at) or blank
+
+    Args:
+        pdf_document: Open PyMuPDF document
+        page_texts: Text layer per page
+        min_page_chars: Non-whitespace characters a text page needs
+
+    Returns:
+        One kind per page
+    """
+    kinds = []
+    for page, text in zip(pdf_document, page_texts):
+        if len("".join(text.split())) >= min_page_chars:
+            kinds.append(TEXT_PAGE)
+        elif page.get_images(full=False):
+            kinds.append(SCANNED_PAGE)
+        else:
+            kinds.append(BLANK_PAGE)
+    return kinds
+
+
+def _prepare_selected_pages(
+    pdf_document: fitz.Document,
+    page_texts: List[str],
+    options: ImagePreparationOptions,
+    selection: PageSelectionOptions,
+    candidates: Optional[List[int]] = None
+) -> PreparedPages:
+    pages = select_pages(pdf_document, page_texts, selection, candidates)
+    return pages, [prepare_pdf_page(pdf_document[index], options) for index in pages]
+
+
+def _native_pdf(file_contents: bytes, pdf_document: fitz.Document, pages: List[int]) -> Optional[NativePdf]:
+    """Trim a PDF to the given pages (None if the result is too large to send inline)"""
+    page_count = len(pdf_document)
+    if len(pages) == page_count:
+        data = bytes(file_contents)
+    else:
+        pdf_document.select(pages)
+        data = pdf_document.tobytes(garbage=3, deflate=True)  # Drops the other pages' images
+    if len(data) > NATIVE_PDF_MAX_BYTES:
+        return None
+    return NativePdf(pages, data, page_count)
+
+
+def _prepare_scanned_pdf(
+    file_contents: bytes,
+    pdf_document: fitz.Document,
+    page_texts: List[str],
+    options: ImagePreparationOptions,
+    selection: PageSelectionOptions,
+    pdf_mode: str
+) -> Union[PreparedPages, NativePdf]:
+    """
+    Prepare a scanned PDF's selected pages as images, or the PDF itself
+
+    In auto mode the PDF is sent natively unless every selected page is an
+    embedded JPEG that can be passed through (then images cost nothing to make).
+    """
+    pages = select_pages(pdf_document, page_texts, selection)
+    if pdf_mode == AUTO and options.embedded_passthrough:
+        images = []
+        for index in pages:
+            image = prepare_embedded_image(pdf_document[index], options)
+            if image is None:
+                break
+            images.append(image)
+        else:
+            return pages, images
+    if pdf_mode in (NATIVE, AUTO):
+        native = _native_pdf(file_contents, pdf_document, pages)
+        if native is not None:
+            return native
+    return pages, [prepare_pdf_page(pdf_document[index], options) for index in pages]
+
+
+def analyze_pdf(
+    file_contents: bytes,
+    min_text_chars: int,
+    options: ImagePreparationOptions,
+    selection: PageSelectionOptions,
+    min_page_chars: int = 0,
+    pdf_mode: str = RASTERIZE
+) -> Tuple[List[str], Optional[List[str]], Union[PreparedPages, NativePdf, None]]:
+    """
+    Extract per-page text and prepare the pages that need images in the same pass
+
+    Scanned PDFs get their selected pages prepared: as images (rasterize),
+    as a trimmed copy of the PDF itself (native), or as whichever is cheaper
+    here (auto). With min_page_chars set, the pages of a text-layer PDF are
+    classified as well, and only its scanned pages (if any) are prepared,
+    always as images.
+
+    Args:
+        file_contents: Raw PDF bytes
+        min_text_chars: Text length below which the PDF counts as scanned
+        options: Image preparation options for scanned pages
+        selection: Which pages of a scanned PDF to prepare
+        min_page_chars: Per-page text needed for a text page (0 = don't classify pages)
+        pdf_mode: rasterize, native or auto (scanned PDFs only)
+
+    Returns:
+        (page texts, page kinds or None, prepared pages / native PDF, or None
+        if no page needs an image)
+    """
+    with fitz.open(stream=file_contents, filetype="pdf") as pdf_document:
+        page_texts = [page.get_text() for page in pdf_document]
+        if len("".join(page_texts).strip()) <= min_text_chars:
+            return page_texts, None, _prepare_scanned_pdf(
+                file_contents, pdf_document, page_texts, options, selection, pdf_mode
+            )
+        if not min_page_chars:
+            return page_texts, None, None
+
+        page_kinds = classify_pages(pdf_document, page_texts, min_page_chars)
+        scanned = [index for index, kind in enumerate(page_kinds) if kind == SCANNED_PAGE]
+        if not scanned:
+            return page_texts, page_kinds, None
+        return page_texts, page_kinds, _prepare_selected_pages(
+            pdf_document, page_texts, options, selection, scanned
+        )
+
+
+def render_pdf_pages(
+    file_contents: bytes,
+    options: ImagePreparationOptions,
+    selection: PageSelectionOptions,
+    pages: Optional[List[int]] = None
+) -> PreparedPages:
+    """Render and encode the selected pages of a PDF (chosen among pages, if given)"""
+    with fitz.open(stream=file_contents, filetype="pdf") as pdf_document:
+        page_texts = [page.get_text() for page in pdf_document]
+        return _prepare_selected_pages(pdf_document, page_texts, options, selection, pages)
+
+
+def prepare_image(file_contents: bytes, options: ImagePreparationOptions) -> PreparedImage:
+    """Decode (with JPEG draft downscaling) and encode an uploaded image"""
+    return prepare_photo(file_contents, options)
@@ -4,19 +4,25 @@ Supports Gmail OAuth and standard IMAP authentication
 """
 import imaplib
 import email
+import logging
 from email.header import decode_header
 import json
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 from sqlalchemy.orm import Session
+from app.core.metrics import track_stage
 from app.models.email_credential import EmailCredential, EmailProcessingLog
 from app.services.encryption import encryption_service
-from app.services.invoice_processing import process_invoice_file
-from app.crud.invoice import create_invoice
+from app.services.invoice_processing import process_invoice_document, process_invoice_documents, InvoiceProcessingResult
+from app.crud.invoice import create_invoice, find_invoice_by_content
 from app.schemas.invoice import InvoiceCreate
+from app.services.upload_intake import content_sha256
 import base64
 
 
+logger = logging.getLogger(__name__)
+
+
 class EmailPollingService:
     """
     Service for polling emails via IMAP or Gmail API (OAuth)
@@ -41,6 +47,8 @@ class EmailPollingService:
             user_id: User ID to fetch email credentials for
         """
         self.db = db
+        # Every record from this service carries the user it polls for
+        self.logger = logging.LoggerAdapter(logger, {"user_id": user_id})
         
         # Import here to avoid circular dependency
         from app.crud import email_credential as email_crud
@@ -65,14 +73,12 @@ class EmailPollingService:
         is_gmail = self.email_credential.provider == "gmail"
         has_oauth = self.email_credential.oauth_token is not None
         
-        # Debug logging
         if is_gmail and not has_oauth:
-            print(f"⚠️  Gmail account detected but OAuth token is NULL for {self.email_credential.email_address}")
-            print(f"    Please complete Gmail OAuth authentication flow")
+            self.logger.warning("Gmail account without an OAuth token, the Gmail OAuth flow has to be completed")
         elif is_gmail and has_oauth:
-            print(f"✅ Gmail OAuth detected for {self.email_credential.email_address}")
+            self.logger.debug("Gmail OAuth detected")
         else:
-            print(f"ℹ️  Non-Gmail provider detected: {self.email_credential.provider}")
+            self.logger.debug("Non-Gmail provider detected: %s", self.email_credential.provider)
         
         return is_gmail and has_oauth
     
@@ -101,12 +107,12 @@ class EmailPollingService:
             gmail_oauth = GmailOAuthService(self.db, self.email_credential)
             if gmail_oauth.connect():
                 self.gmail_service = gmail_oauth
-                print(f"✅ Connected to Gmail OAuth: {self.email_credential.email_address}")
+                self.logger.info("Connected to Gmail OAuth")
                 return True
             return False
             
         except Exception as e:
-            print(f"❌ Gmail OAuth connection failed: {e}")
+            self.logger.error("Gmail OAuth connection failed: %s", e)
             return False
     
     def connect_imap(self) -> bool:
@@ -139,11 +145,11 @@ class EmailPollingService:
             username = self.email_credential.imap_username or self.email_credential.email_address
             self.mail.login(username, password)
             
-            print(f"✅ Connected to IMAP: {self.email_credential.email_address}")
+            self.logger.info("Connected to IMAP server %s", self.email_credential.imap_server)
             return True
             
         except Exception as e:
-            print(f"❌ IMAP connection failed: {e}")
+            self.logger.error("IMAP connection failed: %s", e)
             self.email_credential.last_error = str(e)
             self.email_credential.last_poll_status = "error"
             self.db.commit()
@@ -195,12 +201,14 @@ class EmailPollingService:
             # Get only the last 5 messages (most recent)
             message_ids = all_message_ids[-5:] if len(all_message_ids) > 5 else all_message_ids
             
-            print(f"📧 Found {len(all_message_ids)} unread email(s) in {folder}, checking last {len(message_ids)}")
+            self.logger.info(
+                "Found %d unread email(s) in %s, checking last %d", len(all_message_ids), folder, len(message_ids)
+            )
             
             return [msg_id.decode() for msg_id in message_ids]
             
         except Exception as e:
-            print(f"❌ Error fetching unread emails: {e}")
+            self.logger.error("Error fetching unread emails: %s", e)
             return []
     
     def fetch_email(self, message_id: str) -> Optional[email.message.Message]:
@@ -226,7 +234,7 @@ class EmailPollingService:
             return email_message
             
         except Exception as e:
-            print(f"❌ Error fetching email {message_id}: {e}")
+            self.logger.error("Error fetching email %s: %s", message_id, e)
             return None
     
     def extract_attachments(self, email_message: email.message.Message) -> List[Tuple[str, bytes, str]]:
@@ -260,14 +268,14 @@ class EmailPollingService:
             # Check if file type is supported
             file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
             if f'.{file_ext}' not in self.SUPPORTED_EXTENSIONS:
-                print(f"  ⏭️  Skipping unsupported file: {filename}")
+                self.logger.debug("Skipping unsupported file: %s", filename)
                 continue
             
             # Get file content
             file_data = part.get_payload(decode=True)
             content_type = part.get_content_type()
             
-            print(f"  📎 Found attachment: {filename} ({content_type})")
+            self.logger.debug("Found attachment: %s (%s)", filename, content_type)
             attachments.append((filename, file_data, content_type))
         
         return attachments
@@ -283,59 +291,124 @@ class EmailPollingService:
             user_id: User ID who owns this email account
         
         Returns:
-            True if processed successfully, False otherwise
+            True if processed successfully (or already known), False otherwise
         """
         try:
-            print(f"  🤖 Processing {filename} with Gemini AI...")
-            
-            # Map content types
-            if content_type == 'text/plain':
-                content_type = 'text/plain'
-            elif 'image' in content_type:
-                if not content_type.startswith('image/'):
-                    content_type = 'image/jpeg'  # Default for images
-            
-            # Process with Gemini AI
-            extraction_result = process_invoice_file(file_bytes, content_type)
-            
-            # Get file size and type
-            file_size = len(file_bytes)
-            file_type = filename.split('.')[-1].lower() if '.' in filename else 'unknown'
-            
-            # Create invoice in database
-            invoice_data = InvoiceCreate(
-                original_filename=filename,
-                file_size=file_size,
-                file_type=file_type
-            )
+            self.logger.debug("Processing attachment %s", filename)
             
-            # Extract text for searchability (if PDF)
-            extracted_text = None
-            if content_type == 'application/pdf':
-                from app.services.invoice_processing import extract_text_from_pdf
-                extracted_text = extract_text_from_pdf(file_bytes)
-            
-            invoice = create_invoice(
-                db=self.db,
-                user_id=user_id,
-                invoice_data=invoice_data,
-                extraction_result=extraction_result,
-                extracted_text=extracted_text
-            )
+            # The same file from an earlier email needs no extraction
+            file_hash = content_sha256(file_bytes)
+            if find_invoice_by_content(self.db, user_id, file_hash):
+                return True
             
-            print(f"  ✅ Invoice created: {invoice.id} - {invoice.vendor_name}")
-            return True
+            # Process with Gemini AI (PDF text is reused below)
+            processing_result = process_invoice_document(file_bytes, self._normalize_content_type(content_type), user_id)
+            return self._save_invoice(filename, file_bytes, processing_result, user_id, file_hash)
             
         except Exception as e:
-            print(f"  ❌ Error processing attachment: {e}")
+            self.logger.error("Error processing attachment %s: %s", filename, e)
             return False
     
+    def process_attachments(self, attachments: List[Tuple[str, bytes, str]], user_id: str) -> List[bool]:
+        """
+        Process several invoice attachments at once
+        Text-layer PDFs are batched into shared Gemini requests instead of
+        one round trip each; everything else is processed as before.
+        Files already stored as invoices, and repeats of a file within the
+        cycle, are not extracted again.
+        
+        Args:
+            attachments: List of tuples (filename, file_bytes, content_type)
+            user_id: User ID who owns this email account
+        
+        Returns:
+            One flag per attachment, True if an invoice was created (or
+            already existed for that file)
+        """
+        if not attachments:
+            return []
+        
+        self.logger.info("Processing %d attachment(s)", len(attachments))
+        hashes = [content_sha256(file_bytes) for _, file_bytes, _ in attachments]
+        outcomes: List[Optional[bool]] = [None] * len(attachments)
+        first_by_hash = {}
+        pending = []
+        for index, file_hash in enumerate(hashes):
+            if file_hash in first_by_hash:
+                continue  # Takes the outcome of its first copy below
+            first_by_hash[file_hash] = index
+            if find_invoice_by_content(self.db, user_id, file_hash):
+                outcomes[index] = True
+            else:
+                pending.append(index)
+        
+        results = process_invoice_documents([
+            (attachments[index][1], self._normalize_content_type(attachments[index][2]))
+            for index in pending
+        ], user_id)
+        
+        for index, result in zip(pending, results):
+            filename, file_bytes, _ = attachments[index]
+            if isinstance(result, Exception):
+                self.logger.error("Error processing attachment %s: %s", filename, result)
+                outcomes[index] = False
+                continue
+            try:
+                outcomes[index] = self._save_invoice(filename, file_bytes, result, user_id, hashes[index])
+            except Exception as e:
+                self.logger.error("Error saving invoice for %s: %s", filename, e)
+                self.db.rollback()
+                outcomes[index] = False
+        
+        return [
+            outcome if outcome is not None else outcomes[first_by_hash[file_hash]]
+            for outcome, file_hash in zip(outcomes, hashes)
+        ]
+    
+    def _normalize_content_type(self, content_type: str) -> str:
+        """Map attachment content types to the ones invoice processing expects"""
+        if 'image' in content_type and not content_type.startswith('image/'):
+            return 'image/jpeg'  # Default for images
+        return content_type
+    
+    def _save_invoice(
+        self,
+        filename: str,
+        file_bytes: bytes,
+        processing_result: InvoiceProcessingResult,
+        user_id: str,
+        file_hash: Optional[str] = None
+    ) -> bool:
+        """Create the invoice row for a processed attachment"""
+        # Get file size and type
+        file_size = len(file_bytes)
+        file_type = filename.split('.')[-1].lower() if '.' in filename else 'unknown'
+        
+        # Create invoice in database
+        invoice_data = InvoiceCreate(
+            original_filename=filename,
+            file_size=file_size,
+            file_type=file_type
+        )
+        
+        invoice = create_invoice(
+            db=self.db,
+            user_id=user_id,
+            invoice_data=invoice_data,
+            extraction_result=processing_result.extraction,
+            extracted_text=processing_result.extracted_text,
+            content_sha256=file_hash
+        )
+        
+        self.logger.debug("Invoice created from %s: %s", filename, invoice.id)
+        return True
+    
     def mark_as_read(self, message_id: str):
         """Mark email as read"""
         try:
             self.mail.store(message_id, '+FLAGS', '\\Seen')
         except Exception as e:
-            print(f"⚠️ Could not mark email as read: {e}")
+            self.logger.warning("Could not mark email as read: %s", e)
     
     def process_single_email(self, message_id: str) -> EmailProcessingLog:
         """
@@ -347,34 +420,24 @@ class EmailPollingService:
         Returns:
             EmailProcessingLog entry
         """
+        return self._process_collected([self._collect_imap_email(message_id)])[0]
+    
+    def _collect_imap_email(self, message_id: str) -> "CollectedEmail":
+        """
+        Fetch an email and its supported attachments without processing them
         
-        # Check if this message has already been processed
-        existing_log = self.db.query(EmailProcessingLog).filter(
-            EmailProcessingLog.user_id == self.email_credential.user_id,
-            EmailProcessingLog.email_message_id == message_id,
-            EmailProcessingLog.status == "success"
-        ).first()
+        Args:
+            message_id: Email message ID
         
-        if existing_log:
-            print(f"⏭️  Skipping already processed email: {message_id}")
-            log = EmailProcessingLog(
-                user_id=self.email_credential.user_id,
-                email_credential_id=self.email_credential.id,
-                email_message_id=message_id,
-                status="skipped",
-                error_message="Already processed"
-            )
-            return log
+        Returns:
+            CollectedEmail (already finalized if there is nothing to process)
+        """
         
-        log = EmailProcessingLog(
-            user_id=self.email_credential.user_id,
-            email_credential_id=self.email_credential.id,
-            email_message_id=message_id,
-            status="processing",
-            attachments_found=0,
-            attachments_processed=0,
-            invoices_created=0
-        )
+        # Check if this message has already been processed
+        if self._already_processed(message_id):
+            return CollectedEmail(self._skipped_log(message_id))
+        
+        log = self._new_log(message_id)
         
         try:
             # Fetch email
@@ -383,7 +446,7 @@ class EmailPollingService:
             if not email_message:
                 log.status = "failed"
                 log.error_message = "Could not fetch email"
-                return log
+                return CollectedEmail(log)
             
             # Extract email metadata
             subject = email_message.get('Subject', 'No Subject')
@@ -398,27 +461,91 @@ class EmailPollingService:
             except:
                 log.email_date = datetime.utcnow()
             
-            print(f"\n📨 Processing: {log.email_subject}")
-            print(f"   From: {from_addr}")
+            self.logger.debug("Processing email %s from %s", message_id, from_addr)
             
             # Extract attachments
             attachments = self.extract_attachments(email_message)
             log.attachments_found = len(attachments)
             
             if not attachments:
-                print("  ℹ️ No supported attachments found")
+                self.logger.debug("No supported attachments found")
                 log.status = "success"
                 log.error_message = "No attachments"
-                return log
+                return CollectedEmail(log)
             
-            # Process each attachment
-            invoices_created = 0
-            for filename, file_bytes, content_type in attachments:
-                if self.process_attachment(filename, file_bytes, content_type, self.email_credential.user_id):
-                    log.attachments_processed += 1
-                    invoices_created += 1
+            return CollectedEmail(log, attachments, lambda: self.mark_as_read(message_id))
             
-            log.invoices_created = invoices_created
+        except Exception as e:
+            self.logger.error("Error processing email %s: %s", message_id, e)
+            log.status = "failed"
+            log.error_message = str(e)
+            return CollectedEmail(log)
+    
+    def _already_processed(self, email_message_id: str) -> bool:
+        """Check for a successful processing log for this message"""
+        existing_log = self.db.query(EmailProcessingLog).filter(
+            EmailProcessingLog.user_id == self.email_credential.user_id,
+            EmailProcessingLog.email_message_id == email_message_id,
+            EmailProcessingLog.status == "success"
+        ).first()
+        return existing_log is not None
+    
+    def _skipped_log(self, email_message_id: str) -> EmailProcessingLog:
+        self.logger.debug("Skipping already processed email: %s", email_message_id)
+        return EmailProcessingLog(
+            user_id=self.email_credential.user_id,
+            email_credential_id=self.email_credential.id,
+            email_message_id=email_message_id,
+            status="skipped",
+            error_message="Already processed"
+        )
+    
+    def _new_log(self, email_message_id: str) -> EmailProcessingLog:
+        return EmailProcessingLog(
+            user_id=self.email_credential.user_id,
+            email_credential_id=self.email_credential.id,
+            email_message_id=email_message_id,
+            status="processing",
+            attachments_found=0,
+            attachments_processed=0,
+            invoices_created=0
+        )
+    
+    def _process_collected(self, collected: List["CollectedEmail"]) -> List[EmailProcessingLog]:
+        """
+        Process the attachments of all collected emails together, then
+        finalize each email's log (status, counts, mark as read)
+        
+        Args:
+            collected: Emails gathered in this polling cycle
+        
+        Returns:
+            One EmailProcessingLog per email, in order
+        """
+        pending = [item for item in collected if item.attachments]
+        all_attachments = [attachment for item in pending for attachment in item.attachments]
+        
+        try:
+            with track_stage("email.process"):
+                outcomes = self.process_attachments(all_attachments, self.email_credential.user_id)
+        except Exception as e:
+            self.logger.error("Error processing attachments: %s", e)
+            outcomes = [False] * len(all_attachments)
+        
+        position = 0
+        for item in pending:
+            item_outcomes = outcomes[position:position + len(item.attachments)]
+            position += len(item.attachments)
+            self._finish_email(item, item_outcomes)
+        
+        return [item.log for item in collected]
+    
+    def _finish_email(self, item: "CollectedEmail", outcomes: List[bool]) -> None:
+        """Set an email's final status from its attachment outcomes"""
+        log = item.log
+        try:
+            log.attachments_processed = sum(outcomes)
+            log.invoices_created = log.attachments_processed
             
             # Determine status
             if log.attachments_processed == log.attachments_found:
@@ -432,15 +559,28 @@ class EmailPollingService:
             
             # Mark as read if configured
             if self.email_credential.mark_as_read and log.status in ["success", "partial"]:
-                self.mark_as_read(message_id)
-                print("  ✓ Marked as read")
+                item.mark_as_read()
+                self.logger.debug("Marked email %s as read", log.email_message_id)
             
         except Exception as e:
-            print(f"❌ Error processing email: {e}")
+            self.logger.error("Error finishing email %s: %s", log.email_message_id, e)
             log.status = "failed"
             log.error_message = str(e)
-        
-        return log
+    
+    def _save_logs(self, logs: List[EmailProcessingLog], stats: dict) -> None:
+        """Persist processing logs and update polling statistics"""
+        for log in logs:
+            # Only save log if not skipped (skipped means already processed)
+            if log.status != "skipped":
+                # Save log to database
+                self.db.add(log)
+                self.db.commit()
+                
+                stats["invoices_created"] += log.invoices_created
+                if log.status == "failed":
+                    stats["errors"] += 1
+            else:
+                self.logger.debug("Skipped duplicate email %s", log.email_message_id)
     
     def poll_emails(self) -> dict:
         """
@@ -456,31 +596,34 @@ class EmailPollingService:
             "status": "unknown"
         }
         
-        try:
-            # Connect to email service (Gmail OAuth or IMAP)
-            if not self.connect():
-                stats["status"] = "connection_failed"
-                return stats
-            
-            # Get unread emails based on provider type
-            if self.is_gmail_oauth:
-                return self.poll_gmail_oauth(stats)
-            else:
-                return self.poll_imap(stats)
+        # Outcome label is the poll status (success, no_emails, error, ...)
+        with track_stage("email.poll") as timer:
+            try:
+                # Connect to email service (Gmail OAuth or IMAP)
+                if not self.connect():
+                    stats["status"] = "connection_failed"
+                    return stats
+            
+                # Get unread emails based on provider type
+                if self.is_gmail_oauth:
+                    return self.poll_gmail_oauth(stats)
+                else:
+                    return self.poll_imap(stats)
             
-        except Exception as e:
-            print(f"❌ Polling error: {e}")
-            stats["status"] = "error"
-            stats["error_message"] = str(e)
+            except Exception as e:
+                self.logger.error("Polling error: %s", e)
+                stats["status"] = "error"
+                stats["error_message"] = str(e)
             
-            self.email_credential.last_poll_status = "error"
-            self.email_credential.last_error = str(e)
-            self.db.commit()
+                self.email_credential.last_poll_status = "error"
+                self.email_credential.last_error = str(e)
+                self.db.commit()
             
-            return stats
+                return stats
         
-        finally:
-            self.disconnect()
+            finally:
+                self.disconnect()
+                timer.outcome = stats["status"]
     
     def poll_imap(self, stats: dict) -> dict:
         """
@@ -498,29 +641,17 @@ class EmailPollingService:
             stats["emails_checked"] = len(message_ids)
             
             if not message_ids:
-                print("📭 No new emails found")
+                self.logger.info("No new emails found")
                 stats["status"] = "no_emails"
                 self.email_credential.last_poll_status = "success"
                 self.email_credential.last_poll_time = datetime.utcnow()
                 self.db.commit()
                 return stats
             
-            # Process each email
-            for message_id in message_ids:
-                log = self.process_single_email(message_id)
-                
-                # Only save log if not skipped (skipped means already processed)
-                if log.status != "skipped":
-                    # Save log to database
-                    self.db.add(log)
-                    self.db.commit()
-                    
-                    stats["invoices_created"] += log.invoices_created
-                    if log.status == "failed":
-                        stats["errors"] += 1
-                else:
-                    print(f"  ⏭️  Skipped duplicate email")
-
+            # Collect every email first so their attachments are processed together
+            with track_stage("email.fetch"):
+                collected = [self._collect_imap_email(message_id) for message_id in message_ids]
+            self._save_logs(self._process_collected(collected), stats)
             
             # Update credential status
             self.email_credential.last_poll_time = datetime.utcnow()
@@ -529,10 +660,10 @@ class EmailPollingService:
             self.db.commit()
             
             stats["status"] = "success"
-            print(f"\n✅ Polling complete: {stats['invoices_created']} invoices created")
+            self.logger.info("Polling complete: %d invoices created", stats["invoices_created"])
             
         except Exception as e:
-            print(f"❌ Polling error: {e}")
+            self.logger.error("Polling error: %s", e)
             stats["status"] = "error"
             stats["error_message"] = str(e)
             
@@ -562,31 +693,19 @@ class EmailPollingService:
             stats["emails_checked"] = len(messages)
             
             if not messages:
-                print("📭 No new emails found")
+                self.logger.info("No new emails found")
                 stats["status"] = "no_emails"
                 self.email_credential.last_poll_status = "success"
                 self.email_credential.last_poll_time = datetime.utcnow()
                 self.db.commit()
                 return stats
             
-            print(f"📧 Found {len(messages)} unread email(s)")
+            self.logger.info("Found %d unread email(s)", len(messages))
             
-            # Process each message
-            for message_data in messages:
-                log = self.process_gmail_message(message_data)
-                
-                # Only save log if not skipped (skipped means already processed)
-                if log.status != "skipped":
-                    # Save log to database
-                    self.db.add(log)
-                    self.db.commit()
-                    
-                    stats["invoices_created"] += log.invoices_created
-                    if log.status == "failed":
-                        stats["errors"] += 1
-                else:
-                    print(f"  ⏭️  Skipped duplicate email")
-
+            # Collect every message first so their attachments are processed together
+            with track_stage("email.fetch"):
+                collected = [self._collect_gmail_message(message_data) for message_data in messages]
+            self._save_logs(self._process_collected(collected), stats)
             
             # Update credential status
             self.email_credential.last_poll_time = datetime.utcnow()
@@ -595,10 +714,10 @@ class EmailPollingService:
             self.db.commit()
             
             stats["status"] = "success"
-            print(f"\n✅ Polling complete: {stats['invoices_created']} invoices created")
+            self.logger.info("Polling complete: %d invoices created", stats["invoices_created"])
             
         except Exception as e:
-            print(f"❌ Gmail OAuth polling error: {e}")
+            self.logger.error("Gmail OAuth polling error: %s", e)
             stats["status"] = "error"
             stats["error_message"] = str(e)
             
@@ -618,38 +737,28 @@ class EmailPollingService:
         Returns:
             EmailProcessingLog entry
         """
+        return self._process_collected([self._collect_gmail_message(message_data)])[0]
+    
+    def _collect_gmail_message(self, message_data: dict) -> "CollectedEmail":
+        """
+        Fetch a Gmail message's supported attachments without processing them
+        
+        Args:
+            message_data: Full Gmail message data from API
+            
+        Returns:
+            CollectedEmail (already finalized if there is nothing to process)
+        """
         # Extract message details
         details = self.gmail_service.get_message_details(message_data)
         message_id = details['id']
         email_message_id = details.get('message_id', message_id)
         
         # Check if this message has already been processed
-        existing_log = self.db.query(EmailProcessingLog).filter(
-            EmailProcessingLog.user_id == self.email_credential.user_id,
-            EmailProcessingLog.email_message_id == email_message_id,
-            EmailProcessingLog.status == "success"
-        ).first()
+        if self._already_processed(email_message_id):
+            return CollectedEmail(self._skipped_log(email_message_id))
         
-        if existing_log:
-            print(f"⏭️  Skipping already processed email: {email_message_id}")
-            log = EmailProcessingLog(
-                user_id=self.email_credential.user_id,
-                email_credential_id=self.email_credential.id,
-                email_message_id=email_message_id,
-                status="skipped",
-                error_message="Already processed"
-            )
-            return log
-        
-        log = EmailProcessingLog(
-            user_id=self.email_credential.user_id,
-            email_credential_id=self.email_credential.id,
-            email_message_id=email_message_id,
-            status="processing",
-            attachments_found=0,
-            attachments_processed=0,
-            invoices_created=0
-        )
+        log = self._new_log(email_message_id)
         
         try:
             log.email_subject = details['subject']
@@ -661,75 +770,76 @@ class EmailPollingService:
             except:
                 log.email_date = datetime.utcnow()
             
-            print(f"\n📨 Processing: {log.email_subject}")
-            print(f"   From: {details['from']}")
+            self.logger.debug("Processing email %s from %s", message_id, details['from'])
             
             # Get attachments from Gmail API
             attachments = self.gmail_service.get_message_attachments(message_id)
             log.attachments_found = len(attachments)
             
             if not attachments:
-                print("  ℹ️ No attachments found")
+                self.logger.debug("No attachments found in email %s", message_id)
                 log.status = "success"
                 log.error_message = "No attachments"
-                return log
+                return CollectedEmail(log)
             
             # Filter supported attachments
             supported_attachments = []
             for filename, file_bytes in attachments:
                 file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
                 if f'.{file_ext}' in self.SUPPORTED_EXTENSIONS:
-                    supported_attachments.append((filename, file_bytes))
-                    print(f"  📎 Found attachment: {filename}")
+                    # Determine content type from extension
+                    content_type_map = {
+                        'pdf': 'application/pdf',
+                        'jpg': 'image/jpeg',
+                        'jpeg': 'image/jpeg',
+                        'png': 'image/png',
+                        'txt': 'text/plain'
+                    }
+                    content_type = content_type_map.get(file_ext, 'application/octet-stream')
+                    supported_attachments.append((filename, file_bytes, content_type))
+                    self.logger.debug("Found attachment: %s", filename)
                 else:
-                    print(f"  ⏭️  Skipping unsupported file: {filename}")
+                    self.logger.debug("Skipping unsupported file: %s", filename)
             
             log.attachments_found = len(supported_attachments)
             
             if not supported_attachments:
-                print("  ℹ️ No supported attachments found")
+                self.logger.debug("No supported attachments found")
                 log.status = "success"
                 log.error_message = "No supported attachments"
-                return log
-            
-            # Process each supported attachment
-            invoices_created = 0
-            for filename, file_bytes in supported_attachments:
-                # Determine content type from extension
-                file_ext = filename.lower().split('.')[-1]
-                content_type_map = {
-                    'pdf': 'application/pdf',
-                    'jpg': 'image/jpeg',
-                    'jpeg': 'image/jpeg',
-                    'png': 'image/png',
-                    'txt': 'text/plain'
-                }
-                content_type = content_type_map.get(file_ext, 'application/octet-stream')
-                
-                if self.process_attachment(filename, file_bytes, content_type, self.email_credential.user_id):
-                    log.attachments_processed += 1
-                    invoices_created += 1
-            
-            log.invoices_created = invoices_created
+                return CollectedEmail(log)
             
-            # Determine status
-            if log.attachments_processed == log.attachments_found:
-                log.status = "success"
-            elif log.attachments_processed > 0:
-                log.status = "partial"
-                log.error_message = f"Processed {log.attachments_processed}/{log.attachments_found} attachments"
-            else:
-                log.status = "failed"
-                log.error_message = "No attachments could be processed"
-            
-            # Mark as read if configured
-            if self.email_credential.mark_as_read and log.status in ["success", "partial"]:
-                self.gmail_service.mark_as_read(message_id)
-                print("  ✓ Marked as read")
+            return CollectedEmail(
+                log,
+                supported_attachments,
+                lambda: self.gmail_service.mark_as_read(message_id)
+            )
             
         except Exception as e:
-            print(f"❌ Error processing Gmail message: {e}")
+            self.logger.error("Error processing Gmail message %s: %s", message_id, e)
             log.status = "failed"
             log.error_message = str(e)
-        
-        return log
+            return CollectedEmail(log)
+
+
+class CollectedEmail:
+    """
+    An email gathered during a polling cycle, waiting for its attachments
+    to be processed together with the rest of the cycle's attachments
+    """
+    
+    def __init__(
+        self,
+        log: EmailProcessingLog,
+        attachments: Optional[List[Tuple[str, bytes, str]]] = None,
+        mark_as_read: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            log: Processing log (final already when there are no attachments)
+            attachments: List of tuples (filename, file_bytes, content_type)
+            mark_as_read: Marks the email as read on the mail server
+        """
+        self.log = log
+        self.attachments = attachments or []
+        self.mark_as_read = mark_as_read
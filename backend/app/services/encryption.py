@@ -2,11 +2,14 @@
 Encryption service for securing sensitive email credentials
 Uses Fernet symmetric encryption from cryptography library
 """
+import logging
 import os
 import json
 from cryptography.fernet import Fernet
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class EncryptionService:
     """
@@ -20,8 +23,9 @@ class EncryptionService:
         
         if not encryption_key:
             # Generate a new key if not provided (for development only!)
-            print("⚠️ WARNING: No ENCRYPTION_KEY found. Generating a temporary one.")
-            print("⚠️ For production, add ENCRYPTION_KEY to your .env file!")
+            logger.warning(
+                "No ENCRYPTION_KEY found, generating a temporary one; add ENCRYPTION_KEY to your .env file for production"
+            )
             encryption_key = Fernet.generate_key().decode()
         
         # Ensure key is bytes
@@ -63,7 +67,7 @@ class EncryptionService:
             decrypted_bytes = self.cipher.decrypt(encrypted_data.encode())
             return decrypted_bytes.decode()
         except Exception as e:
-            print(f"❌ Decryption failed: {e}")
+            logger.error("Decryption failed: %s", e)
             raise ValueError("Failed to decrypt data. Key may be incorrect.")
     
     def encrypt_json(self, data: dict) -> str:
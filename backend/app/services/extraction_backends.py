@@ -0,0 +1,372 @@
+"""
+Pluggable extraction backends
+The processing pipeline (caching, templates, page preparation, batching)
+hands prepared text or page images to one backend, selected by the
+EXTRACTION_BACKEND setting:
+
+- gemini: Google Gemini through the shared extraction gateway (default)
+- local: the rule-based extractor only, for text-layer PDFs
+- fake: deterministic synthetic results with configurable latency and
+  error rate, so uploads and polling can be load-tested offline
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Union
+from fastapi import HTTPException
+from PIL import Image
+from app.core.config import settings
+from app.schemas.invoice import InvoiceExtractionResponse
+from app.services import gemini_extraction
+from app.services.image_preparation import PreparedImage
+from app.services.local_extraction import extract_locally
+
+logger = logging.getLogger(__name__)
+
+
+PageImage = Union[PreparedImage, Image.Image]
+
+
+class ExtractionBackend:
+    """
+    Interface every extraction backend implements
+
+    Sync methods run on worker threads (uploads, email polling); async
+    methods must not block the event loop. Backends are shared per process
+    and must be thread-safe.
+    """
+
+    name = "base"
+
+    @property
+    def cache_namespace(self) -> str:
+        """Part of the extraction cache key, so backends never share entries"""
+        return self.name
+
+    def extract_text(self, text: str) -> InvoiceExtractionResponse:
+        """Extract one invoice from its (compacted) text layer"""
+        raise NotImplementedError
+
+    def extract_texts(self, texts: List[str]) -> List[Optional[InvoiceExtractionResponse]]:
+        """
+        Extract several invoices in one call where the backend supports it
+
+        Returns:
+            One entry per text; None for documents the caller should retry
+            on their own
+
+        Raises:
+            HTTPException: If the call fails; the whole batch fails with it
+        """
+        results: List[Optional[InvoiceExtractionResponse]] = []
+        for text in texts:
+            try:
+                results.append(self.extract_text(text))
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error("%s backend failed on a batched document: %s", self.name, e)
+                results.append(None)
+        return results
+
+    def extract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        """Extract one invoice from its page images"""
+        raise NotImplementedError
+
+    def extract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        """Extract one invoice from a (trimmed) scanned PDF sent as-is (native PDF mode)"""
+        raise NotImplementedError
+
+    def extract_mixed(self, text: str, images: List[PageImage], scanned_pages: List[int]) -> InvoiceExtractionResponse:
+        """
+        Extract one invoice from a mixed PDF in one call
+
+        Args:
+            text: (Compacted) text layer of the typed pages
+            images: Prepared images of the scanned pages
+            scanned_pages: Zero-based page indices behind the images
+        """
+        raise NotImplementedError
+
+    async def aextract_text(self, text: str) -> InvoiceExtractionResponse:
+        """Async variant of extract_text (defaults to a worker thread)"""
+        return await asyncio.to_thread(self.extract_text, text)
+
+    async def aextract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        """Async variant of extract_images (defaults to a worker thread)"""
+        return await asyncio.to_thread(self.extract_images, images)
+
+    async def aextract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        """Async variant of extract_pdf (defaults to a worker thread)"""
+        return await asyncio.to_thread(self.extract_pdf, data)
+
+    async def aextract_mixed(
+        self,
+        text: str,
+        images: List[PageImage],
+        scanned_pages: List[int]
+    ) -> InvoiceExtractionResponse:
+        """Async variant of extract_mixed (defaults to a worker thread)"""
+        return await asyncio.to_thread(self.extract_mixed, text, images, scanned_pages)
+
+
+class GeminiBackend(ExtractionBackend):
+    """Google Gemini (text and multimodal) through the extraction gateway"""
+
+    name = "gemini"
+
+    @property
+    def cache_namespace(self) -> str:
+        return (
+            gemini_extraction.TEXT_PROMPT_TEMPLATE
+            + gemini_extraction.IMAGE_PROMPT_TEMPLATE
+            + gemini_extraction.PDF_PROMPT_TEMPLATE
+            + gemini_extraction.MIXED_PROMPT_TEMPLATE
+            + gemini_extraction.GEMINI_MODEL
+        )
+
+    def extract_text(self, text: str) -> InvoiceExtractionResponse:
+        return gemini_extraction.get_invoice_data_from_text(text)
+
+    def extract_texts(self, texts: List[str]) -> List[Optional[InvoiceExtractionResponse]]:
+        return gemini_extraction.get_invoice_data_from_texts(texts)
+
+    def extract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        return gemini_extraction.get_invoice_data_from_images(images)
+
+    def extract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        return gemini_extraction.get_invoice_data_from_pdf(data)
+
+    def extract_mixed(self, text: str, images: List[PageImage], scanned_pages: List[int]) -> InvoiceExtractionResponse:
+        return gemini_extraction.get_invoice_data_from_mixed(text, images, scanned_pages)
+
+    async def aextract_text(self, text: str) -> InvoiceExtractionResponse:
+        return await gemini_extraction.get_invoice_data_from_text_async(text)
+
+    async def aextract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        return await gemini_extraction.get_invoice_data_from_images_async(images)
+
+    async def aextract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        return await gemini_extraction.get_invoice_data_from_pdf_async(data)
+
+    async def aextract_mixed(
+        self,
+        text: str,
+        images: List[PageImage],
+        scanned_pages: List[int]
+    ) -> InvoiceExtractionResponse:
+        return await gemini_extraction.get_invoice_data_from_mixed_async(text, images, scanned_pages)
+
+
+class LocalRulesBackend(ExtractionBackend):
+    """
+    Rule-based extraction only (no model calls). Text-layer PDFs get the
+    local extractor's best effort whatever its confidence (mixed PDFs: from
+    their typed pages only); scanned PDFs and images can't be read without a
+    model and are rejected.
+    """
+
+    name = "local"
+
+    def extract_text(self, text: str) -> InvoiceExtractionResponse:
+        extraction = extract_locally(text)
+        result = extraction.result
+        result.confidence_score = round(extraction.confidence, 3)
+        result.extraction_method = "local"
+        return result
+
+    def extract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        raise HTTPException(
+            status_code=422,
+            detail="The local extraction backend can only read PDFs with a text layer"
+        )
+
+    def extract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        return self.extract_images([])
+
+    def extract_mixed(self, text: str, images: List[PageImage], scanned_pages: List[int]) -> InvoiceExtractionResponse:
+        return self.extract_text(text)
+
+    async def aextract_text(self, text: str) -> InvoiceExtractionResponse:
+        return self.extract_text(text)  # Pure regex work, no I/O
+
+    async def aextract_mixed(
+        self,
+        text: str,
+        images: List[PageImage],
+        scanned_pages: List[int]
+    ) -> InvoiceExtractionResponse:
+        return self.extract_text(text)
+
+
+class FakeBackend(ExtractionBackend):
+    """
+    Deterministic stand-in for a model backend
+
+    Results are derived from a hash of the input, so the same document always
+    yields the same (realistic-looking) invoice and different documents don't
+    collide in duplicate detection. Each call sleeps for a log-normally
+    distributed latency and fails with probability error_rate, raising the
+    same 503 the gateway raises when the model is throttling.
+    """
+
+    name = "fake"
+
+    VENDORS = [
+        "Acme Corporation", "Globex Industries", "Initech Supplies Ltd", "Umbrella Logistics GmbH",
+        "Stark Office Solutions", "Wayne Facilities Inc", "Nordlicht Handels AG", "Tata Print Services",
+    ]
+    CURRENCIES = ["USD", "USD", "USD", "EUR", "GBP", "INR"]
+
+    def __init__(
+        self,
+        latency_median: float = 1.5,
+        latency_sigma: float = 0.4,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize fake backend
+
+        Args:
+            latency_median: Median simulated call latency in seconds
+            latency_sigma: Log-normal spread (0 = constant latency)
+            error_rate: Share of calls that fail (0.0 - 1.0)
+            seed: Seed for latency and error sampling (None = random)
+        """
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def extract_text(self, text: str) -> InvoiceExtractionResponse:
+        time.sleep(self._sample_call())
+        return self._invoice_for(text.encode("utf-8"))
+
+    def extract_texts(self, texts: List[str]) -> List[Optional[InvoiceExtractionResponse]]:
+        # One simulated round trip for the whole batch, like a batched model call
+        time.sleep(self._sample_call())
+        return [self._invoice_for(text.encode("utf-8")) for text in texts]
+
+    def extract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        time.sleep(self._sample_call())
+        return self._invoice_for(self._images_digest(images))
+
+    def extract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        time.sleep(self._sample_call())
+        return self._invoice_for(bytes(data))
+
+    def extract_mixed(self, text: str, images: List[PageImage], scanned_pages: List[int]) -> InvoiceExtractionResponse:
+        time.sleep(self._sample_call())
+        return self._invoice_for(text.encode("utf-8") + self._images_digest(images))
+
+    async def aextract_text(self, text: str) -> InvoiceExtractionResponse:
+        await asyncio.sleep(self._sample_call())
+        return self._invoice_for(text.encode("utf-8"))
+
+    async def aextract_images(self, images: List[PageImage]) -> InvoiceExtractionResponse:
+        await asyncio.sleep(self._sample_call())
+        return self._invoice_for(self._images_digest(images))
+
+    async def aextract_pdf(self, data: bytes) -> InvoiceExtractionResponse:
+        await asyncio.sleep(self._sample_call())
+        return self._invoice_for(bytes(data))
+
+    async def aextract_mixed(
+        self,
+        text: str,
+        images: List[PageImage],
+        scanned_pages: List[int]
+    ) -> InvoiceExtractionResponse:
+        await asyncio.sleep(self._sample_call())
+        return self._invoice_for(text.encode("utf-8") + self._images_digest(images))
+
+    def _sample_call(self) -> float:
+        """Draw the latency for one call, or raise a simulated failure"""
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            latency = self.latency_median * self._random.lognormvariate(0.0, self.latency_sigma) \
+                if self.latency_sigma > 0 else self.latency_median
+        if failed:
+            raise HTTPException(
+                status_code=503,
+                detail="AI extraction service is busy, please retry later: simulated failure",
+                headers={"Retry-After": "1"}
+            )
+        return max(latency, 0.0)
+
+    def _images_digest(self, images: List[PageImage]) -> bytes:
+        digest = hashlib.sha256()
+        for image in images:
+            digest.update(image.data if isinstance(image, PreparedImage) else image.tobytes())
+        return digest.digest()
+
+    def _invoice_for(self, content: bytes) -> InvoiceExtractionResponse:
+        generator = random.Random(hashlib.sha256(content).digest())
+        invoice_date = date(2024, 1, 1) + timedelta(days=generator.randrange(365))
+        return InvoiceExtractionResponse(
+            invoice_id=f"INV-{invoice_date.year}-{generator.randrange(100000):05d}",
+            vendor_name=generator.choice(self.VENDORS),
+            amount_due=round(generator.lognormvariate(6.5, 1.0), 2),
+            due_date=(invoice_date + timedelta(days=generator.choice([14, 30, 45, 60]))).isoformat(),
+            invoice_date=invoice_date.isoformat(),
+            currency_code=generator.choice(self.CURRENCIES),
+            confidence_score=round(generator.uniform(0.8, 0.99), 2)
+        )
+
+
+# --- Registry ---
+
+_FACTORIES: Dict[str, Callable[[], ExtractionBackend]] = {
+    "gemini": GeminiBackend,
+    "local": LocalRulesBackend,
+    "fake": lambda: FakeBackend(
+        latency_median=settings.FAKE_EXTRACTION_LATENCY_SECONDS,
+        latency_sigma=settings.FAKE_EXTRACTION_LATENCY_SIGMA,
+        error_rate=settings.FAKE_EXTRACTION_ERROR_RATE,
+        seed=settings.FAKE_EXTRACTION_SEED
+    ),
+}
+
+_backend: Optional[ExtractionBackend] = None
+_backend_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], ExtractionBackend]) -> None:
+    """Make a backend selectable through EXTRACTION_BACKEND"""
+    _FACTORIES[name] = factory
+
+
+def get_backend() -> ExtractionBackend:
+    """
+    The process-wide backend selected by settings.EXTRACTION_BACKEND
+
+    Raises:
+        ValueError: If the setting names an unknown backend
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            name = settings.EXTRACTION_BACKEND.strip().lower()
+            if name not in _FACTORIES:
+                raise ValueError(
+                    f"Unknown EXTRACTION_BACKEND '{settings.EXTRACTION_BACKEND}'. "
+                    f"Choose one of: {', '.join(sorted(_FACTORIES))}"
+                )
+            _backend = _FACTORIES[name]()
+            logger.info("Extraction backend: %s", _backend.name)
+    return _backend
+
+
+def set_backend(backend: Optional[ExtractionBackend]) -> None:
+    """Replace the process-wide backend (None re-reads the setting on next use)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,434 @@
+"""
+Content-addressed cache for invoice extraction results
+Bounded in-memory LRU in front of a persistent on-disk tier, with single-flight
+so concurrent requests for the same file share one Gemini call
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.schemas.invoice import InvoiceExtractionResponse
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+class _InFlight:
+    """An extraction currently running for a cache key"""
+
+    def __init__(self):
+        self.event = threading.Event()  # Set for thread waiters when the flight ends
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []  # Async waiters
+        self.done = False
+        self.result: Optional[dict] = None
+        self.error: Optional[Exception] = None
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ExtractionCache:
+    """
+    Two-tier cache keyed by SHA-256 of file bytes + prompt + model
+
+    - Memory tier: OrderedDict LRU bounded by max_entries
+    - Disk tier: one JSON file per key, evicted oldest-first past max_disk_entries
+    - Single-flight: the first caller computes, others wait for its result
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        cache_dir: Optional[str] = None,
+        max_disk_entries: int = 10000,
+        ttl_seconds: int = 30 * 24 * 3600,
+        wait_timeout_seconds: float = 120.0
+    ):
+        """
+        Initialize extraction cache
+
+        Args:
+            max_entries: Maximum number of results kept in memory
+            cache_dir: Directory for the persistent tier (None disables it)
+            max_disk_entries: Maximum number of results kept on disk
+            ttl_seconds: Age after which a disk entry is ignored and removed
+            wait_timeout_seconds: How long a caller waits for another caller's
+                extraction of the same key before extracting on its own
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_count: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(file_hash: str, content_type: str, prompt: str, model: str) -> str:
+        """
+        Build a cache key for one extraction
+
+        Args:
+            file_hash: SHA-256 hex digest of the file bytes
+            content_type: MIME type used to pick the extraction path
+            prompt: Prompt text(s) sent to the model
+            model: Model name
+
+        Returns:
+            Hex digest identifying this (file, prompt, model) combination
+        """
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        raw = f"{file_hash}:{content_type}:{prompt_hash}:{model}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # --- Memory tier ---
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        return data
+
+    def _memory_set(self, key: str, data: dict) -> None:
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- Disk tier ---
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            self._disk_remove(path)
+            return None
+
+        # Touch so eviction approximates LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return entry.get("result")
+
+    def _disk_set(self, key: str, data: dict) -> None:
+        if not self.cache_dir:
+            return
+
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            is_new = not path.exists()
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"created_at": time.time(), "result": data}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write extraction cache entry: %s", e)
+            return
+
+        if is_new:
+            with self._disk_lock:
+                if self._disk_count is None:
+                    self._disk_count = sum(1 for _ in self.cache_dir.glob("*/*.json"))
+                else:
+                    self._disk_count += 1
+                if self._disk_count > self.max_disk_entries:
+                    self._evict_disk()
+
+    def _disk_remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            return
+        with self._disk_lock:
+            if self._disk_count:
+                self._disk_count -= 1
+
+    def _evict_disk(self) -> None:
+        """Remove the least recently used 10% of disk entries (caller holds _disk_lock)"""
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+
+        entries.sort()
+        target = int(self.max_disk_entries * 0.9)
+        to_remove = max(len(entries) - target, 0)
+        for _, path in entries[:to_remove]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+        self._disk_count = len(entries) - to_remove
+        logger.info("Evicted %d extraction cache entries from disk", to_remove)
+
+    # --- Public API ---
+
+    def get(self, key: str) -> Optional[InvoiceExtractionResponse]:
+        """
+        Look up a cached extraction
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Cached InvoiceExtractionResponse or None
+        """
+        with self._lock:
+            data = self._memory_get(key)
+
+        if data is None:
+            data = self._disk_get(key)
+            if data is not None:
+                with self._lock:
+                    self._memory_set(key, data)
+
+        if data is None:
+            return None
+        return InvoiceExtractionResponse(**data)
+
+    def set(self, key: str, result: InvoiceExtractionResponse) -> None:
+        """
+        Store an extraction result in both tiers
+
+        Args:
+            key: Cache key from make_key()
+            result: Extraction result to cache
+        """
+        self._store(key, result.model_dump())
+
+    def _store(self, key: str, data: dict) -> None:
+        with self._lock:
+            self._memory_set(key, data)
+        self._disk_set(key, data)
+
+    def _begin(self, key: str) -> Tuple[Optional[dict], _InFlight, bool]:
+        """
+        Check the memory tier and join or start the in-flight extraction for key
+
+        Returns:
+            (cached data or None, flight, True if this caller must compute)
+        """
+        with self._lock:
+            data = self._memory_get(key)
+            if data is not None:
+                self.hits += 1
+                logger.debug("Extraction cache hit (memory): %s", key[:12])
+                return data, None, False
+
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _InFlight()
+                self._inflight[key] = flight
+
+        if not is_leader:
+            logger.debug("Waiting for in-flight extraction: %s", key[:12])
+        return None, flight, is_leader
+
+    def _lookup_disk(self, key: str) -> Optional[dict]:
+        """Disk-tier lookup for the leader, promoting hits into memory"""
+        data = self._disk_get(key)
+        with self._lock:
+            if data is not None:
+                self.hits += 1
+                self._memory_set(key, data)
+            else:
+                self.misses += 1
+        if data is not None:
+            logger.debug("Extraction cache hit (disk): %s", key[:12])
+        return data
+
+    def _finish(self, key: str, flight: _InFlight) -> None:
+        """Release waiters of an in-flight extraction"""
+        with self._lock:
+            self._inflight.pop(key, None)
+            flight.done = True
+            waiters, flight.waiters = flight.waiters, []
+        flight.event.set()
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def _async_waiter(self, flight: _InFlight) -> Optional[asyncio.Future]:
+        """Future on the running loop resolved when the flight ends (None if it already has)"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        with self._lock:
+            if flight.done:
+                return None
+            flight.waiters.append((loop, waiter))
+        return waiter
+
+    @staticmethod
+    def _flight_result(flight: _InFlight) -> Optional[InvoiceExtractionResponse]:
+        """The leader's result, its error re-raised, or None if it was abandoned"""
+        if flight.error is not None:
+            raise flight.error
+        if flight.result is None:
+            return None
+        return InvoiceExtractionResponse(**flight.result)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], InvoiceExtractionResponse]
+    ) -> InvoiceExtractionResponse:
+        """
+        Return the cached result for key, computing it at most once
+
+        Concurrent callers with the same key block on the first caller's
+        extraction instead of starting their own (for at most
+        wait_timeout_seconds, then they extract on their own). Failures are
+        not cached; if the extracting caller is cancelled or interrupted
+        instead of failing, its waiters start over.
+
+        Args:
+            key: Cache key from make_key()
+            compute: Function performing the extraction on a miss
+
+        Returns:
+            InvoiceExtractionResponse
+        """
+        data, flight, is_leader = self._begin(key)
+        if data is not None:
+            return InvoiceExtractionResponse(**data)
+
+        if not is_leader:
+            if flight.event.wait(self.wait_timeout_seconds):
+                result = self._flight_result(flight)
+                if result is not None:
+                    return result
+                logger.debug("In-flight extraction was abandoned, retrying: %s", key[:12])
+                return self.get_or_compute(key, compute)
+            logger.warning("Gave up waiting for in-flight extraction: %s", key[:12])
+            result = compute()
+            self._store(key, result.model_dump())
+            return result
+
+        try:
+            data = self._lookup_disk(key)
+            if data is None:
+                result = compute()
+                data = result.model_dump()
+                self._store(key, data)
+
+            flight.result = data
+            return InvoiceExtractionResponse(**data)
+
+        except Exception as e:
+            # Only real failures are shared; a cancelled or interrupted leader
+            # leaves the flight empty so its waiters start over
+            flight.error = e
+            raise
+
+        finally:
+            self._finish(key, flight)
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[InvoiceExtractionResponse]]
+    ) -> InvoiceExtractionResponse:
+        """
+        Async variant of get_or_compute
+
+        Shares the same in-flight table, so an async upload and a threaded
+        email poller processing the same file still make a single call.
+        Waiting on another caller's extraction awaits a future resolved by
+        that caller (no executor thread is held); disk I/O runs in a thread.
+
+        Args:
+            key: Cache key from make_key()
+            compute: Coroutine function performing the extraction on a miss
+
+        Returns:
+            InvoiceExtractionResponse
+        """
+        data, flight, is_leader = self._begin(key)
+        if data is not None:
+            return InvoiceExtractionResponse(**data)
+
+        if not is_leader:
+            waiter = self._async_waiter(flight)
+            try:
+                if waiter is not None:
+                    await asyncio.wait_for(waiter, self.wait_timeout_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("Gave up waiting for in-flight extraction: %s", key[:12])
+            else:
+                result = self._flight_result(flight)
+                if result is not None:
+                    return result
+                logger.debug("In-flight extraction was abandoned, retrying: %s", key[:12])
+                return await self.aget_or_compute(key, compute)
+            result = await compute()
+            await asyncio.to_thread(self._store, key, result.model_dump())
+            return result
+
+        try:
+            data = await asyncio.to_thread(self._lookup_disk, key)
+            if data is None:
+                result = await compute()
+                data = result.model_dump()
+                await asyncio.to_thread(self._store, key, data)
+
+            flight.result = data
+            return InvoiceExtractionResponse(**data)
+
+        except Exception as e:
+            # Only real failures are shared; a cancelled or interrupted leader
+            # leaves the flight empty so its waiters start over
+            flight.error = e
+            raise
+
+        finally:
+            self._finish(key, flight)
+
+    def clear(self) -> None:
+        """Drop the memory tier (disk entries expire via TTL/eviction)"""
+        with self._lock:
+            self._memory.clear()
+
+
+# Global extraction cache instance
+extraction_cache = ExtractionCache(
+    max_entries=settings.EXTRACTION_CACHE_MAX_ENTRIES,
+    cache_dir=settings.EXTRACTION_CACHE_DIR,
+    max_disk_entries=settings.EXTRACTION_CACHE_MAX_DISK_ENTRIES,
+    ttl_seconds=settings.EXTRACTION_CACHE_TTL_SECONDS,
+    wait_timeout_seconds=settings.EXTRACTION_CACHE_WAIT_TIMEOUT_SECONDS
+)
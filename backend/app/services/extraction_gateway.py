@@ -0,0 +1,462 @@
+"""
+Shared gateway for Gemini generate_content calls
+Every extraction (uploads, email polling, sync and async paths) goes through
+one gateway per process that caps concurrent calls, rate-limits with a token
+bucket, retries throttling and transient errors with jittered exponential
+backoff (honoring Retry-After), and enforces a deadline per call.
+"""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Optional
+from fastapi import HTTPException
+from google.genai import errors as genai_errors
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by sync and async callers
+
+    reserve() takes a token immediately (the balance may go negative) and
+    returns how long the caller must wait before using it, so callers queue
+    up in arrival order without holding a lock while they sleep.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int):
+        """
+        Args:
+            rate_per_second: Refill rate (0 = unlimited)
+            burst: Bucket capacity
+        """
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take one token
+
+        Returns:
+            Seconds to wait before the token may be used
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class _SlotWaiter:
+    """A caller queued for a slot: a thread (event) or a coroutine (future on its loop)"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self) -> bool:
+        """Hand this waiter a slot; False if its event loop is gone"""
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_grant, self.future)
+        except RuntimeError:
+            return False
+        return True
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FairSlots:
+    """
+    Concurrency cap shared by threads and coroutines
+
+    Waiters of both kinds queue in one FIFO and a released slot is handed
+    straight to the oldest one, so neither kind can starve the other.
+    Coroutines wait on a future instead of polling.
+    """
+
+    def __init__(self, size: int):
+        """
+        Args:
+            size: Number of slots
+        """
+        self._free = size
+        self._waiters: Deque[_SlotWaiter] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Take a slot, blocking the calling thread
+
+        Returns:
+            False if no slot became free within timeout seconds
+        """
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            waiter = _SlotWaiter()
+            self._waiters.append(waiter)
+        if waiter.event.wait(timeout):
+            return True
+        return not self._withdraw(waiter)
+
+    async def aacquire(self, timeout: float) -> bool:
+        """
+        Take a slot without blocking the event loop
+
+        Returns:
+            False if no slot became free within timeout seconds
+        """
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            waiter = _SlotWaiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self._withdraw(waiter)
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                self.release()  # Handed a slot as we were cancelled
+            raise
+
+    def release(self) -> None:
+        """Return a slot, handing it to the oldest waiter if there is one"""
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft().wake():
+                    return
+            self._free += 1
+
+    def _withdraw(self, waiter: _SlotWaiter) -> bool:
+        """Leave the queue after giving up; False if a slot was already handed over"""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            return True
+
+
+class ExtractionGateway:
+    """
+    Concurrency cap + rate limiter + retry policy around the Gemini client
+
+    - at most max_concurrency calls are in flight per process
+    - calls are spaced by a token bucket (rate_per_minute, burst)
+    - 429/5xx/network errors are retried with full-jitter exponential
+      backoff; a server-provided Retry-After or RetryInfo delay wins
+    - the whole call (queueing, attempts, backoff) must finish within
+      deadline seconds; each attempt gets the remaining time as its HTTP
+      timeout and async attempts are cancelled when it runs out
+    - when retries are exhausted on throttling, callers get a 503 with a
+      Retry-After header instead of a generic 500
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        rate_per_minute: float = 60.0,
+        burst: int = 10,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        deadline: float = 90.0
+    ):
+        """
+        Initialize extraction gateway
+
+        Args:
+            max_concurrency: Concurrent generate_content calls (0 = unlimited)
+            rate_per_minute: Sustained call rate (0 = unlimited)
+            burst: Calls allowed back to back before rate limiting kicks in
+            max_retries: Retries after the first attempt
+            base_delay: Backoff for the first retry in seconds
+            max_delay: Upper bound on a single backoff
+            deadline: Seconds a call may take end to end, including retries
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+        self._slots = FairSlots(max_concurrency) if max_concurrency > 0 else None
+        self._bucket = TokenBucket(rate_per_minute / 60.0, burst)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "throttled": 0,
+            "timeouts": 0,
+            "failures": 0,
+            "in_flight": 0,
+            "queue_wait_total_seconds": 0.0,
+            "queue_wait_max_seconds": 0.0,
+        }
+
+    # --- Public API ---
+
+    def generate_content(self, client: Any, model: str, contents: list, config: dict) -> Any:
+        """
+        Call client.models.generate_content through the gateway
+
+        Args:
+            client: google.genai Client
+            model: Model name
+            contents: Request contents
+            config: Generation config (an HTTP timeout is added per attempt)
+
+        Returns:
+            GenerateContentResponse
+
+        Raises:
+            HTTPException: 503 when throttling outlasts the retries, 504 on deadline
+            Exception: Non-retryable client errors, unchanged
+        """
+        deadline_at = time.monotonic() + self.deadline
+        self._record(calls=1)
+
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.monotonic()
+            wait = self._bucket.reserve()
+            if wait > self._remaining(deadline_at):
+                raise self._deadline_error()
+            if wait > 0:
+                time.sleep(wait)
+
+            if self._slots is not None and not self._slots.acquire(self._remaining(deadline_at)):
+                raise self._deadline_error()
+            self._record_queue_wait(time.monotonic() - queued_at)
+
+            try:
+                self._record(attempts=1, in_flight=1)
+                return client.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=self._with_timeout(config, deadline_at)
+                )
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline_at)
+            finally:
+                self._record(in_flight=-1)
+                if self._slots is not None:
+                    self._slots.release()
+
+            time.sleep(delay)
+
+    async def agenerate_content(self, client: Any, model: str, contents: list, config: dict) -> Any:
+        """
+        Async variant of generate_content using client.aio; the attempt is
+        cancelled when the deadline passes
+        """
+        deadline_at = time.monotonic() + self.deadline
+        self._record(calls=1)
+
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.monotonic()
+            wait = self._bucket.reserve()
+            if wait > self._remaining(deadline_at):
+                raise self._deadline_error()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            if self._slots is not None and not await self._slots.aacquire(self._remaining(deadline_at)):
+                raise self._deadline_error()
+            self._record_queue_wait(time.monotonic() - queued_at)
+
+            try:
+                self._record(attempts=1, in_flight=1)
+                return await asyncio.wait_for(
+                    client.aio.models.generate_content(
+                        model=model,
+                        contents=contents,
+                        config=self._with_timeout(config, deadline_at)
+                    ),
+                    timeout=self._remaining(deadline_at)
+                )
+            except Exception as e:
+                # wait_for only times out once the deadline is spent; a client
+                # TimeoutError before that is one failed attempt
+                if _is_timeout(e) and not self._remaining(deadline_at):
+                    raise self._deadline_error()
+                delay = self._retry_delay(e, attempt, deadline_at)
+            finally:
+                self._record(in_flight=-1)
+                if self._slots is not None:
+                    self._slots.release()
+
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """Snapshot of call counters and queue wait times"""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        attempts = snapshot["attempts"]
+        snapshot["queue_wait_avg_seconds"] = (
+            snapshot["queue_wait_total_seconds"] / attempts if attempts else 0.0
+        )
+        return snapshot
+
+    # --- Internals ---
+
+    def _remaining(self, deadline_at: float) -> float:
+        return max(deadline_at - time.monotonic(), 0.0)
+
+    def _with_timeout(self, config: dict, deadline_at: float) -> dict:
+        """Copy of the generation config whose HTTP timeout is the remaining deadline"""
+        timeout_ms = max(int(self._remaining(deadline_at) * 1000), 1)
+        return {**config, "http_options": {"timeout": timeout_ms}}
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline_at: float) -> float:
+        """
+        Decide whether a failed attempt is retried
+
+        Args:
+            error: Exception raised by the attempt
+            attempt: Zero-based attempt number
+            deadline_at: Monotonic deadline of the whole call
+
+        Returns:
+            Seconds to sleep before the next attempt
+
+        Raises:
+            The original error if it isn't retryable, or an HTTPException
+            once retries or the deadline are exhausted
+        """
+        code = _status_code(error)
+        if code is None and not _is_transient(error):
+            self._record(failures=1)
+            raise error
+        if code is not None and code not in RETRYABLE_STATUS_CODES:
+            self._record(failures=1)
+            raise error
+
+        if code == 429:
+            self._record(throttled=1)
+        if code in (408, 504) or _is_timeout(error):
+            self._record(timeouts=1)
+
+        retry_after = _retry_after(error)
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        delay = max(backoff, retry_after or 0.0)
+
+        if attempt >= self.max_retries or delay >= self._remaining(deadline_at):
+            self._record(failures=1)
+            logger.error("Gemini call failed after %d attempt(s): %s", attempt + 1, error)
+            raise self._unavailable_error(error, retry_after or backoff)
+
+        self._record(retries=1)
+        logger.warning("Gemini call failed (%s), retrying in %.1fs", code or type(error).__name__, delay)
+        return delay
+
+    def _unavailable_error(self, error: Exception, retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=f"AI extraction service is busy, please retry later: {error}",
+            headers={"Retry-After": str(max(int(retry_after + 0.999), 1))}
+        )
+
+    def _deadline_error(self) -> HTTPException:
+        self._record(timeouts=1, failures=1)
+        logger.error("Gemini call exceeded its %gs deadline", self.deadline)
+        return HTTPException(
+            status_code=504,
+            detail=f"AI extraction did not finish within {self.deadline:g}s"
+        )
+
+    def _record(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def _record_queue_wait(self, seconds: float) -> None:
+        with self._stats_lock:
+            self._stats["queue_wait_total_seconds"] += seconds
+            self._stats["queue_wait_max_seconds"] = max(self._stats["queue_wait_max_seconds"], seconds)
+        if seconds >= 1.0:
+            logger.info("Gemini call waited %.1fs for a slot", seconds)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a google-genai APIError (None for other exceptions)"""
+    if isinstance(error, genai_errors.APIError):
+        try:
+            return int(error.code)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__
+
+
+def _is_transient(error: Exception) -> bool:
+    """Network-level failures (connection reset, read timeout) are retryable"""
+    return _is_timeout(error) or isinstance(error, ConnectionError) or type(error).__name__ in (
+        "ConnectionError", "ConnectTimeout", "ReadTimeout", "ChunkedEncodingError"
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Server-requested delay from a Retry-After header or a RetryInfo detail
+
+    Returns:
+        Seconds, or None if the server didn't say
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    details = getattr(error, "details", None)
+    match = re.search(r"['\"]retryDelay['\"]:\s*['\"]([\d.]+)s['\"]", str(details)) if details else None
+    return float(match.group(1)) if match else None
+
+
+# Global extraction gateway instance
+extraction_gateway = ExtractionGateway(
+    max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+    rate_per_minute=settings.GEMINI_RATE_LIMIT_PER_MINUTE,
+    burst=settings.GEMINI_RATE_LIMIT_BURST,
+    max_retries=settings.GEMINI_MAX_RETRIES,
+    base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+    max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS,
+    deadline=settings.GEMINI_CALL_DEADLINE_SECONDS
+)
@@ -0,0 +1,491 @@
+"""
+Gemini extraction calls: prompts, request building and response parsing
+Moved out of invoice_processing so the model can be swapped for another
+extraction backend (see extraction_backends)
+"""
+import os
+import json
+import logging
+import threading
+from google import genai
+from google.genai import types
+from PIL import Image
+from fastapi import HTTPException
+from typing import List, Optional, Union
+from app.schemas.invoice import InvoiceExtractionResponse
+from app.core.config import settings
+from app.core.metrics import track_stage
+from app.services.extraction_gateway import extraction_gateway
+from app.services.image_preparation import PreparedImage
+
+
+logger = logging.getLogger(__name__)
+
+
+# --- Gemini Client (created on first use) ---
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Shared Gemini client, created on first use so importing this module
+    (or running another extraction backend) needs no API key
+    
+    Returns:
+        genai.Client, or None if it could not be configured
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            # Get API key from settings
+            api_key = settings.GOOGLE_API_KEY if hasattr(settings, 'GOOGLE_API_KEY') else os.getenv("GOOGLE_API_KEY")
+            
+            if not api_key:
+                logger.critical("GOOGLE_API_KEY not found in environment variables, add it to your .env file")
+                return None
+            _client = genai.Client(api_key=api_key)
+            logger.info("Gemini client initialized")
+        except Exception:
+            logger.critical("Error configuring Gemini API", exc_info=True)
+            return None
+    return _client
+
+
+def set_client(client) -> None:
+    """Replace the shared client (e.g. with a stand-in for benchmarks)"""
+    global _client
+    _client = client
+
+
+GEMINI_MODEL = settings.GEMINI_MODEL
+
+
+# --- Prompts (EXACT COPY from processing_service.py) ---
+BASE_PROMPT = """
+You are an expert at understanding invoices and billing documents.
+Extract the following fields if present and return ONLY valid JSON (no prose):
+
+IMPORTANT: Use these EXACT field names (snake_case):
+{{
+  "invoice_id": string|null,
+  "vendor_name": string|null,
+  "amount_due": number|null,
+  "due_date": string (YYYY-MM-DD format)|null,
+  "invoice_date": string (YYYY-MM-DD format)|null,
+  "currency_code": string (ISO 4217: USD, INR, EUR, GBP, etc.)|null,
+  "confidence_score": number (0.0 to 1.0)
+}}
+
+Field descriptions:
+- invoice_id: The unique invoice or bill number
+- vendor_name: The company or person issuing the invoice
+- amount_due: The total amount to be paid (numeric value only, no currency symbols)
+- due_date: Payment deadline in YYYY-MM-DD format
+- invoice_date: Date the invoice was issued in YYYY-MM-DD format
+- currency_code: 3-letter ISO currency code (USD, INR, EUR, GBP, CAD, AUD, etc.)
+- confidence_score: Your confidence in the extraction (0.0 = no confidence, 1.0 = very confident)
+
+Rules:
+- If a field is not found, set it to null
+- Return dates in ISO 8601 format (YYYY-MM-DD)
+- Return currency as 3-letter uppercase ISO code
+- Extract amount as number without currency symbols
+- Return ONLY the JSON object, no additional text
+"""
+
+TEXT_PROMPT_TEMPLATE = BASE_PROMPT + """
+
+Here is the invoice text:
+---
+{invoice_text}
+---
+"""
+
+IMAGE_PROMPT_TEMPLATE = BASE_PROMPT + """
+
+Here is the invoice (as one or more images). Extract the data from them.
+"""
+
+PDF_PROMPT_TEMPLATE = BASE_PROMPT + """
+
+Here is the invoice as a PDF document. Extract the data from it.
+"""
+
+MIXED_PROMPT_TEMPLATE = BASE_PROMPT + """
+
+The invoice has typed pages and scanned pages. Here is the text of the typed pages:
+---
+{invoice_text}
+---
+
+Scanned page(s) {scanned_pages} follow as images, in page order. Use the text
+and the images together; the totals may be on either.
+"""
+
+BATCH_TEXT_PROMPT_TEMPLATE = BASE_PROMPT + """
+
+The input below contains {count} separate invoices. Each one starts with a
+line "=== DOCUMENT n ===" and ends with a line "=== END DOCUMENT n ===".
+Extract every document independently; never mix fields between documents.
+
+Instead of a single object, return ONLY a JSON array with exactly {count}
+objects in document order. Each object has the fields above plus
+"document_index": the number n from that document's markers.
+
+{documents}
+"""
+
+BATCH_DOCUMENT_TEMPLATE = """=== DOCUMENT {index} ===
+{invoice_text}
+=== END DOCUMENT {index} ===
+"""
+
+
+# --- Generation Configuration ---
+generation_config = {
+    "temperature": 0.0,
+    "response_mime_type": "application/json",
+}
+
+
+# --- Core AI Functions ---
+
+def _require_client():
+    """Return the Gemini client, raising if it could not be initialized"""
+    client = get_client()
+    if client is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Gemini API client not initialized. Please check your GOOGLE_API_KEY."
+        )
+    return client
+
+
+def _parse_gemini_response(response, mode: str) -> InvoiceExtractionResponse:
+    """
+    Turn a Gemini response into a validated InvoiceExtractionResponse
+    
+    Args:
+        response: GenerateContentResponse from the sync or async client
+        mode: Label used in log lines (TEXT or IMAGE)
+    """
+    with track_stage("validate", mode.lower()):
+        try:
+            json_output = response.text.strip()
+            logger.debug("Raw Gemini response (%s): %r", mode, response)  # repr only built at DEBUG
+        
+            # Check if response is empty
+            if not json_output:
+                raise ValueError("Gemini returned an empty response")
+        
+            # Remove double curly braces if present (Gemini sometimes adds them)
+            if json_output.startswith("{{") and json_output.endswith("}}"):
+                json_output = json_output[1:-1].strip()
+                logger.debug("Removed double curly braces from the %s response", mode)
+        
+            data = json.loads(json_output)
+            validated_data = InvoiceExtractionResponse(**data)
+        
+            logger.debug("Successfully processed %s", mode)
+            return validated_data
+
+        except json.JSONDecodeError as e:
+            logger.error("JSON decode error (%s): %s", mode, e)
+            logger.debug("Attempted to parse: %s", json_output)
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Failed to parse Gemini response as JSON: {e}"
+            )
+        except Exception as e:
+            logger.error("An error occurred during %s processing: %s", mode, e)
+            raise HTTPException(
+                status_code=500, 
+                detail=f"An internal error occurred: {e}"
+            )
+
+
+def _gemini_error(e: Exception, mode: str) -> HTTPException:
+    """Wrap a Gemini client failure in an HTTPException"""
+    logger.error("An error occurred during %s processing: %s", mode, e)
+    return HTTPException(
+        status_code=500, 
+        detail=f"An internal error occurred: {e}"
+    )
+
+
+def get_invoice_data_from_text(text: str) -> InvoiceExtractionResponse:
+    """
+    Sends text to Gemini and returns validated Pydantic model.
+    """
+    client = _require_client()
+    final_prompt = TEXT_PROMPT_TEMPLATE.format(invoice_text=text)
+    
+    try:
+        response = extraction_gateway.generate_content(
+            client, GEMINI_MODEL, [final_prompt], generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "TEXT")
+    
+    return _parse_gemini_response(response, "TEXT")
+
+
+def _parse_batch_response(response, count: int) -> List[Optional[InvoiceExtractionResponse]]:
+    """
+    Map a batched Gemini response back to its documents
+    
+    Args:
+        response: GenerateContentResponse for a BATCH_TEXT_PROMPT_TEMPLATE request
+        count: Number of documents in the request
+    
+    Returns:
+        One entry per document; None where the item is missing or invalid
+    """
+    results: List[Optional[InvoiceExtractionResponse]] = [None] * count
+    
+    try:
+        data = json.loads(response.text.strip())
+    except (json.JSONDecodeError, AttributeError, ValueError) as e:
+        logger.error("JSON decode error (BATCH): %s", e)
+        return results
+    
+    # Tolerate the array being wrapped in an object, e.g. {"invoices": [...]}
+    if isinstance(data, dict):
+        data = next((value for value in data.values() if isinstance(value, list)), None)
+    if not isinstance(data, list):
+        logger.error("Batch response is not a JSON array")
+        return results
+    
+    for position, item in enumerate(data):
+        if not isinstance(item, dict):
+            continue
+        index = item.pop("document_index", None)
+        if not isinstance(index, int) or not 1 <= index <= count:
+            # Fall back to array order when the model drops or garbles the index
+            if len(data) != count:
+                continue
+            index = position + 1
+        if results[index - 1] is not None:
+            continue
+        try:
+            results[index - 1] = InvoiceExtractionResponse(**item)
+        except Exception as e:
+            logger.warning("Batch item %s failed validation: %s", index, e)
+    
+    return results
+
+
+def get_invoice_data_from_texts(texts: List[str]) -> List[Optional[InvoiceExtractionResponse]]:
+    """
+    Sends several invoice texts to Gemini in one request.
+    
+    Args:
+        texts: Text layer of each invoice
+    
+    Returns:
+        One entry per text, in order; None for documents the batch response
+        didn't cover (callers retry those with get_invoice_data_from_text)
+    
+    Raises:
+        HTTPException: If the request itself fails (e.g. the gateway's 503 or
+        504); the documents are not retried one by one, which would only
+        multiply the load on an overloaded model
+    """
+    client = _require_client()
+    documents = "\n".join(
+        BATCH_DOCUMENT_TEMPLATE.format(index=index, invoice_text=text)
+        for index, text in enumerate(texts, start=1)
+    )
+    final_prompt = BATCH_TEXT_PROMPT_TEMPLATE.format(count=len(texts), documents=documents)
+    
+    try:
+        response = extraction_gateway.generate_content(
+            client, GEMINI_MODEL, [final_prompt], generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "BATCH")
+    
+    results = _parse_batch_response(response, len(texts))
+    logger.info("Batch extracted %d/%d documents", sum(r is not None for r in results), len(texts))
+    return results
+
+
+def _image_parts(images: List[Union[PreparedImage, Image.Image]]) -> list:
+    """
+    Build request parts for page images. Prepared images are sent as their
+    already-encoded bytes so the client doesn't serialize them again.
+    """
+    parts = []
+    for image in images:
+        if isinstance(image, PreparedImage):
+            parts.append(types.Part.from_bytes(data=image.data, mime_type=image.mime_type))
+        else:
+            parts.append(image)
+    return parts
+
+
+def get_invoice_data_from_images(images: List[Union[PreparedImage, Image.Image]]) -> InvoiceExtractionResponse:
+    """
+    Sends images to Gemini (multimodal) and returns validated data.
+    """
+    client = _require_client()
+    content = [IMAGE_PROMPT_TEMPLATE]
+    content.extend(_image_parts(images))
+    
+    try:
+        response = extraction_gateway.generate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "IMAGE")
+    
+    return _parse_gemini_response(response, "IMAGE")
+
+
+def get_invoice_data_from_pdf(data: bytes) -> InvoiceExtractionResponse:
+    """
+    Sends a PDF to Gemini as a document part (no local rasterization)
+    and returns validated data.
+    """
+    client = _require_client()
+    content = [PDF_PROMPT_TEMPLATE, types.Part.from_bytes(data=bytes(data), mime_type="application/pdf")]
+    
+    try:
+        response = extraction_gateway.generate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "PDF")
+    
+    return _parse_gemini_response(response, "PDF")
+
+
+def _mixed_content(text: str, images: List[Union[PreparedImage, Image.Image]], scanned_pages: List[int]) -> list:
+    """Prompt with the typed pages' text, followed by the scanned pages' images"""
+    pages = ", ".join(str(index + 1) for index in scanned_pages)
+    content = [MIXED_PROMPT_TEMPLATE.format(invoice_text=text, scanned_pages=pages)]
+    content.extend(_image_parts(images))
+    return content
+
+
+def get_invoice_data_from_mixed(
+    text: str,
+    images: List[Union[PreparedImage, Image.Image]],
+    scanned_pages: List[int]
+) -> InvoiceExtractionResponse:
+    """
+    Sends a mixed PDF to Gemini in one multimodal request: text for its
+    typed pages, images for its scanned pages.
+    
+    Args:
+        text: Text layer of the typed pages
+        images: Prepared images of the scanned pages
+        scanned_pages: Zero-based page numbers behind images (for the prompt)
+    """
+    client = _require_client()
+    content = _mixed_content(text, images, scanned_pages)
+    
+    try:
+        response = extraction_gateway.generate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "MIXED")
+    
+    return _parse_gemini_response(response, "MIXED")
+
+
+async def get_invoice_data_from_text_async(text: str) -> InvoiceExtractionResponse:
+    """
+    Async variant of get_invoice_data_from_text using the aio Gemini client.
+    """
+    client = _require_client()
+    final_prompt = TEXT_PROMPT_TEMPLATE.format(invoice_text=text)
+    
+    try:
+        response = await extraction_gateway.agenerate_content(
+            client, GEMINI_MODEL, [final_prompt], generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "TEXT")
+    
+    return _parse_gemini_response(response, "TEXT")
+
+
+async def get_invoice_data_from_images_async(images: List[Union[PreparedImage, Image.Image]]) -> InvoiceExtractionResponse:
+    """
+    Async variant of get_invoice_data_from_images using the aio Gemini client.
+    """
+    client = _require_client()
+    content = [IMAGE_PROMPT_TEMPLATE]
+    content.extend(_image_parts(images))
+    
+    try:
+        response = await extraction_gateway.agenerate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "IMAGE")
+    
+    return _parse_gemini_response(response, "IMAGE")
+
+
+async def get_invoice_data_from_pdf_async(data: bytes) -> InvoiceExtractionResponse:
+    """
+    Async variant of get_invoice_data_from_pdf using the aio Gemini client.
+    """
+    client = _require_client()
+    content = [PDF_PROMPT_TEMPLATE, types.Part.from_bytes(data=bytes(data), mime_type="application/pdf")]
+    
+    try:
+        response = await extraction_gateway.agenerate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "PDF")
+    
+    return _parse_gemini_response(response, "PDF")
+
+
+async def get_invoice_data_from_mixed_async(
+    text: str,
+    images: List[Union[PreparedImage, Image.Image]],
+    scanned_pages: List[int]
+) -> InvoiceExtractionResponse:
+    """
+    Async variant of get_invoice_data_from_mixed using the aio Gemini client.
+    """
+    client = _require_client()
+    content = _mixed_content(text, images, scanned_pages)
+    
+    try:
+        response = await extraction_gateway.agenerate_content(
+            client, GEMINI_MODEL, content, generation_config
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _gemini_error(e, "MIXED")
+    
+    return _parse_gemini_response(response, "MIXED")
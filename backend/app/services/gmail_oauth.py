@@ -5,6 +5,7 @@ Handles Gmail API authentication and email retrieval using OAuth 2.0
 import os
 import base64
 import json
+import logging
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 from google.auth.transport.requests import Request
@@ -18,6 +19,9 @@ from app.services.encryption import encryption_service
 from app.models.email_credential import EmailCredential
 
 
+logger = logging.getLogger(__name__)
+
+
 class GmailOAuthService:
     """
     Service for Gmail OAuth authentication and email operations
@@ -117,7 +121,7 @@ class GmailOAuthService:
             Valid Credentials object or None if authentication fails
         """
         if not self.email_credential.oauth_token:
-            print(f"❌ No OAuth token found for {self.email_credential.email_address}")
+            logger.warning("No OAuth token found", extra={"user_id": self.email_credential.user_id})
             return None
         
         try:
@@ -142,7 +146,7 @@ class GmailOAuthService:
             # Refresh token if expired
             if not creds.valid:
                 if creds.expired and creds.refresh_token:
-                    print(f"🔄 Refreshing OAuth token for {self.email_credential.email_address}")
+                    logger.info("Refreshing OAuth token", extra={"user_id": self.email_credential.user_id})
                     creds.refresh(Request())
                     
                     # Update stored credentials
@@ -161,15 +165,18 @@ class GmailOAuthService:
                     self.email_credential.oauth_token_expiry = creds.expiry
                     self.db.commit()
                     
-                    print(f"✅ Token refreshed successfully")
+                    logger.info("Token refreshed", extra={"user_id": self.email_credential.user_id})
                 else:
-                    print(f"❌ Token expired and no refresh token available")
+                    logger.warning(
+                        "Token expired and no refresh token available",
+                        extra={"user_id": self.email_credential.user_id}
+                    )
                     return None
             
             return creds
             
         except Exception as e:
-            print(f"❌ Error getting credentials: {e}")
+            logger.error("Error getting credentials: %s", e, extra={"user_id": self.email_credential.user_id})
             return None
     
     def connect(self) -> bool:
@@ -188,14 +195,13 @@ class GmailOAuthService:
             self.service = build('gmail', 'v1', credentials=creds)
             
             # Test connection by getting profile
-            profile = self.service.users().getProfile(userId='me').execute()
-            email = profile.get('emailAddress')
+            self.service.users().getProfile(userId='me').execute()
             
-            print(f"✅ Connected to Gmail API: {email}")
+            logger.info("Connected to Gmail API", extra={"user_id": self.email_credential.user_id})
             return True
             
         except Exception as e:
-            print(f"❌ Gmail API connection failed: {e}")
+            logger.error("Gmail API connection failed: %s", e, extra={"user_id": self.email_credential.user_id})
             self.email_credential.last_error = str(e)
             self.email_credential.last_poll_status = "error"
             self.db.commit()
@@ -244,7 +250,7 @@ class GmailOAuthService:
             return full_messages
             
         except HttpError as error:
-            print(f"❌ Error fetching messages: {error}")
+            logger.error("Error fetching messages: %s", error)
             return []
     
     def get_message_attachments(self, message_id: str) -> List[Tuple[str, bytes]]:
@@ -291,7 +297,7 @@ class GmailOAuthService:
             return attachments
             
         except HttpError as error:
-            print(f"❌ Error fetching attachments: {error}")
+            logger.error("Error fetching attachments: %s", error)
             return []
     
     def mark_as_read(self, message_id: str) -> bool:
@@ -317,7 +323,7 @@ class GmailOAuthService:
             return True
             
         except HttpError as error:
-            print(f"❌ Error marking message as read: {error}")
+            logger.error("Error marking message as read: %s", error)
             return False
     
     def get_message_details(self, message_data: dict) -> Dict[str, str]:
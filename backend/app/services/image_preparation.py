@@ -0,0 +1,475 @@
+"""
+Image preparation for multimodal Gemini requests
+Picks a render resolution from the page size and a pixel budget, drops color
+when a page has none, and encodes each page once to compact JPEG/WebP bytes.
+Photos are decoded at reduced scale, turned upright from their EXIF
+orientation and optionally cropped to the document before encoding. Scanned
+pages that are a single embedded JPEG are sent as that JPEG, unrendered.
+Runs inside document engine workers, so it takes no app settings directly.
+"""
+import math
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+import fitz  # PyMuPDF
+from PIL import Image, ImageFilter, ImageOps
+
+
+class ImagePreparationOptions:
+    """Tunables for image preparation (picklable, built from settings by callers)"""
+
+    def __init__(
+        self,
+        pixel_budget: int = 3_000_000,
+        max_dpi: int = 200,
+        min_dpi: int = 96,
+        max_long_edge: int = 2400,
+        image_format: str = "JPEG",
+        quality: int = 80,
+        detect_grayscale: bool = True,
+        auto_crop: bool = False,
+        embedded_passthrough: bool = True
+    ):
+        """
+        Args:
+            pixel_budget: Target pixel count per page image
+            max_dpi: Upper bound on render resolution for PDF pages
+            min_dpi: Lower bound so small print stays legible
+            max_long_edge: Longest side allowed for photos and rendered pages
+            image_format: JPEG or WEBP
+            quality: Encoder quality (1-100)
+            detect_grayscale: Convert pages without meaningful color to grayscale
+            auto_crop: Crop photos to the document (bright paper on a darker background)
+            embedded_passthrough: Send a page that is one embedded JPEG as that JPEG
+        """
+        self.pixel_budget = pixel_budget
+        self.max_dpi = max_dpi
+        self.min_dpi = min_dpi
+        self.max_long_edge = max_long_edge
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.detect_grayscale = detect_grayscale
+        self.auto_crop = auto_crop
+        self.embedded_passthrough = embedded_passthrough
+
+
+class PreparedImage:
+    """
+    One encoded page ready to send to Gemini, plus what it cost to make
+
+    - data / mime_type: encoded bytes as sent in the request
+    - baseline_bytes: size of the raw RGB bitmap we used to send instead
+    - timings: seconds spent per stage (render/decode, resize, color, encode)
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        mime_type: str,
+        size: Tuple[int, int],
+        mode: str,
+        baseline_bytes: int,
+        timings: Dict[str, float]
+    ):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.mode = mode
+        self.baseline_bytes = baseline_bytes
+        self.timings = timings
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(self.baseline_bytes - len(self.data), 0)
+
+    def to_pil(self) -> Image.Image:
+        """Decode back to a PIL image (for legacy callers)"""
+        return Image.open(BytesIO(self.data))
+
+
+# Baseline we compare against: RGB pixmap at the old fixed 200 DPI
+BASELINE_DPI = 200
+
+
+def choose_dpi(page_rect: fitz.Rect, options: ImagePreparationOptions) -> int:
+    """
+    Pick the render DPI that fits a page into the pixel budget
+
+    Args:
+        page_rect: Page bounds in points (1/72 inch)
+        options: Preparation options
+
+    Returns:
+        DPI clamped to [min_dpi, max_dpi]
+    """
+    width_in = max(page_rect.width / 72.0, 0.1)
+    height_in = max(page_rect.height / 72.0, 0.1)
+    dpi = math.sqrt(options.pixel_budget / (width_in * height_in))
+    dpi = min(dpi, options.max_long_edge / max(width_in, height_in))
+    return int(max(options.min_dpi, min(options.max_dpi, dpi)))
+
+
+def has_meaningful_color(img: Image.Image, chroma_threshold: int = 40, min_fraction: float = 0.002) -> bool:
+    """
+    Check whether an image carries color worth sending
+
+    Works on a small thumbnail: counts pixels whose HSV saturation and value
+    are both above chroma_threshold (i.e. visibly colored, not gray or black).
+
+    Args:
+        img: Image to inspect
+        chroma_threshold: Saturation/value level (0-255) treated as colored
+        min_fraction: Fraction of colored pixels needed to keep color
+
+    Returns:
+        True if the image should stay RGB
+    """
+    if img.mode in ("1", "L", "LA", "I", "F"):
+        return False
+
+    scale = 128.0 / max(img.size)
+    thumb_size = (max(1, int(img.size[0] * scale)), max(1, int(img.size[1] * scale)))
+    thumb = img.resize(thumb_size, Image.BOX).convert("RGB")
+    hue, saturation, value = thumb.convert("HSV").split()
+    saturated = saturation.point(lambda s: 255 if s > chroma_threshold else 0)
+    bright = value.point(lambda v: 255 if v > chroma_threshold else 0)
+    colored = Image.composite(saturated, Image.new("L", thumb.size, 0), bright)
+    colored_pixels = colored.histogram()[255]
+    return colored_pixels / (thumb.size[0] * thumb.size[1]) >= min_fraction
+
+
+def _mime_type(image_format: str) -> str:
+    return "image/webp" if image_format == "WEBP" else "image/jpeg"
+
+
+def encode_image(
+    img: Image.Image,
+    options: ImagePreparationOptions,
+    timings: Dict[str, float],
+    baseline_bytes: int
+) -> PreparedImage:
+    """
+    Cap the size, optionally drop color, and encode once
+
+    Args:
+        img: Decoded or rendered image
+        options: Preparation options
+        timings: Stage timings collected so far (updated in place)
+        baseline_bytes: Raw size of what we would have sent before
+
+    Returns:
+        PreparedImage
+    """
+    start = time.perf_counter()
+    if max(img.size) > options.max_long_edge:
+        img.thumbnail((options.max_long_edge, options.max_long_edge), Image.LANCZOS)
+    timings["resize"] = timings.get("resize", 0.0) + time.perf_counter() - start
+
+    start = time.perf_counter()
+    if options.detect_grayscale and not has_meaningful_color(img):
+        img = img.convert("L")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    timings["color"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = BytesIO()
+    if options.image_format == "WEBP":
+        img.save(buffer, format="WEBP", quality=options.quality, method=4)
+    else:
+        img.save(buffer, format="JPEG", quality=options.quality, optimize=True)
+    timings["encode"] = time.perf_counter() - start
+
+    return PreparedImage(
+        data=buffer.getvalue(),
+        mime_type=_mime_type(options.image_format),
+        size=img.size,
+        mode=img.mode,
+        baseline_bytes=baseline_bytes,
+        timings=timings
+    )
+
+
+# Embedded page images: share of the page an image must cover to stand in
+# for it, and how far past the pixel budget / long edge it may be sent as-is
+_PAGE_IMAGE_COVERAGE = 0.9
+_PASSTHROUGH_OVERSIZE = 1.5
+
+
+def _baseline_bytes(page: fitz.Page) -> int:
+    scale = BASELINE_DPI / 72.0
+    return int(page.rect.width * scale) * int(page.rect.height * scale) * 3
+
+
+def _page_jpeg(page: fitz.Page) -> Optional[dict]:
+    """
+    The embedded JPEG that makes up a whole scanned page, if that is all the page is
+
+    Only a single, upright, opaque RGB or grayscale JPEG covering the page
+    qualifies; rotated pages, vector drawings on top, masks, CMYK, JBIG2,
+    CCITT and JPEG 2000 images return None (the page is rendered instead).
+
+    Args:
+        page: Loaded PyMuPDF page
+
+    Returns:
+        PyMuPDF extract_image() dict, or None
+    """
+    images = page.get_images(full=True)
+    if len(images) != 1 or page.rotation:
+        return None
+    xref, smask, width, height, filter_name = images[0][0], images[0][1], images[0][2], images[0][3], images[0][8]
+    if smask or filter_name != "DCTDecode":
+        return None
+
+    # Without xrefs=True (which hashes every image); the size check ties the
+    # one placement to the one image
+    placements = page.get_image_info()
+    if len(placements) != 1 or (placements[0]["width"], placements[0]["height"]) != (width, height):
+        return None  # Drawn more than once, or an inline image besides it
+    a, b, c, d = placements[0]["transform"][:4]
+    if abs(b) > 1e-3 or abs(c) > 1e-3 or a <= 0 or d <= 0:
+        return None  # Rotated or mirrored on the page
+    covered = fitz.Rect(placements[0]["bbox"]) & page.rect
+    if covered.get_area() < _PAGE_IMAGE_COVERAGE * page.rect.get_area():
+        return None
+    if page.get_drawings():
+        return None  # Stamps, form lines or annotations drawn over the scan
+
+    extracted = page.parent.extract_image(xref)
+    if not extracted or extracted.get("ext") != "jpeg" or extracted.get("colorspace") not in (1, 3):
+        return None
+    return extracted
+
+
+def prepare_embedded_image(page: fitz.Page, options: ImagePreparationOptions) -> Optional[PreparedImage]:
+    """
+    Take a scanned page's embedded JPEG byte for byte: no decoding,
+    rendering or re-encoding
+
+    JPEGs well past the pixel budget are left to the renderer, which
+    downscales while it decodes and beats decoding at full size here.
+
+    Args:
+        page: Loaded PyMuPDF page
+        options: Preparation options
+
+    Returns:
+        PreparedImage, or None if the page has to be rendered
+    """
+    start = time.perf_counter()
+    extracted = _page_jpeg(page)
+    if extracted is None:
+        return None
+
+    size = (extracted["width"], extracted["height"])
+    if (
+        size[0] * size[1] > options.pixel_budget * _PASSTHROUGH_OVERSIZE
+        or max(size) > options.max_long_edge * _PASSTHROUGH_OVERSIZE
+    ):
+        return None
+
+    return PreparedImage(
+        data=extracted["image"],
+        mime_type="image/jpeg",
+        size=size,
+        mode="L" if extracted["colorspace"] == 1 else "RGB",
+        baseline_bytes=_baseline_bytes(page),
+        timings={"extract": time.perf_counter() - start}
+    )
+
+
+def prepare_pdf_page(page: fitz.Page, options: ImagePreparationOptions) -> PreparedImage:
+    """
+    Render one PDF page at a budget-driven DPI and encode it (or, with
+    embedded_passthrough, take a scanned page's own JPEG)
+
+    Args:
+        page: Loaded PyMuPDF page
+        options: Preparation options
+
+    Returns:
+        PreparedImage
+    """
+    if options.embedded_passthrough:
+        prepared = prepare_embedded_image(page, options)
+        if prepared is not None:
+            return prepared
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    dpi = choose_dpi(page.rect, options)
+    pix = page.get_pixmap(dpi=dpi)
+    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    timings["render"] = time.perf_counter() - start
+
+    return encode_image(img, options, timings, _baseline_bytes(page))
+
+
+# Auto-crop: analysis thumbnail size, share of a row/column that must be
+# paper, accepted crop area range, and paper/background brightness gap
+_CROP_THUMB_EDGE = 256
+_CROP_LINE_FRACTION = 0.5
+_CROP_MIN_AREA = 0.2
+_CROP_MAX_AREA = 0.92
+_CROP_MIN_CONTRAST = 25
+_CROP_MARGIN = 0.02
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Gray level that best separates a bimodal histogram (Otsu's method)"""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = background_weighted = 0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_weighted += level * count
+        mean_background = background_weighted / background
+        mean_foreground = (weighted_total - background_weighted) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def _paper_span(profile: List[int]) -> Optional[Tuple[int, int]]:
+    """First and last index whose share of paper pixels passes the line fraction"""
+    cutoff = 255 * _CROP_LINE_FRACTION
+    indices = [index for index, value in enumerate(profile) if value >= cutoff]
+    return (indices[0], indices[-1] + 1) if indices else None
+
+
+def find_document_box(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Locate a sheet of paper in a photo with a cheap threshold/edge heuristic
+
+    On a small smoothed grayscale thumbnail: Otsu-threshold paper from
+    background, take the rows and columns that are mostly paper (projection
+    profiles, so specks and shadows don't move the box), then keep the box
+    only if it is a plausible size and the paper is clearly brighter than
+    what surrounds it, i.e. there is a real edge at its border.
+
+    Args:
+        img: Decoded photo (any orientation)
+
+    Returns:
+        (left, top, right, bottom) in img coordinates, or None to keep the
+        whole frame
+    """
+    scale = _CROP_THUMB_EDGE / max(img.size)
+    if scale >= 1:
+        return None
+    thumb = img.convert("L").resize(
+        (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))), Image.BOX
+    ).filter(ImageFilter.BoxBlur(1))
+    threshold = _otsu_threshold(thumb.histogram())
+    paper = thumb.point(lambda value: 255 if value > threshold else 0)
+
+    width, height = thumb.size
+    columns = _paper_span(list(paper.resize((width, 1), Image.BOX).getdata()))
+    rows = _paper_span(list(paper.resize((1, height), Image.BOX).getdata()))
+    if columns is None or rows is None:
+        return None
+    left, right = columns
+    top, bottom = rows
+
+    area = (right - left) * (bottom - top) / (width * height)
+    if not _CROP_MIN_AREA <= area <= _CROP_MAX_AREA:
+        return None
+
+    inside = thumb.crop((left, top, right, bottom)).histogram()
+    whole = thumb.histogram()
+    outside = [count - inner for count, inner in zip(whole, inside)]
+    mean_inside = sum(level * count for level, count in enumerate(inside)) / max(sum(inside), 1)
+    mean_outside = sum(level * count for level, count in enumerate(outside)) / max(sum(outside), 1)
+    if mean_inside - mean_outside < _CROP_MIN_CONTRAST:
+        return None
+
+    margin_x, margin_y = round(width * _CROP_MARGIN), round(height * _CROP_MARGIN)
+    return (
+        max(0, int((left - margin_x) / scale)),
+        max(0, int((top - margin_y) / scale)),
+        min(img.size[0], math.ceil((right + margin_x) / scale)),
+        min(img.size[1], math.ceil((bottom + margin_y) / scale)),
+    )
+
+
+def prepare_photo(file_contents: bytes, options: ImagePreparationOptions) -> PreparedImage:
+    """
+    Normalize an uploaded photo (JPEG via draft mode) and encode it once
+
+    Draft mode lets libjpeg decode directly at 1/2, 1/4 or 1/8 scale, so a
+    large phone photo is never fully decoded at its native resolution. With
+    auto_crop the decoded image is cropped to the document before the size
+    cap applies, so the pixel budget goes to the invoice rather than the
+    desk around it. The EXIF rotation is applied last, to the downscaled
+    image, where it costs a fraction of a full-size transpose.
+
+    Args:
+        file_contents: Raw image bytes
+        options: Preparation options
+
+    Returns:
+        PreparedImage
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    img = Image.open(BytesIO(file_contents))
+    baseline_bytes = img.size[0] * img.size[1] * 3
+    if img.format == "JPEG":
+        # Square target: the requested scale holds whichever way the photo is rotated
+        img.draft("RGB", (options.max_long_edge, options.max_long_edge))
+    img.load()
+    timings["decode"] = time.perf_counter() - start
+
+    if options.auto_crop:
+        start = time.perf_counter()
+        box = find_document_box(img)
+        if box is not None:
+            img = img.crop(box)
+        timings["crop"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if max(img.size) > options.max_long_edge:
+        img.thumbnail((options.max_long_edge, options.max_long_edge), Image.LANCZOS)
+    timings["resize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    img = ImageOps.exif_transpose(img)
+    timings["orient"] = time.perf_counter() - start
+
+    return encode_image(img, options, timings, baseline_bytes)
+
+
+def summarize(images: List[PreparedImage]) -> Optional[str]:
+    """
+    One-line report of bytes saved and time spent per stage
+
+    Args:
+        images: Prepared images for one document
+
+    Returns:
+        Summary string, or None for an empty list
+    """
+    if not images:
+        return None
+
+    baseline = sum(img.baseline_bytes for img in images)
+    encoded = sum(len(img.data) for img in images)
+    stages: Dict[str, float] = {}
+    for img in images:
+        for stage, seconds in img.timings.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    saved_pct = 100.0 * (baseline - encoded) / baseline if baseline else 0.0
+    stage_text = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in stages.items())
+    return (
+        f"{len(images)} image(s): {baseline} -> {encoded} bytes "
+        f"({saved_pct:.1f}% saved); {stage_text}"
+    )
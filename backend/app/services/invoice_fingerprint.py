@@ -0,0 +1,109 @@
+"""
+Normalized duplicate-detection fingerprints for invoices
+An invoice's vendor (casefolded, punctuation and spacing dropped), amount
+(rounded to cents) and date (ISO) are hashed into one key, stored on the
+invoice and covered by a unique (user_id, dedupe_fingerprint) index, so
+finding a duplicate is a single indexed lookup and two workers can never
+both insert the same invoice. Fingerprints recently seen in this process
+are kept in an LRU so repeat checks (bulk ingestion, email polling) go
+straight to the existing row by primary key.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Tuple
+from app.core.config import settings
+
+
+def normalize_vendor(vendor_name: Optional[str]) -> Optional[str]:
+    """Casefold a vendor name and drop punctuation and extra spacing ("ACME, Inc." -> "acme inc")"""
+    if not vendor_name:
+        return None
+    return " ".join(re.sub(r"[\W_]+", " ", vendor_name.casefold()).split()) or None
+
+
+def normalize_amount(amount_due: Optional[float]) -> Optional[str]:
+    """Amount rounded to cents (zero and missing amounts don't count)"""
+    if not amount_due:
+        return None
+    return f"{round(amount_due, 2):.2f}"
+
+
+def normalize_date(invoice_date: Optional[str]) -> Optional[str]:
+    """ISO date (YYYY-MM-DD), or the stripped value if it doesn't parse"""
+    if not invoice_date or not invoice_date.strip():
+        return None
+    value = invoice_date.strip()
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        return value
+
+
+def invoice_fingerprint(
+    vendor_name: Optional[str],
+    amount_due: Optional[float],
+    invoice_date: Optional[str]
+) -> Optional[str]:
+    """
+    Fingerprint of an invoice's vendor, amount and date
+
+    Returns:
+        Hex digest, or None unless all three are present
+    """
+    parts = (normalize_vendor(vendor_name), normalize_amount(amount_due), normalize_date(invoice_date))
+    if None in parts:
+        return None
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class RecentFingerprints:
+    """
+    Per-process LRU of (user, fingerprint) -> invoice id for fingerprints
+    known to be stored
+
+    Only hits are cached: a miss always goes to the database, which stays
+    the source of truth. Callers verify the row a hit points to (it may have
+    been deleted, edited or rolled back since) and forget stale entries.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Args:
+            max_entries: Fingerprints held in memory (0 disables the cache)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, fingerprint: str) -> Optional[str]:
+        """Invoice id last stored with this fingerprint, if remembered"""
+        with self._lock:
+            invoice_id = self._entries.get((user_id, fingerprint))
+            if invoice_id is not None:
+                self._entries.move_to_end((user_id, fingerprint))
+            return invoice_id
+
+    def remember(self, user_id: str, fingerprint: str, invoice_id: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(user_id, fingerprint)] = invoice_id
+            self._entries.move_to_end((user_id, fingerprint))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id: str, fingerprint: str) -> None:
+        with self._lock:
+            self._entries.pop((user_id, fingerprint), None)
+
+    def clear(self) -> None:
+        """Empty the cache"""
+        with self._lock:
+            self._entries.clear()
+
+
+# Global recent fingerprint cache
+recent_fingerprints = RecentFingerprints(max_entries=settings.DEDUPE_FINGERPRINT_CACHE_SIZE)
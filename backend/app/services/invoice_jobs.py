@@ -0,0 +1,147 @@
+"""
+Background invoice processing for asynchronous uploads
+The upload endpoint stores the file and a PENDING invoice row and returns
+right away; run_invoice_job then moves the row through PROCESSING to
+COMPLETED or FAILED with its own database session.
+Jobs live only in the process that accepted the upload, so rows left
+pending or processing by a restart are picked up again at startup
+(resume_stale_jobs).
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from app.core.config import settings
+from app.crud import invoice as invoice_crud
+from app.db.session import SessionLocal
+from app.services.invoice_processing import process_invoice_document_async
+from app.services.upload_intake import sniff_content_type
+
+logger = logging.getLogger(__name__)
+
+
+def store_upload(user_id: str, filename: Optional[str], file_contents: bytes) -> str:
+    """
+    Write an uploaded file under UPLOAD_DIR
+
+    Args:
+        user_id: Owner of the upload (files are grouped per user)
+        filename: Original filename (only its extension is kept)
+        file_contents: Raw file bytes
+
+    Returns:
+        Path of the stored file
+    """
+    suffix = Path(filename or "").suffix.lower()
+    directory = Path(settings.UPLOAD_DIR) / user_id
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f"{uuid.uuid4()}{suffix}"
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(file_contents)
+    tmp_path.replace(path)
+    return str(path)
+
+
+def remove_upload(file_path: str) -> None:
+    """Delete a stored upload, ignoring files that are already gone"""
+    try:
+        Path(file_path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+async def run_invoice_job(invoice_id: str, file_path: str, content_type: str) -> None:
+    """
+    Extract a stored upload and record the outcome on its invoice row
+
+    Args:
+        invoice_id: PENDING invoice created by the upload endpoint
+        file_path: Stored file from store_upload()
+        content_type: MIME type of the upload
+    """
+    db = SessionLocal()
+    try:
+        db_invoice = invoice_crud.mark_invoice_processing(db, invoice_id)
+        if not db_invoice:
+            logger.warning("Invoice %s disappeared before processing", invoice_id)
+            return
+
+        logger.info("Processing invoice %s in the background", invoice_id)
+        file_contents = await asyncio.to_thread(Path(file_path).read_bytes)
+        processing_result = await process_invoice_document_async(
+            file_contents, content_type, db_invoice.user_id, file_sha256=db_invoice.content_sha256
+        )
+
+        invoice_crud.complete_invoice(
+            db,
+            invoice_id=invoice_id,
+            extraction_result=processing_result.extraction,
+            extracted_text=processing_result.extracted_text
+        )
+
+    except HTTPException as e:
+        db.rollback()
+        invoice_crud.mark_invoice_failed(db, invoice_id, str(e.detail))
+    except Exception as e:
+        logger.error("Error processing invoice %s: %s", invoice_id, e)
+        db.rollback()
+        invoice_crud.mark_invoice_failed(db, invoice_id, f"Error processing invoice: {e}")
+    finally:
+        db.close()
+
+
+def stale_job_cutoff() -> datetime:
+    """Pending or processing invoices not updated since this have lost their job"""
+    return datetime.utcnow() - timedelta(seconds=settings.INVOICE_JOB_STALE_SECONDS)
+
+
+async def resume_stale_jobs() -> None:
+    """
+    Requeue invoices whose background job was lost (run once at startup);
+    those whose stored file is gone are marked failed
+    """
+    try:
+        jobs = await asyncio.to_thread(_claim_stale_jobs)
+    except Exception as e:
+        logger.error("Could not check for interrupted invoice jobs: %s", e)
+        return
+    if jobs:
+        logger.info("Resuming %d interrupted invoice job(s)", len(jobs))
+    for invoice_id, file_path, content_type in jobs:
+        await run_invoice_job(invoice_id, file_path, content_type)
+
+
+def _claim_stale_jobs() -> List[Tuple[str, str, str]]:
+    """Claim stale invoices for this process; returns (invoice id, file path, MIME type) to rerun"""
+    db = SessionLocal()
+    try:
+        jobs = []
+        for db_invoice in invoice_crud.get_stale_invoices(db, stale_job_cutoff()):
+            invoice_id, file_path = db_invoice.id, db_invoice.file_path
+            if not invoice_crud.claim_stale_invoice(db, db_invoice):
+                continue  # Another worker process got it first
+            content_type = _stored_content_type(file_path)
+            if content_type is None:
+                invoice_crud.mark_invoice_failed(
+                    db, invoice_id, "Processing was interrupted and the uploaded file is gone; please upload it again"
+                )
+                continue
+            jobs.append((invoice_id, file_path, content_type))
+        return jobs
+    finally:
+        db.close()
+
+
+def _stored_content_type(file_path: Optional[str]) -> Optional[str]:
+    """MIME type of a stored upload, or None if it can't be read"""
+    if not file_path:
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            return sniff_content_type(f.read(1024))
+    except OSError:
+        return None
@@ -1,280 +1,269 @@
 """
 Invoice processing service using Google Gemini AI
 EXACT COPY of logic from backend/app/services/processing_service.py
+The model call itself goes through the configured extraction backend
+(see extraction_backends); Gemini is the default.
 """
-import os
-import json
-from google import genai
-import fitz  # PyMuPDF
+import asyncio
+import logging
 from PIL import Image
 from fastapi import HTTPException
-from typing import List
+from typing import Dict, List, Optional, Tuple, Union
 from app.schemas.invoice import InvoiceExtractionResponse
 from app.core.config import settings
+from app.core.metrics import track_stage
+from app.services.extraction_backends import get_backend
+from app.services.extraction_cache import extraction_cache
+from app.services.local_extraction import try_local_extraction
+from app.services.text_compaction import compact_for_prompt
+from app.services.upload_intake import content_sha256
+from app.services.vendor_templates import extract_with_template
+from app.services.document_analysis import (
+    DocumentAnalysis,
+    analyze_document,
+    analyze_document_async,
+    is_pdf
+)
 
 
-# --- Setup Gemini Client ---
-try:
-    # Get API key from settings
-    api_key = settings.GOOGLE_API_KEY if hasattr(settings, 'GOOGLE_API_KEY') else os.getenv("GOOGLE_API_KEY")
-    
-    if not api_key:
-        print("❌ CRITICAL: GOOGLE_API_KEY not found in environment variables!")
-        print("Please add GOOGLE_API_KEY to your .env file")
-        client = None
-    else:
-        print(f"✅ Found GOOGLE_API_KEY: {api_key[:10]}...")
-        client = genai.Client(api_key=api_key)
-        print("--- 🤖 Gemini Client Initialized (Invoice Processing Service) ---")
-except Exception as e:
-    print(f"CRITICAL: Error configuring Gemini API: {e}")
-    client = None
-
-
-# --- Prompts (EXACT COPY from processing_service.py) ---
-BASE_PROMPT = """
-You are an expert at understanding invoices and billing documents.
-Extract the following fields if present and return ONLY valid JSON (no prose):
-
-IMPORTANT: Use these EXACT field names (snake_case):
-{{
-  "invoice_id": string|null,
-  "vendor_name": string|null,
-  "amount_due": number|null,
-  "due_date": string (YYYY-MM-DD format)|null,
-  "invoice_date": string (YYYY-MM-DD format)|null,
-  "currency_code": string (ISO 4217: USD, INR, EUR, GBP, etc.)|null,
-  "confidence_score": number (0.0 to 1.0)
-}}
-
-Field descriptions:
-- invoice_id: The unique invoice or bill number
-- vendor_name: The company or person issuing the invoice
-- amount_due: The total amount to be paid (numeric value only, no currency symbols)
-- due_date: Payment deadline in YYYY-MM-DD format
-- invoice_date: Date the invoice was issued in YYYY-MM-DD format
-- currency_code: 3-letter ISO currency code (USD, INR, EUR, GBP, CAD, AUD, etc.)
-- confidence_score: Your confidence in the extraction (0.0 = no confidence, 1.0 = very confident)
-
-Rules:
-- If a field is not found, set it to null
-- Return dates in ISO 8601 format (YYYY-MM-DD)
-- Return currency as 3-letter uppercase ISO code
-- Extract amount as number without currency symbols
-- Return ONLY the JSON object, no additional text
-"""
+logger = logging.getLogger(__name__)
 
-TEXT_PROMPT_TEMPLATE = BASE_PROMPT + """
+# Bump to orphan existing cache entries when what gets cached changes
+# (2: model results only, no per-user template or local-rule results)
+CACHE_KEY_VERSION = 2
 
-Here is the invoice text:
----
-{invoice_text}
----
-"""
 
-IMAGE_PROMPT_TEMPLATE = BASE_PROMPT + """
+# --- Helper Functions ---
+
+def extract_text_from_pdf(file_contents: bytes) -> str:
+    """
+    Extract text from PDF file.
+    Prefer analyze_document() when the PDF is also needed for extraction.
+    """
+    with analyze_document(file_contents, "application/pdf") as document:
+        all_text = document.text
+        
+    if all_text and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Text preview: %s...", all_text[:200])
+    return all_text
 
-Here is the invoice (as one or more images). Extract the data from them.
-"""
 
+def convert_pdf_to_images(file_contents: bytes) -> List[Image.Image]:
+    """
+    Convert PDF pages to images for OCR.
+    """
+    with analyze_document(file_contents, "application/pdf") as document:
+        return [image.to_pil() for image in document.images]
 
-# --- Generation Configuration ---
-generation_config = {
-    "temperature": 0.0,
-    "response_mime_type": "application/json",
-}
 
+def convert_image_file(file_contents: bytes, content_type: str) -> Image.Image:
+    """
+    Convert uploaded image file to PIL Image
+    """
+    with analyze_document(file_contents, content_type) as document:
+        return document.images[0].to_pil()
 
-# --- Core AI Functions (EXACT COPY) ---
 
-def get_invoice_data_from_text(text: str) -> InvoiceExtractionResponse:
+class InvoiceProcessingResult:
     """
-    Sends text to Gemini and returns validated Pydantic model.
-    EXACT COPY from processing_service.py
+    Extraction result returned together with the analyzed document,
+    so callers can reuse the PDF text instead of parsing the file again
     """
     
-    # Check if client is initialized
-    if client is None:
-        raise HTTPException(
-            status_code=500,
-            detail="Gemini API client not initialized. Please check your GOOGLE_API_KEY."
-        )
-    
-    final_prompt = TEXT_PROMPT_TEMPLATE.format(invoice_text=text)
+    def __init__(self, extraction: InvoiceExtractionResponse, document: DocumentAnalysis):
+        self.extraction = extraction
+        self.document = document
     
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[final_prompt],
-            config=generation_config
-        )
-        
-        # Debug: Print the raw response
-        print(f"--- 🔍 Raw Gemini Response (TEXT): {response} ---")
-        print(f"--- 🔍 Response Text (TEXT): {response.text} ---")
-        
-        json_output = response.text.strip()
-        
-        # Check if response is empty
-        if not json_output:
-            raise ValueError("Gemini returned an empty response")
-        
-        # Remove double curly braces if present (Gemini sometimes adds them)
-        if json_output.startswith("{{") and json_output.endswith("}}"):
-            json_output = json_output[1:-1].strip()
-            print(f"--- 🔧 Removed double curly braces, cleaned output: {json_output} ---")
-        
-        data = json.loads(json_output)
-        validated_data = InvoiceExtractionResponse(**data)
-        
-        print("--- ✅ Successfully processed TEXT ---")
-        return validated_data
+    @property
+    def extracted_text(self) -> Optional[str]:
+        """PDF text layer for search/reference (None for images)"""
+        return self.document.text if self.document.is_pdf else None
 
-    except json.JSONDecodeError as e:
-        print(f"--- ❌ JSON Decode Error (TEXT): {e} ---")
-        print(f"--- 🔍 Attempted to parse: {json_output if 'json_output' in locals() else 'No output'} ---")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Failed to parse Gemini response as JSON: {e}"
-        )
-    except Exception as e:
-        print(f"--- ❌ An error occurred during TEXT processing: {e} ---")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"An internal error occurred: {e}"
-        )
 
-
-def get_invoice_data_from_images(images: List[Image.Image]) -> InvoiceExtractionResponse:
-    """
-    Sends images to Gemini (multimodal) and returns validated data.
-    EXACT COPY from processing_service.py
+def process_invoice_document(
+    file_contents: bytes,
+    content_type: str,
+    user_id: Optional[str] = None
+) -> InvoiceProcessingResult:
     """
+    Main function to process any invoice file (PDF or image).
+    Opens the file once, picks text or image extraction from the analysis,
+    and returns both the extraction and the analysis.
+    Model extractions are cached by SHA-256 of the file bytes, prompt and
+    model, so re-uploads and repeated email attachments skip the Gemini call.
     
-    # Check if client is initialized
-    if client is None:
-        raise HTTPException(
-            status_code=500,
-            detail="Gemini API client not initialized. Please check your GOOGLE_API_KEY."
-        )
+    Args:
+        file_contents: Raw file bytes
+        content_type: MIME type of the file
+        user_id: Owner of the upload; enables their learned vendor templates
     
-    content = [IMAGE_PROMPT_TEMPLATE]
-    content.extend(images)
+    Returns:
+        InvoiceProcessingResult with extracted data and document analysis
+    """
+    
+    logger.info("Processing invoice file", extra={"content_type": content_type})
+    _check_supported_type(content_type)
     
+    document = analyze_document(file_contents, content_type)
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=content,
-            config=generation_config
-        )
-        
-        # Debug: Print the raw response
-        print(f"--- 🔍 Raw Gemini Response (IMAGE): {response} ---")
-        print(f"--- 🔍 Response Text (IMAGE): {response.text} ---")
-        
-        json_output = response.text.strip()
-        
-        # Check if response is empty
-        if not json_output:
-            raise ValueError("Gemini returned an empty response")
-        
-        # Remove double curly braces if present (Gemini sometimes adds them)
-        if json_output.startswith("{{") and json_output.endswith("}}"):
-            json_output = json_output[1:-1].strip()
-            print(f"--- 🔧 Removed double curly braces, cleaned output: {json_output} ---")
-        
-        data = json.loads(json_output)
-        validated_data = InvoiceExtractionResponse(**data)
-        
-        print("--- ✅ Successfully processed IMAGE(S) ---")
-        return validated_data
-
-    except json.JSONDecodeError as e:
-        print(f"--- ❌ JSON Decode Error (IMAGE): {e} ---")
-        print(f"--- 🔍 Attempted to parse: {json_output if 'json_output' in locals() else 'No output'} ---")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Failed to parse Gemini response as JSON: {e}"
-        )
-    except Exception as e:
-        print(f"--- ❌ An error occurred during IMAGE processing: {e} ---")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"An internal error occurred: {e}"
-        )
-
+        extraction = _extract_cached(document, user_id)
+    finally:
+        document.close()
+    
+    return InvoiceProcessingResult(extraction, document)
 
-# --- Helper Functions (EXACT COPY) ---
 
-def extract_text_from_pdf(file_contents: bytes) -> str:
+def process_invoice_documents(
+    files: List[Tuple[bytes, str]],
+    user_id: Optional[str] = None
+) -> List[Union[InvoiceProcessingResult, Exception]]:
     """
-    Extract text from PDF file.
-    EXACT COPY from processing_service.py
+    Process several invoice files, batching text-layer PDFs into shared
+    Gemini requests (used by the email poller for whole polling cycles).
+    Documents a batch response doesn't cover, scanned PDFs and images go
+    through the single-document path.
+    
+    Args:
+        files: (file bytes, MIME type) pairs
+        user_id: Owner of the files; enables their learned vendor templates
+    
+    Returns:
+        One entry per file, in order: an InvoiceProcessingResult, or the
+        exception that file failed with
     """
-    all_text = ""
-    try:
-        pdf_document = fitz.open(stream=file_contents, filetype="pdf")
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            all_text += page.get_text()
-        pdf_document.close()
-    except Exception as e:
-        print(f"Error extracting PDF text (file might be image-only): {e}")
-        return ""
+    results: List[Union[InvoiceProcessingResult, Exception, None]] = [None] * len(files)
+    documents: List[Optional[DocumentAnalysis]] = [None] * len(files)
+    batchable: List[int] = []
+    
+    for index, (file_contents, content_type) in enumerate(files):
+        logger.info("Processing invoice file", extra={"content_type": content_type})
+        try:
+            _check_supported_type(content_type)
+            document = analyze_document(file_contents, content_type)
+        except Exception as e:
+            results[index] = e
+            continue
         
-    print(f"--- 📄 Extracted {len(all_text)} chars from PDF ---")
-    if all_text:
-        print(f"--- 📝 Text preview: {all_text[:200]}... ---")
-    return all_text
+        documents[index] = document
+        if _uses_text_shortcuts(document):
+            extraction = _extract_without_model(document, user_id)
+            if extraction is None and settings.EXTRACTION_CACHE_ENABLED:
+                cache_key = _document_cache_key(document)
+                with track_stage("cache", document.content_type) as timer:
+                    extraction = extraction_cache.get(cache_key)
+                    timer.outcome = "miss" if extraction is None else "hit"
+                if extraction is not None:
+                    logger.debug("Extraction cache hit: %s", cache_key[:12])
+            if extraction is not None:
+                results[index] = InvoiceProcessingResult(extraction, document)
+            else:
+                batchable.append(index)
+    
+    prompt_texts = {index: _prompt_text(documents[index]) for index in batchable}
+    for chunk in _text_batches(batchable, prompt_texts):
+        logger.info("Batching %d text documents into one request", len(chunk))
+        try:
+            with track_stage("model.batch", "text"):
+                extractions = get_backend().extract_texts([prompt_texts[index] for index in chunk])
+        except Exception as e:
+            # The request failed as a whole (e.g. the model is overloaded):
+            # fail its documents rather than retrying each one on its own
+            for index in chunk:
+                results[index] = e
+            continue
+        for index, extraction in zip(chunk, extractions):
+            if extraction is None:
+                continue  # Retried on its own below
+            if settings.EXTRACTION_CACHE_ENABLED:
+                extraction_cache.set(_document_cache_key(documents[index]), extraction)
+            results[index] = InvoiceProcessingResult(extraction, documents[index])
+    
+    for index, document in enumerate(documents):
+        if document is None:
+            continue
+        try:
+            if results[index] is None:
+                results[index] = InvoiceProcessingResult(_extract_cached(document, user_id), document)
+        except Exception as e:
+            results[index] = e
+        finally:
+            document.close()
+    
+    return results
 
 
-def convert_pdf_to_images(file_contents: bytes) -> List[Image.Image]:
-    """
-    Convert PDF pages to images for OCR.
-    EXACT COPY from processing_service.py
-    """
-    images = []
-    try:
-        pdf_document = fitz.open(stream=file_contents, filetype="pdf")
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap(dpi=200)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            images.append(img)
-        pdf_document.close()
-        
-        print(f"--- 🖼️ Converted PDF to {len(images)} image(s) ---")
-        return images
-        
-    except Exception as e:
-        print(f"--- ❌ Error converting PDF to images: {e} ---")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error processing PDF file for scanning: {e}"
-        )
+def _text_batches(indices: List[int], prompt_texts: Dict[int, str]) -> List[List[int]]:
+    """Group text documents into batches bounded by count and total characters"""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for index in indices:
+        chars = len(prompt_texts[index])
+        if current and (
+            len(current) >= settings.GEMINI_BATCH_MAX_DOCUMENTS
+            or current_chars + chars > settings.GEMINI_BATCH_MAX_CHARS
+        ):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += chars
+    if current:
+        batches.append(current)
+    # A batch of one gains nothing over the regular single-document path
+    return [batch for batch in batches if len(batch) > 1]
 
 
-def convert_image_file(file_contents: bytes, content_type: str) -> Image.Image:
+async def process_invoice_document_async(
+    file_contents: bytes,
+    content_type: str,
+    user_id: Optional[str] = None,
+    file_sha256: Optional[str] = None
+) -> InvoiceProcessingResult:
     """
-    Convert uploaded image file to PIL Image
+    Non-blocking variant of process_invoice_document for async endpoints.
+    PDF parsing and rasterization run on the document engine's workers,
+    hashing runs in the default executor and the model call uses the async
+    Gemini client, so the event loop keeps serving other requests while an
+    extraction is in flight.
+    
+    Args:
+        file_contents: Raw file bytes
+        content_type: MIME type of the file
+        user_id: Owner of the upload; enables their learned vendor templates
+        file_sha256: SHA-256 of the file if already known (upload intake
+            hashes while reading); hashed in the default executor otherwise
+    
+    Returns:
+        InvoiceProcessingResult with extracted data and document analysis
     """
+    
+    logger.info("Processing invoice file (async)", extra={"content_type": content_type})
+    _check_supported_type(content_type)
+    
+    document = await analyze_document_async(file_contents, content_type)
     try:
-        from io import BytesIO
-        img = Image.open(BytesIO(file_contents))
-        print(f"--- 🖼️ Loaded image: {img.format} {img.size} ---")
-        return img
-    except Exception as e:
-        print(f"--- ❌ Error loading image: {e} ---")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Error processing image file: {e}"
-        )
+        extraction = None
+        if _uses_text_shortcuts(document):
+            extraction = await asyncio.to_thread(_extract_without_model, document, user_id)
+        if extraction is None:
+            if not settings.EXTRACTION_CACHE_ENABLED:
+                extraction = await _extract_with_model_async(document)
+            else:
+                if file_sha256 is None:
+                    file_sha256 = await asyncio.to_thread(content_sha256, file_contents)
+                extraction = await extraction_cache.aget_or_compute(
+                    _cache_key(file_sha256, content_type),
+                    lambda: _extract_with_model_async(document)
+                )
+    finally:
+        document.close()
+    
+    return InvoiceProcessingResult(extraction, document)
 
 
 def process_invoice_file(file_contents: bytes, content_type: str) -> InvoiceExtractionResponse:
     """
-    Main function to process any invoice file (PDF or image).
-    Automatically detects file type and uses appropriate extraction method.
+    Process an invoice file and return only the extracted data
     
     Args:
         file_contents: Raw file bytes
@@ -283,31 +272,137 @@ def process_invoice_file(file_contents: bytes, content_type: str) -> InvoiceExtr
     Returns:
         InvoiceExtractionResponse with extracted data
     """
-    
-    print(f"--- 🚀 Processing invoice file: {content_type} ---")
+    return process_invoice_document(file_contents, content_type).extraction
+
+
+def _check_supported_type(content_type: str) -> None:
+    """Reject files that are neither PDFs nor images"""
+    if not (is_pdf(content_type) or content_type.startswith("image/")):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {content_type}. Please upload PDF, JPG, or PNG files."
+        )
+
+
+def _cache_key(file_sha256: str, content_type: str) -> str:
+    """Extraction cache key for a file under the current prompts and model"""
+    return extraction_cache.make_key(
+        file_hash=file_sha256,
+        content_type=content_type,
+        prompt=f"{CACHE_KEY_VERSION}:{get_backend().cache_namespace}",
+        model=get_backend().name
+    )
+
+
+def _document_cache_key(document: DocumentAnalysis) -> str:
+    return _cache_key(content_sha256(document.file_contents), document.content_type)
+
+
+def _extract_cached(document: DocumentAnalysis, user_id: Optional[str] = None) -> InvoiceExtractionResponse:
+    """
+    Extract an analyzed PDF or image: the user's vendor template or the local
+    rules first (text PDFs), then the model through the cache (single-flight
+    per file) when it is enabled. Only model results are cached, since the
+    cache is shared by all users and outlives template changes.
+    """
+    if _uses_text_shortcuts(document):
+        local_result = _extract_without_model(document, user_id)
+        if local_result is not None:
+            return local_result
+    if not settings.EXTRACTION_CACHE_ENABLED:
+        return _extract_with_model(document)
+    return extraction_cache.get_or_compute(
+        _document_cache_key(document),
+        lambda: _extract_with_model(document)
+    )
+
+
+def _uses_text_shortcuts(document: DocumentAnalysis) -> bool:
+    """Whether templates and local rules apply (text-layer PDFs without scanned pages)"""
+    return document.is_pdf and document.has_text_layer and not document.is_mixed
+
+
+def _extract_with_model(document: DocumentAnalysis) -> InvoiceExtractionResponse:
+    """
+    Run the model extraction for an analyzed PDF or image
+    """
     
     # Handle PDF files
-    if content_type == "application/pdf" or content_type.endswith("/pdf"):
-        # Try text extraction first
-        text = extract_text_from_pdf(file_contents)
-        
-        if text and len(text.strip()) > 50:  # If we got meaningful text
-            print("--- 📄 Using text extraction method ---")
-            return get_invoice_data_from_text(text)
+    if document.is_pdf:
+        if document.is_mixed:
+            # Typed and scanned pages: text and images in one request (no
+            # text-only shortcuts, they would ignore the scanned pages)
+            logger.debug("Using mixed text and image extraction")
+            prompt_text = _prompt_text(document)
+            images = document.images
+            with track_stage("model", "mixed"):
+                return get_backend().extract_mixed(prompt_text, images, document.selected_pages)
+        elif document.has_text_layer:  # If we got meaningful text
+            logger.debug("Using text extraction method")
+            prompt_text = _prompt_text(document)
+            with track_stage("model", "text"):
+                return get_backend().extract_text(prompt_text)
+        elif document.native_pdf is not None:
+            # Scanned PDF in native mode: the (trimmed) PDF itself, no page images
+            logger.debug("PDF has no text, sending it natively")
+            with track_stage("model", document.content_type):
+                return get_backend().extract_pdf(document.native_pdf.data)
         else:
             # Fall back to image-based extraction for scanned PDFs
-            print("--- 🖼️ PDF has no text, using image extraction ---")
-            images = convert_pdf_to_images(file_contents)
-            return get_invoice_data_from_images(images)
+            logger.debug("PDF has no text, using image extraction")
+            images = document.images
+            with track_stage("model", document.content_type):
+                return get_backend().extract_images(images)
     
     # Handle image files (jpg, png, etc.)
-    elif content_type.startswith("image/"):
-        print("--- 🖼️ Using image extraction method ---")
-        img = convert_image_file(file_contents, content_type)
-        return get_invoice_data_from_images([img])
+    logger.debug("Using image extraction method")
+    images = document.images
+    with track_stage("model", document.content_type):
+        return get_backend().extract_images(images)
+
+
+async def _extract_with_model_async(document: DocumentAnalysis) -> InvoiceExtractionResponse:
+    """
+    Async variant of _extract_with_model (rendering runs off the event loop)
+    """
     
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported file type: {content_type}. Please upload PDF, JPG, or PNG files."
-        )
+    if document.is_mixed:
+        logger.debug("Using mixed text and image extraction")
+        prompt_text = _prompt_text(document)
+        images = await document.images_async()
+        with track_stage("model", "mixed"):
+            return await get_backend().aextract_mixed(prompt_text, images, document.selected_pages)
+    
+    if document.is_pdf and document.has_text_layer:
+        logger.debug("Using text extraction method")
+        prompt_text = _prompt_text(document)
+        with track_stage("model", "text"):
+            return await get_backend().aextract_text(prompt_text)
+    
+    if document.native_pdf is not None:
+        logger.debug("PDF has no text, sending it natively")
+        with track_stage("model", document.content_type):
+            return await get_backend().aextract_pdf(document.native_pdf.data)
+    
+    logger.debug("Using image extraction method")
+    images = await document.images_async()
+    with track_stage("model", document.content_type):
+        return await get_backend().aextract_images(images)
+
+
+def _extract_without_model(document: DocumentAnalysis, user_id: Optional[str]) -> Optional[InvoiceExtractionResponse]:
+    """Learned vendor template, then the local rules; None when both miss"""
+    with track_stage("vendor_template", "text") as timer:
+        result = extract_with_template(user_id, document.text)
+        timer.outcome = "miss" if result is None else "hit"
+    if result is not None:
+        return result
+    with track_stage("local_rules", "text") as timer:
+        result = try_local_extraction(document.text)
+        timer.outcome = "miss" if result is None else "hit"
+    return result
+
+
+def _prompt_text(document: DocumentAnalysis) -> str:
+    with track_stage("compaction", "text"):
+        return compact_for_prompt(document.text_page_texts)
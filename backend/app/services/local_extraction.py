@@ -0,0 +1,298 @@
+"""
+Deterministic invoice extraction from PDF text, used before calling Gemini
+Precompiled regexes and keyword anchors find the invoice number, totals,
+dates, currency and vendor in a text layer. Each field gets a confidence
+from how strong its anchor was; when the required fields are present and
+the overall confidence clears LOCAL_EXTRACTION_MIN_CONFIDENCE the result is
+used as is and the LLM call is skipped.
+"""
+import logging
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.schemas.invoice import InvoiceExtractionResponse
+
+logger = logging.getLogger(__name__)
+
+
+# --- Patterns ---
+
+# Invoice numbers: letters, digits and separators, with at least one digit
+ID_PATTERN = r"((?=[A-Z0-9\-/_.]*\d)[A-Z0-9][A-Z0-9\-/_.]{1,30})"
+
+_INVOICE_ID_PATTERNS = [
+    # (pattern, confidence)
+    (re.compile(r"\binvoice\s*(?:no\.?|number|num\.?|#|id)\s*[:#]?\s*" + ID_PATTERN, re.I), 0.95),
+    (re.compile(r"\b(?:bill|receipt|document)\s*(?:no\.?|number|#)\s*[:#]?\s*" + ID_PATTERN, re.I), 0.85),
+    (re.compile(r"\binvoice\s*[:#]\s*" + ID_PATTERN, re.I), 0.8),
+    (re.compile(r"\binv\s*[-#:]?\s*" + ID_PATTERN, re.I), 0.75),
+]
+
+# Amounts with "," or "." (or non-breaking spaces) as separators: 1,234.50 / 1.234,50 / 1 234,50
+AMOUNT_PATTERN = (
+    r"(?P<currency>[$€£₹¥]|\b[A-Z]{3}\b|Rs\.?)?\s*"
+    r"(?P<amount>\d{1,3}(?:[,.\u00a0\u202f]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)"
+    r"\s*(?P<currency_after>\b[A-Z]{3}\b)?"
+)
+
+_TOTAL_PATTERNS = [
+    (re.compile(r"\b(?:amount\s+due|balance\s+due|total\s+due|amount\s+payable|total\s+payable)\b[^\n\d$€£₹¥]{0,20}" + AMOUNT_PATTERN, re.I), 0.95),
+    (re.compile(r"\b(?:grand\s+total|invoice\s+total|total\s+amount)\b[^\n\d$€£₹¥]{0,20}" + AMOUNT_PATTERN, re.I), 0.9),
+    (re.compile(r"(?<!sub\s)\btotal\b(?!\s*(?:tax|vat|gst|excl|before|items?|qty|quantity))[^\n\d$€£₹¥]{0,20}" + AMOUNT_PATTERN, re.I), 0.75),
+]
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+
+DATE_PATTERN = (
+    r"(?P<date>\d{4}-\d{1,2}-\d{1,2}"
+    r"|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+[A-Za-z]{3,9}\.?,?\s+\d{4}"
+    r"|[A-Za-z]{3,9}\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4})"
+)
+
+_INVOICE_DATE_PATTERNS = [
+    (re.compile(r"\b(?:invoice\s+date|date\s+of\s+issue|issue\s+date|issued(?:\s+on)?|bill\s+date)\b\s*[:\-]?\s*" + DATE_PATTERN, re.I), 0.95),
+    (re.compile(r"(?<!due\s)\bdate\b\s*[:\-]?\s*" + DATE_PATTERN, re.I), 0.7),
+]
+
+_DUE_DATE_PATTERNS = [
+    (re.compile(r"\b(?:due\s+date|payment\s+due|due\s+on|due\s+by|pay\s+by)\b\s*[:\-]?\s*" + DATE_PATTERN, re.I), 0.95),
+]
+
+_VENDOR_PATTERNS = [
+    (re.compile(r"^\s*(?:from|vendor|seller|supplier|bill\s+from|issued\s+by|sold\s+by)\s*[:\-]\s*(.+)$", re.I | re.M), 0.9),
+]
+
+_COMPANY_SUFFIX = re.compile(
+    r"\b(?:inc|llc|ltd|limited|corp|corporation|co|company|gmbh|ag|sa|sarl|bv|pvt|plc|llp|pty)\b\.?",
+    re.I
+)
+
+_NOT_VENDOR = re.compile(r"\b(?:invoice|bill\s+to|ship\s+to|date|page|tax\s+invoice|receipt|statement)\b", re.I)
+
+ISO_CURRENCIES = {
+    "USD", "EUR", "GBP", "INR", "JPY", "CNY", "CAD", "AUD", "NZD", "CHF", "SEK", "NOK",
+    "DKK", "SGD", "HKD", "AED", "SAR", "ZAR", "BRL", "MXN", "PLN", "CZK", "HUF", "KRW",
+}
+_CURRENCY_CODE = re.compile(r"\b(" + "|".join(sorted(ISO_CURRENCIES)) + r")\b")
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "₹": "INR", "¥": "JPY", "Rs": "INR", "Rs.": "INR"}
+
+# Share of the overall confidence carried by each field
+_FIELD_WEIGHTS = {
+    "invoice_id": 0.25,
+    "amount_due": 0.30,
+    "vendor_name": 0.20,
+    "invoice_date": 0.10,
+    "currency_code": 0.10,
+    "due_date": 0.05,
+}
+
+
+class LocalExtraction:
+    """
+    Result of the local extractor
+
+    - result: InvoiceExtractionResponse with the computed confidence_score
+    - field_confidence: confidence per found field (0..1)
+    - missing: required fields that were not found
+    """
+
+    def __init__(self, result: InvoiceExtractionResponse, field_confidence: Dict[str, float], missing: List[str]):
+        self.result = result
+        self.field_confidence = field_confidence
+        self.missing = missing
+
+    @property
+    def confidence(self) -> float:
+        return self.result.confidence_score
+
+    @property
+    def is_confident(self) -> bool:
+        """True if Gemini can be skipped"""
+        return not self.missing and self.confidence >= settings.LOCAL_EXTRACTION_MIN_CONFIDENCE
+
+
+# --- Field extractors ---
+
+def _first_match(patterns, text: str) -> Tuple[Optional[re.Match], float]:
+    """Return the earliest match of the strongest pattern that matches"""
+    for pattern, confidence in patterns:
+        match = pattern.search(text)
+        if match:
+            return match, confidence
+    return None, 0.0
+
+
+def parse_amount(raw: str) -> Optional[float]:
+    """Parse an amount written with either decimal point or decimal comma"""
+    cleaned = re.sub(r"[\s\u00a0\u202f]", "", raw)
+    decimal_comma = re.search(r",\d{1,2}$", cleaned) and (
+        "." not in cleaned or cleaned.rfind(".") < cleaned.rfind(",")
+    )
+    if decimal_comma:
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(?:\.\d{3})+", cleaned):
+        cleaned = cleaned.replace(".", "")  # 2.450 with "." as thousands separator
+    else:
+        cleaned = cleaned.replace(",", "")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def parse_date(raw: str, prefer_month_first: bool) -> Tuple[Optional[str], float]:
+    """
+    Normalize a date to YYYY-MM-DD
+
+    Returns:
+        (ISO date or None, confidence multiplier; < 1 for ambiguous numeric dates)
+    """
+    raw = raw.strip().rstrip(",.")
+    try:
+        match = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", raw)
+        if match:
+            year, month, day = map(int, match.groups())
+            return date(year, month, day).isoformat(), 1.0
+
+        match = re.fullmatch(r"(\d{1,2})[./-](\d{1,2})[./-](\d{2,4})", raw)
+        if match:
+            first, second, year = map(int, match.groups())
+            if year < 100:
+                year += 2000
+            if first > 12:
+                return date(year, second, first).isoformat(), 1.0
+            if second > 12:
+                return date(year, first, second).isoformat(), 1.0
+            # Both readings are valid; guess from the currency and lower confidence
+            month, day = (first, second) if prefer_month_first else (second, first)
+            return date(year, month, day).isoformat(), 0.6
+
+        match = re.fullmatch(r"(\d{1,2})(?:st|nd|rd|th)?\s+([A-Za-z]{3,9})\.?,?\s+(\d{4})", raw)
+        if match:
+            day, month_name, year = match.groups()
+            month = _MONTHS.get(month_name[:3].lower())
+            if month:
+                return date(int(year), month, int(day)).isoformat(), 1.0
+
+        match = re.fullmatch(r"([A-Za-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})", raw)
+        if match:
+            month_name, day, year = match.groups()
+            month = _MONTHS.get(month_name[:3].lower())
+            if month:
+                return date(int(year), month, int(day)).isoformat(), 1.0
+    except ValueError:
+        pass
+    return None, 0.0
+
+
+def _extract_vendor(text: str) -> Tuple[Optional[str], float]:
+    match, confidence = _first_match(_VENDOR_PATTERNS, text)
+    if match:
+        return match.group(1).strip()[:100], confidence
+
+    # Otherwise the issuer is usually one of the first lines of the page
+    for line in text.splitlines()[:8]:
+        line = line.strip()
+        if len(line) < 3 or not re.search(r"[A-Za-z]{2}", line) or _NOT_VENDOR.search(line):
+            continue
+        if re.search(r"\d{3,}|@|www\.|https?:", line):
+            continue  # Addresses, phone numbers, emails, URLs
+        return line[:100], 0.85 if _COMPANY_SUFFIX.search(line) else 0.5
+    return None, 0.0
+
+
+def extract_locally(text: str) -> LocalExtraction:
+    """
+    Extract invoice fields from a PDF text layer without calling the LLM
+
+    Args:
+        text: Text layer of the invoice
+
+    Returns:
+        LocalExtraction with the result, per-field confidence and missing fields
+    """
+    fields: Dict[str, object] = {}
+    field_confidence: Dict[str, float] = {}
+
+    match, confidence = _first_match(_INVOICE_ID_PATTERNS, text)
+    if match:
+        fields["invoice_id"] = match.group(1).rstrip(".-/")
+        field_confidence["invoice_id"] = confidence
+
+    currency_hint = None
+    for pattern, confidence in _TOTAL_PATTERNS:
+        # Line totals often share the anchor; the amount due is the largest
+        candidates = [
+            (amount, match) for match in pattern.finditer(text)
+            for amount in [parse_amount(match.group("amount"))]
+            if amount is not None and amount > 0
+        ]
+        if candidates:
+            amount, match = max(candidates, key=lambda candidate: candidate[0])
+            fields["amount_due"] = amount
+            field_confidence["amount_due"] = confidence
+            currency_hint = match.group("currency") or match.group("currency_after")
+            break
+
+    code_match = _CURRENCY_CODE.search(text)
+    if currency_hint and currency_hint.upper() in ISO_CURRENCIES:
+        fields["currency_code"], field_confidence["currency_code"] = currency_hint.upper(), 1.0
+    elif code_match:
+        fields["currency_code"], field_confidence["currency_code"] = code_match.group(1), 0.9
+    elif currency_hint in _CURRENCY_SYMBOLS:
+        # "$" is shared by USD, CAD, AUD, ... so a bare symbol is a weaker signal
+        fields["currency_code"] = _CURRENCY_SYMBOLS[currency_hint]
+        field_confidence["currency_code"] = 0.6 if currency_hint == "$" else 0.9
+
+    month_first = fields.get("currency_code", "USD") == "USD"
+    for field, patterns in (("invoice_date", _INVOICE_DATE_PATTERNS), ("due_date", _DUE_DATE_PATTERNS)):
+        match, confidence = _first_match(patterns, text)
+        if match:
+            value, certainty = parse_date(match.group("date"), month_first)
+            if value:
+                fields[field] = value
+                field_confidence[field] = confidence * certainty
+
+    vendor, confidence = _extract_vendor(text)
+    if vendor:
+        fields["vendor_name"] = vendor
+        field_confidence["vendor_name"] = confidence
+
+    score = sum(_FIELD_WEIGHTS[field] * value for field, value in field_confidence.items())
+    required = [field.strip() for field in settings.LOCAL_EXTRACTION_REQUIRED_FIELDS.split(",") if field.strip()]
+    missing = [field for field in required if field not in fields]
+
+    result = InvoiceExtractionResponse(**fields, confidence_score=round(score, 3))
+    if "currency_code" not in fields:
+        result.currency_code = None
+    return LocalExtraction(result, field_confidence, missing)
+
+
+def try_local_extraction(text: str) -> Optional[InvoiceExtractionResponse]:
+    """
+    Run the local extractor and return its result only if it is good enough
+
+    Args:
+        text: Text layer of the invoice
+
+    Returns:
+        InvoiceExtractionResponse, or None if Gemini is needed
+    """
+    if not settings.LOCAL_EXTRACTION_ENABLED or not text.strip():
+        return None
+
+    extraction = extract_locally(text)
+    if extraction.is_confident:
+        logger.debug("Local extraction accepted (confidence %.2f)", extraction.confidence)
+        extraction.result.extraction_method = "local"
+        return extraction.result
+
+    if logger.isEnabledFor(logging.DEBUG):
+        reason = f"missing {', '.join(extraction.missing)}" if extraction.missing else f"confidence {extraction.confidence:.2f}"
+        logger.debug("Local extraction not confident (%s), using Gemini", reason)
+    return None
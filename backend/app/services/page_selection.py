@@ -0,0 +1,152 @@
+"""
+Page selection for multi-page scanned invoices
+Ranks pages with cheap local signals (page text keywords, ink layout from a
+tiny thumbnail, position in the document) so only the pages most likely to
+hold totals and invoice numbers are rendered and sent to Gemini.
+Runs inside document engine workers, so it takes no app settings directly.
+"""
+import math
+import re
+from typing import List, Optional, Tuple
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+# Words that show up on the page carrying the invoice header and totals
+_KEYWORD_PATTERN = re.compile(
+    r"\b(invoice|inv\s*no|bill\s+to|total|subtotal|amount\s+due|balance\s+due|"
+    r"due\s+date|tax|gst|vat|payable|remit)\b|[$€£₹¥]",
+    re.IGNORECASE
+)
+
+# Resolution of the thumbnail used for layout scoring, and its grid size
+_THUMBNAIL_DPI = 24
+_GRID = 8
+
+
+class PageSelectionOptions:
+    """Tunables for page selection (picklable, built from settings by callers)"""
+
+    def __init__(self, max_pages: int = 4, prefer_first: bool = True, prefer_last: bool = True):
+        """
+        Args:
+            max_pages: Maximum pages sent to the model (0 = no limit)
+            prefer_first: Always keep the first page
+            prefer_last: Always keep the last page
+        """
+        self.max_pages = max_pages
+        self.prefer_first = prefer_first
+        self.prefer_last = prefer_last
+
+
+def ink_layout(page: fitz.Page) -> Tuple[float, float]:
+    """
+    Measure ink coverage and layout variation from a tiny grayscale render
+
+    The page is reduced to an 8x8 grid of average ink levels. Invoice pages
+    (headers, tables, totals boxes, white space) vary a lot between cells;
+    terms and conditions are an even wall of text.
+
+    Args:
+        page: Loaded PyMuPDF page
+
+    Returns:
+        (coverage 0..1, coefficient of variation across grid cells)
+    """
+    pix = page.get_pixmap(dpi=_THUMBNAIL_DPI, colorspace=fitz.csGRAY)
+    if not pix.width or not pix.height:
+        return 0.0, 0.0
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    cells = [255 - value for value in img.resize((_GRID, _GRID), Image.BOX).getdata()]
+    mean = sum(cells) / len(cells)
+    if mean == 0:
+        return 0.0, 0.0
+    variance = sum((cell - mean) ** 2 for cell in cells) / len(cells)
+    return mean / 255.0, math.sqrt(variance) / mean
+
+
+def score_page(
+    index: int,
+    page_count: int,
+    text: str,
+    layout: Optional[Tuple[float, float]]
+) -> float:
+    """
+    Score how likely a page is to carry invoice header/totals
+
+    Args:
+        index: Zero-based page index
+        page_count: Number of pages in the document
+        text: Page text layer ("" for scanned pages)
+        layout: (coverage, variation) from ink_layout(), or None if not measured
+
+    Returns:
+        Higher is better
+    """
+    score = 0.0
+
+    # Invoices put the number up front and totals at the end
+    if index == 0:
+        score += 2.0
+    elif index == page_count - 1:
+        score += 1.0
+    else:
+        score += 0.5 * (1.0 - index / page_count)
+
+    if text:
+        score += min(len(_KEYWORD_PATTERN.findall(text)), 10) * 0.3
+
+    if layout is not None:
+        coverage, variation = layout
+        if coverage < 0.002:
+            score -= 3.0  # Blank or near-blank page
+        else:
+            score += min(variation, 2.0)
+            if coverage > 0.15:
+                score -= 1.0  # Wall of text: usually terms and conditions
+
+    return score
+
+
+def select_pages(
+    pdf_document: fitz.Document,
+    page_texts: List[str],
+    options: PageSelectionOptions,
+    candidates: Optional[List[int]] = None
+) -> List[int]:
+    """
+    Choose which pages to send to the model
+
+    Args:
+        pdf_document: Open PyMuPDF document
+        page_texts: Text layer per page
+        options: Selection options
+        candidates: Pages to choose from (default: all); the first and last
+            candidate stand in for the first and last page
+
+    Returns:
+        Zero-based page indices in document order
+    """
+    page_count = len(pdf_document)
+    if candidates is None:
+        candidates = list(range(page_count))
+    if not candidates or not options.max_pages or len(candidates) <= options.max_pages:
+        return list(candidates)
+
+    scores = {
+        index: score_page(index, page_count, page_texts[index], ink_layout(pdf_document[index]))
+        for index in candidates
+    }
+
+    selected = set()
+    if options.prefer_first:
+        selected.add(candidates[0])
+    if options.prefer_last and len(selected) < options.max_pages:
+        selected.add(candidates[-1])
+
+    for index in sorted(scores, key=lambda i: scores[i], reverse=True):
+        if len(selected) >= options.max_pages or (selected and scores[index] < 0):
+            break  # Don't pad the selection with blank or boilerplate pages
+        selected.add(index)
+
+    return sorted(selected)
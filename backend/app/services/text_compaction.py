@@ -0,0 +1,204 @@
+"""
+Compaction of PDF text before it is embedded in Gemini prompts
+The raw text layer repeats headers and footers on every page, carries runs
+of whitespace and often pages of terms and conditions. Compaction collapses
+whitespace, drops lines repeated across pages and known boilerplate, caps
+the size (keeping the first and last pages and lines with numbers or
+currency symbols from the pages in between) and marks page boundaries.
+"""
+import logging
+import re
+from typing import List
+from app.core.config import settings
+from app.core.metrics import PROMPT_TEXT_CHARS, PROMPT_TEXT_LINES_DROPPED
+
+logger = logging.getLogger(__name__)
+
+
+# Lines that carry invoice data: digits or currency symbols
+_NUMERIC = re.compile(r"[\d$€£₹¥]")
+
+# Page numbering changes per page but is noise everywhere
+_PAGE_NUMBER = re.compile(r"^(?:page\s*)?\d+\s*(?:/|of)\s*\d+$|^page\s*\d+$", re.I)
+
+# Single boilerplate lines (only dropped when they carry no numbers)
+_BOILERPLATE_LINE = re.compile(
+    r"\b(?:all\s+rights\s+reserved|computer[\s-]+generated|does\s+not\s+require\s+(?:a\s+)?signature"
+    r"|thank\s+you\s+for\s+(?:your\s+)?business|if\s+you\s+have\s+any\s+questions"
+    r"|this\s+(?:e-?mail|document)\s+(?:is|may\s+be)\s+confidential|printed\s+on\s+recycled)\b",
+    re.I
+)
+
+# Headings that start a boilerplate block running to the next blank line
+_BOILERPLATE_HEADING = re.compile(
+    r"^(?:standard\s+)?(?:terms\s*(?:&|and)\s*conditions|general\s+terms|legal\s+notice|disclaimer"
+    r"|privacy\s+(?:notice|policy)|return\s+policy|warranty)\b[\s:.]*$",
+    re.I
+)
+
+# Lines kept from the top of the first page when it has to be trimmed (vendor header)
+_HEADER_LINES = 8
+
+_OMITTED = "[... {count} line(s) omitted ...]"
+
+# Room reserved per page for its marker and an omitted-lines note
+_PAGE_OVERHEAD = 64
+
+
+class CompactedText:
+    """Prompt-ready text plus before/after sizes"""
+
+    def __init__(self, text: str, input_chars: int, pages: int, lines_dropped: int):
+        self.text = text
+        self.input_chars = input_chars
+        self.output_chars = len(text)
+        self.pages = pages
+        self.lines_dropped = lines_dropped
+
+    @property
+    def saved_ratio(self) -> float:
+        """Share of the input removed (0.0 - 1.0)"""
+        if not self.input_chars:
+            return 0.0
+        return max(1 - self.output_chars / self.input_chars, 0.0)
+
+
+def _page_lines(page_text: str) -> List[str]:
+    """
+    Whitespace-collapsed lines of one page without boilerplate blocks;
+    blank lines only end blocks and are not kept
+    """
+    lines: List[str] = []
+    in_block = False
+    for raw_line in page_text.splitlines():
+        line = re.sub(r"\s+", " ", raw_line).strip()
+        if not line:
+            in_block = False
+            continue
+        if _BOILERPLATE_HEADING.match(line):
+            in_block = True
+            continue
+        if in_block and not _NUMERIC.search(line):
+            continue
+        in_block = False
+        if _PAGE_NUMBER.match(line) or (_BOILERPLATE_LINE.search(line) and not _NUMERIC.search(line)):
+            continue
+        lines.append(line)
+    return lines
+
+
+def _repeated_lines(pages: List[List[str]]) -> set:
+    """Lines that appear on at least half the pages of a multi-page document"""
+    if len(pages) < 2:
+        return set()
+    counts = {}
+    for lines in pages:
+        for key in {line.lower() for line in lines}:
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(2, (len(pages) + 1) // 2)
+    return {key for key, count in counts.items() if count >= threshold}
+
+
+def _size(lines: List[str]) -> int:
+    return sum(len(line) + 1 for line in lines)
+
+
+def _trim(lines: List[str], budget: int, keep_header: bool) -> List[str]:
+    """Reduce a page to its header (optionally) and numeric lines within a character budget"""
+    kept: List[str] = []
+    omitted = 0
+    for position, line in enumerate(lines):
+        wanted = (keep_header and position < _HEADER_LINES) or _NUMERIC.search(line)
+        if wanted and _size(kept) + len(line) + 1 <= budget:
+            if omitted:
+                kept.append(_OMITTED.format(count=omitted))
+                omitted = 0
+            kept.append(line)
+        else:
+            omitted += 1
+    if omitted:
+        kept.append(_OMITTED.format(count=omitted))
+    return kept
+
+
+def compact_pages(page_texts: List[str], max_chars: int) -> CompactedText:
+    """
+    Compact a PDF's per-page text for a prompt
+
+    Args:
+        page_texts: Text layer of each page
+        max_chars: Output size cap (0 = no cap)
+
+    Returns:
+        CompactedText with page-marked text and size counts
+    """
+    input_chars = sum(len(text) for text in page_texts)
+    pages = [_page_lines(text) for text in page_texts]
+    total_lines = sum(len(text.splitlines()) for text in page_texts)
+
+    # Repeated headers/footers are kept where they first appear only
+    repeated = _repeated_lines(pages)
+    seen = set()
+    for index, lines in enumerate(pages):
+        unique = []
+        for line in lines:
+            key = line.lower()
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            unique.append(line)
+        pages[index] = unique
+
+    last = len(pages) - 1
+    budget = max(max_chars - _PAGE_OVERHEAD * len(pages), 0)
+    if max_chars and sum(_size(lines) for lines in pages) > budget:
+        # First and last pages hold the header and totals and are sized first
+        # (up to two thirds of the budget when there are pages in between);
+        # the pages in between only contribute lines with numbers
+        edge_budget = budget * 2 // 3 if len(pages) > 2 else budget
+        if last > 0 and _size(pages[last]) > edge_budget // 2:
+            pages[last] = _trim(pages[last], edge_budget // 2, keep_header=False)
+        first_budget = edge_budget - (_size(pages[last]) if last > 0 else 0)
+        if _size(pages[0]) > first_budget:
+            pages[0] = _trim(pages[0], first_budget, keep_header=True)
+        remaining = budget - sum(_size(pages[index]) for index in {0, last})
+        for index in range(1, last):
+            pages[index] = _trim(pages[index], max(remaining, 0), keep_header=False)
+            remaining -= _size(pages[index])
+
+    sections = []
+    for index, lines in enumerate(pages):
+        if not lines or all(line.startswith("[... ") for line in lines):
+            continue
+        if len(pages) > 1:
+            lines = [f"--- Page {index + 1} of {len(pages)} ---"] + lines
+        sections.append("\n".join(lines))
+    text = "\n".join(sections)
+
+    kept_lines = sum(1 for lines in pages for line in lines if not line.startswith("[... "))
+    return CompactedText(text, input_chars, len(page_texts), max(total_lines - kept_lines, 0))
+
+
+def compact_for_prompt(page_texts: List[str]) -> str:
+    """
+    Text to embed in an extraction prompt (unchanged when compaction is disabled)
+
+    Args:
+        page_texts: Text layer of each page
+
+    Returns:
+        Compacted, page-marked text
+    """
+    if not settings.TEXT_COMPACTION_ENABLED:
+        return "".join(page_texts)
+
+    compacted = compact_pages(page_texts, settings.TEXT_COMPACTION_MAX_CHARS)
+    PROMPT_TEXT_CHARS.labels(direction="input").inc(compacted.input_chars)
+    PROMPT_TEXT_CHARS.labels(direction="output").inc(compacted.output_chars)
+    PROMPT_TEXT_LINES_DROPPED.inc(compacted.lines_dropped)
+    logger.debug(
+        "Compacted invoice text: %d -> %d chars (%.0f%% smaller, %d line(s) dropped)",
+        compacted.input_chars, compacted.output_chars, compacted.saved_ratio * 100, compacted.lines_dropped
+    )
+    return compacted.text
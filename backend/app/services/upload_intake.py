@@ -0,0 +1,214 @@
+"""
+Upload intake: early size rejection, content sniffing and hashing
+Oversized single-file uploads are refused before their body is parsed
+(Content-Length, then a running byte count while the body streams in).
+The parsed upload is already spooled by Starlette (memory, then disk); it
+is read in chunks into one pre-sized buffer while counting bytes, hashing
+and sniffing the real file type from its magic bytes, so the client's
+Content-Type is never trusted and no full-size copy is made on the way.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import BinaryIO, Iterable, Optional
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10MB per invoice file
+
+# Multipart boundaries, part headers and small form fields on top of the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+CHUNK_SIZE = 256 * 1024
+
+# A PDF header may follow a little leading junk (PDF 1.7, 7.5.2)
+_PDF_HEADER_WINDOW = 1024
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """
+    Detect a supported invoice file type from its first bytes
+
+    Args:
+        head: Start of the file (the first chunk is plenty)
+
+    Returns:
+        application/pdf, image/jpeg, image/png, or None if unsupported
+    """
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if b"%PDF-" in head[:_PDF_HEADER_WINDOW]:
+        return "application/pdf"
+    return None
+
+
+def stored_file_type(content_type: str) -> str:
+    """Short file type stored on the invoice (pdf, jpeg, png) for a sniffed MIME type"""
+    return "pdf" if content_type == "application/pdf" else content_type.split("/")[1]
+
+
+def content_sha256(data: bytes) -> str:
+    """SHA-256 hex digest of file contents (what intake records for uploads)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def too_large_error(
+    size: Optional[int] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    subject: str = "File"
+) -> HTTPException:
+    """413 for an upload over the size limit"""
+    limit = f"{max_bytes / (1024 * 1024):.0f}MB"
+    detail = f"{subject} size ({size / (1024 * 1024):.2f}MB) exceeds maximum allowed size ({limit})" \
+        if size is not None else f"{subject} exceeds maximum allowed size ({limit})"
+    return HTTPException(status_code=413, detail=detail)
+
+
+class UploadIntake:
+    """
+    An accepted upload: contents plus what intake learned about them
+
+    data is a bytearray (a buffer, not a bytes copy); it can be passed
+    anywhere the processing pipeline takes file bytes.
+    """
+
+    def __init__(
+        self,
+        filename: Optional[str],
+        content_type: str,
+        declared_content_type: Optional[str],
+        data: bytearray,
+        sha256: str
+    ):
+        self.filename = filename
+        self.content_type = content_type
+        self.declared_content_type = declared_content_type
+        self.data = data
+        self.size = len(data)
+        self.sha256 = sha256
+
+
+def _read_source(source: BinaryIO, size_hint: Optional[int], max_bytes: int) -> tuple:
+    """
+    Read a file object into one buffer in chunks, hashing as it goes and
+    sniffing the type from the first chunk
+
+    Returns:
+        (buffer, sha256 hex digest, sniffed content type)
+    """
+    # One spare byte detects bodies longer than declared (or over the limit)
+    buffer = bytearray(min(size_hint or CHUNK_SIZE, max_bytes) + 1)
+    view = memoryview(buffer)
+    digest = hashlib.sha256()
+    content_type = None
+    length = 0
+    try:
+        while True:
+            if length == len(buffer):
+                if length > max_bytes:
+                    raise too_large_error(max_bytes=max_bytes)
+                view.release()
+                buffer.extend(bytes(min(len(buffer), max_bytes + 1 - length)))
+                view = memoryview(buffer)
+            read = source.readinto(view[length:length + CHUNK_SIZE])
+            if not read:
+                break
+            if content_type is None:
+                content_type = sniff_content_type(view[:min(length + read, _PDF_HEADER_WINDOW)].tobytes())
+                if content_type is None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="File content is not a supported type. Please upload PDF, JPG, or PNG."
+                    )
+            digest.update(view[length:length + read])
+            length += read
+            if length > max_bytes:
+                raise too_large_error(max_bytes=max_bytes)
+    finally:
+        view.release()
+
+    if content_type is None:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    del buffer[length:]
+    return buffer, digest.hexdigest(), content_type
+
+
+async def receive_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> UploadIntake:
+    """
+    Accept an uploaded invoice file
+
+    Args:
+        file: Upload from a multipart request
+        max_bytes: Size limit
+
+    Returns:
+        UploadIntake with the sniffed content type and SHA-256
+
+    Raises:
+        HTTPException: 413 if too large, 400 if empty or not a PDF/JPEG/PNG
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise too_large_error(file.size, max_bytes)
+
+    await file.seek(0)
+    # The spool may have rolled over to disk, so read off the event loop
+    data, sha256, content_type = await asyncio.to_thread(_read_source, file.file, file.size, max_bytes)
+    if content_type != file.content_type:
+        logger.info(
+            "Upload content type differs from the declared one",
+            extra={"upload_filename": file.filename, "declared": file.content_type, "sniffed": content_type}
+        )
+    return UploadIntake(file.filename, content_type, file.content_type, data, sha256)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Refuse oversized request bodies on upload routes before they are parsed
+
+    Checks Content-Length up front, then counts body bytes as they arrive
+    (chunked requests carry no length); the request fails with 413 as soon
+    as the limit is passed instead of after the whole body is spooled.
+    subject names what is limited in the error ("File", or "Upload" for
+    multi-file requests).
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], max_body_bytes: int, subject: str = "File"):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_bytes = max_body_bytes
+        self.subject = subject
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            error = too_large_error(max_bytes=self.max_body_bytes - MULTIPART_OVERHEAD_BYTES, subject=self.subject)
+            await JSONResponse({"detail": error.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    # Raised from inside body parsing; FastAPI re-raises HTTPExceptions as-is
+                    raise too_large_error(max_bytes=self.max_body_bytes - MULTIPART_OVERHEAD_BYTES, subject=self.subject)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,578 @@
+"""
+Per-vendor extraction templates learned from confirmed invoices
+When a user confirms or edits an invoice, we know the correct field values
+for that vendor's layout. The template records where each value sat in the
+PDF text (the label before it or the line above it, which occurrence of that
+anchor, and what kind of value follows), keyed by a fingerprint of the
+layout's stable header lines. New PDFs with the same fingerprint are
+extracted by replaying those rules, without calling Gemini. A template whose
+extraction is later corrected is dropped and relearned from the correction.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.invoice import Invoice
+from app.models.vendor_template import VendorTemplate
+from app.schemas.invoice import InvoiceExtractionResponse
+from app.services.local_extraction import (
+    AMOUNT_PATTERN,
+    DATE_PATTERN,
+    ID_PATTERN,
+    ISO_CURRENCIES,
+    parse_amount,
+    parse_date
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Fields a template can fill, and how their values are located
+TEMPLATE_FIELDS = ("invoice_id", "vendor_name", "amount_due", "due_date", "invoice_date", "currency_code")
+
+# Fields that must be learned for a template to be worth keeping
+REQUIRED_TEMPLATE_FIELDS = ("invoice_id", "amount_due")
+
+# Confidence reported for templated extractions
+TEMPLATE_CONFIDENCE = 0.97
+
+# How many digit-free header lines make up a layout fingerprint
+FINGERPRINT_LINES = 6
+
+# Anchors longer than this are trimmed to their tail (the label next to the value)
+MAX_ANCHOR_CHARS = 40
+
+# Write hit counts back to the database at most this often per template
+TOUCH_INTERVAL_SECONDS = 60.0
+
+# Cached "no template for this fingerprint" entries expire after this long
+MISS_TTL_SECONDS = 300.0
+
+# Cached templates are reloaded after this long, so a template invalidated
+# or relearned in another worker process stops being applied here too
+HIT_TTL_SECONDS = 60.0
+
+_VALUE_PATTERNS = {
+    "id": re.compile(r"\s*" + ID_PATTERN, re.I),
+    "amount": re.compile(r"\s*" + AMOUNT_PATTERN),
+    "date": re.compile(r"\s*" + DATE_PATTERN),
+}
+
+# Currency symbol or code printed between a label and its amount
+_CURRENCY_SUFFIX = re.compile(r"(?:[$€£₹¥]|Rs\.?|\b(?:" + "|".join(sorted(ISO_CURRENCIES)) + r"))\s*$")
+
+_MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+
+
+# --- Layout fingerprint ---
+
+def _lines(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line.strip().lower())
+
+
+def _tail(label: str) -> str:
+    """Last MAX_ANCHOR_CHARS of a normalized label, cut at a word boundary"""
+    if len(label) <= MAX_ANCHOR_CHARS:
+        return label.strip()
+    tail = label[-MAX_ANCHOR_CHARS:]
+    return tail.split(" ", 1)[1].strip() if " " in tail else tail.strip()
+
+
+def layout_fingerprint(text: str) -> Optional[str]:
+    """
+    Fingerprint of a document layout from its first digit-free lines
+    (vendor header, labels, the user's own billing address), which stay the
+    same across one vendor's invoices while numbers and dates change
+
+    Returns:
+        Hex digest, or None if the text has too little stable structure
+    """
+    header: List[str] = []
+    for line in _lines(text):
+        normalized = _normalize(line)
+        if len(normalized) < 3 or re.search(r"\d", normalized) or not re.search(r"[a-z]{2}", normalized):
+            continue
+        if normalized not in header:
+            header.append(normalized)
+        if len(header) == FINGERPRINT_LINES:
+            break
+    if len(header) < 3:
+        return None
+    return hashlib.sha256("\n".join(header).encode("utf-8")).hexdigest()
+
+
+# --- Learning ---
+
+def _amount_forms(amount: float) -> List[str]:
+    forms = [f"{amount:,.2f}", f"{amount:.2f}"]
+    forms.append(forms[0].replace(",", "\0").replace(".", ",").replace("\0", "."))  # 1.234,50
+    forms.append(f"{amount:.2f}".replace(".", ","))
+    if amount == int(amount):
+        forms.extend([f"{int(amount):,}", str(int(amount))])
+    return forms
+
+
+def _date_forms(iso_date: str) -> List[Tuple[str, bool]]:
+    """Ways a date may be printed, with whether the form is month-first"""
+    try:
+        value = date.fromisoformat(iso_date)
+    except (TypeError, ValueError):
+        return []
+    y, m, d = value.year, value.month, value.day
+    month, short_month = _MONTH_NAMES[m - 1], _MONTH_NAMES[m - 1][:3]
+    forms = [(value.isoformat(), False)]
+    for day_text in (f"{d:02d}", str(d)):
+        forms.extend([
+            (f"{month} {day_text}, {y}", False),
+            (f"{short_month} {day_text}, {y}", False),
+            (f"{day_text} {month} {y}", False),
+            (f"{day_text} {short_month} {y}", False),
+        ])
+    for separator in "/.-":
+        for month_text, day_text in ((f"{m:02d}", f"{d:02d}"), (str(m), str(d))):
+            for year_text in (str(y), f"{y % 100:02d}"):
+                forms.append((separator.join((month_text, day_text, year_text)), True))
+                forms.append((separator.join((day_text, month_text, year_text)), False))
+    return forms
+
+
+def _find_values(lines: List[str], forms: List[str], from_bottom: bool = False) -> Iterator[Tuple[int, int]]:
+    """
+    Occurrences of any printed form as a whole token
+
+    Yields:
+        (line index, start offset), top to bottom unless from_bottom
+    """
+    order = range(len(lines) - 1, -1, -1) if from_bottom else range(len(lines))
+    for index in order:
+        line = lines[index]
+        lowered = line.lower()
+        for form in sorted(forms, key=len, reverse=True):
+            start = lowered.find(form.lower())
+            while start != -1:
+                end = start + len(form)
+                before = line[start - 1] if start else " "
+                after = line[end] if end < len(line) else " "
+                if not before.isalnum() and not (after.isalnum() or (after in ".," and line[end + 1:end + 2].isdigit())):
+                    yield index, start
+                start = lowered.find(form.lower(), start + 1)
+
+
+def _anchor_pattern(anchor: str) -> re.Pattern:
+    pattern = r"\s+".join(re.escape(part) for part in anchor.split())
+    if anchor[:1].isalnum():
+        pattern = r"(?<![a-z0-9])" + pattern
+    return re.compile(pattern, re.I)
+
+
+def _anchor_lines(lines: List[str], anchor: str) -> List[Tuple[int, int]]:
+    """(line index, end of anchor) for every line containing the anchor"""
+    pattern = _anchor_pattern(anchor)
+    matches = []
+    for index, line in enumerate(lines):
+        match = pattern.search(line)
+        if match:
+            matches.append((index, match.end()))
+    return matches
+
+
+def _learn_rule(lines: List[str], field: str, kind: str, forms: List[str], month_first: bool = False) -> Optional[dict]:
+    """Rule locating one field relative to the label before it or the line above it"""
+    # Totals sit at the bottom; searching upwards skips line items with the same amount
+    for index, start in _find_values(lines, forms, from_bottom=kind == "amount"):
+        prefix = lines[index][:start]
+        if kind == "amount":
+            prefix = _CURRENCY_SUFFIX.sub("", prefix)
+        prefix = _tail(_normalize(prefix))
+
+        if prefix and not re.search(r"\d", prefix):
+            anchor, offset = prefix, 0
+        elif not prefix and index > 0 and not re.search(r"\d", lines[index - 1]):
+            anchor, offset = _tail(_normalize(lines[index - 1])), 1
+        else:
+            continue  # No stable label to hang the value on
+
+        anchor_indices = [line_index for line_index, _end in _anchor_lines(lines, anchor)]
+        if index - offset not in anchor_indices:
+            continue
+        occurrence = anchor_indices.index(index - offset)
+        return {
+            "field": field,
+            "kind": kind,
+            "anchor": anchor,
+            "offset": offset,
+            "occurrence": occurrence,
+            "occurrence_from_end": len(anchor_indices) - 1 - occurrence,
+            "position": round(index / max(len(lines) - 1, 1), 3),
+            "month_first": month_first,
+        }
+    return None
+
+
+def learn_rules(text: str, values: Dict[str, object]) -> List[dict]:
+    """
+    Learn field rules from a document and its confirmed field values
+
+    Args:
+        text: PDF text layer
+        values: Confirmed invoice fields (TEMPLATE_FIELDS)
+
+    Returns:
+        Rules that reproduce the confirmed values from the text
+        (empty if the required fields can't be located)
+    """
+    lines = _lines(text)
+    rules: List[dict] = []
+
+    if values.get("invoice_id"):
+        rule = _learn_rule(lines, "invoice_id", "id", [str(values["invoice_id"])])
+        if rule:
+            rules.append(rule)
+    if values.get("amount_due") is not None:
+        rule = _learn_rule(lines, "amount_due", "amount", _amount_forms(float(values["amount_due"])))
+        if rule:
+            rules.append(rule)
+    date_rules = []
+    for field in ("invoice_date", "due_date"):
+        forms = _date_forms(values.get(field))
+        for month_first in (False, True):
+            rule = _learn_rule(lines, field, "date", [form for form, first in forms if first == month_first], month_first)
+            if rule:
+                # 04/04/2024 reads the same both ways and says nothing about the layout
+                if values[field][5:7] == values[field][8:10]:
+                    rule["month_first"] = None
+                date_rules.append(rule)
+                break
+    known_order = [rule["month_first"] for rule in date_rules if rule["month_first"] is not None]
+    for rule in date_rules:
+        if rule["month_first"] is None:
+            rule["month_first"] = known_order[0] if known_order else values.get("currency_code") in (None, "USD")
+    rules.extend(date_rules)
+
+    # Vendor and currency don't change within one vendor's layout
+    for field in ("vendor_name", "currency_code"):
+        if values.get(field):
+            rules.append({"field": field, "kind": "constant", "value": values[field]})
+
+    # Keep only rules that give back the confirmed value on the source document
+    replayed = apply_rules(text, rules, partial=True) or {}
+    rules = [rule for rule in rules if replayed.get(rule["field"]) == values.get(rule["field"])]
+    learned = {rule["field"] for rule in rules}
+    if not all(field in learned for field in REQUIRED_TEMPLATE_FIELDS):
+        return []
+    return rules
+
+
+# --- Applying ---
+
+def _apply_rule(lines: List[str], rule: dict) -> Optional[object]:
+    if rule["kind"] == "constant":
+        return rule["value"]
+
+    anchors = _anchor_lines(lines, rule["anchor"])
+    if not anchors:
+        return None
+    # Rules learned near the bottom (totals) count occurrences from the end,
+    # so a longer list of line items doesn't shift them
+    if rule["position"] > 0.5:
+        slot = len(anchors) - 1 - rule["occurrence_from_end"]
+    else:
+        slot = rule["occurrence"]
+    if not 0 <= slot < len(anchors):
+        return None
+
+    index, anchor_end = anchors[slot]
+    if rule["offset"]:
+        index += rule["offset"]
+        if index >= len(lines):
+            return None
+        remainder = lines[index]
+    else:
+        remainder = lines[index][anchor_end:]
+
+    match = _VALUE_PATTERNS[rule["kind"]].match(remainder)
+    if not match:
+        return None
+    if rule["kind"] == "id":
+        return match.group(1).rstrip(".-/")
+    if rule["kind"] == "amount":
+        return parse_amount(match.group("amount"))
+    value, _certainty = parse_date(match.group("date"), rule["month_first"])
+    return value
+
+
+def apply_rules(text: str, rules: List[dict], partial: bool = False) -> Optional[Dict[str, object]]:
+    """
+    Replay template rules on a document
+
+    Args:
+        text: PDF text layer
+        rules: Rules from learn_rules()
+        partial: Return whatever resolved instead of None on the first miss
+
+    Returns:
+        Field values, or None if a rule didn't resolve (layout drifted)
+    """
+    lines = _lines(text)
+    values: Dict[str, object] = {}
+    for rule in rules:
+        value = _apply_rule(lines, rule)
+        if value is None and not partial:
+            return None
+        if value is not None:
+            values[rule["field"]] = value
+    return values
+
+
+# --- Store ---
+
+class _CachedTemplate:
+    """In-memory copy of a template row (or a cached miss when rules is None)"""
+
+    def __init__(self, template_id: Optional[str], rules: Optional[List[dict]]):
+        self.template_id = template_id
+        self.rules = rules
+        self.loaded_at = time.monotonic()
+        self.touched_at = float("-inf")  # Usage not written back yet
+        self.pending_hits = 0
+
+
+class VendorTemplateStore:
+    """
+    Learned templates with an in-memory LRU index keyed by (user, fingerprint)
+
+    The database is the source of truth; the index keeps hot templates (and
+    recent misses) in memory so lookups cost a dict access plus the regex
+    replay. Entries expire (HIT_TTL_SECONDS, MISS_TTL_SECONDS) so changes
+    made by other worker processes are picked up. Each user keeps at most
+    max_per_user templates in the database; the least recently used ones are
+    evicted when a new one is learned.
+    """
+
+    def __init__(self, max_cached: int = 1024, max_per_user: int = 200):
+        """
+        Initialize template store
+
+        Args:
+            max_cached: Templates (and misses) held in the in-memory index
+            max_per_user: Templates kept per user in the database
+        """
+        self.max_cached = max_cached
+        self.max_per_user = max_per_user
+        self._index: "OrderedDict[Tuple[str, str], _CachedTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Public API ---
+
+    def extract(self, user_id: str, text: str) -> Optional[InvoiceExtractionResponse]:
+        """
+        Extract a document with the user's template for its layout
+
+        Args:
+            user_id: Owner of the templates
+            text: PDF text layer
+
+        Returns:
+            InvoiceExtractionResponse, or None if there is no matching template
+            or it no longer fits the document
+        """
+        fingerprint = layout_fingerprint(text)
+        if fingerprint is None:
+            return None
+
+        entry = self._lookup(user_id, fingerprint)
+        if entry.rules is None:
+            return None
+
+        values = apply_rules(text, entry.rules)
+        if values is None:
+            logger.debug("Vendor template %s did not fit, falling back", fingerprint[:8])
+            return None
+
+        self._touch(entry)
+        logger.debug("Extracted with vendor template %s", fingerprint[:8])
+        return InvoiceExtractionResponse(
+            **{"currency_code": None, **values},
+            confidence_score=TEMPLATE_CONFIDENCE,
+            extraction_method="template"
+        )
+
+    def learn(self, db: Session, invoice: Invoice) -> Optional[VendorTemplate]:
+        """
+        Learn (or refresh) the template for a confirmed invoice's layout
+
+        Args:
+            db: Database session
+            invoice: Invoice whose field values the user confirmed
+
+        Returns:
+            Stored VendorTemplate, or None if nothing could be learned
+        """
+        if not invoice.extracted_text:
+            return None
+        fingerprint = layout_fingerprint(invoice.extracted_text)
+        if fingerprint is None:
+            return None
+
+        values = {field: getattr(invoice, field) for field in TEMPLATE_FIELDS}
+        rules = learn_rules(invoice.extracted_text, values)
+        if not rules:
+            return None
+
+        template = db.query(VendorTemplate).filter(
+            VendorTemplate.user_id == invoice.user_id,
+            VendorTemplate.fingerprint == fingerprint
+        ).first()
+        if template is None:
+            template = VendorTemplate(user_id=invoice.user_id, fingerprint=fingerprint)
+            db.add(template)
+        template.vendor_name = invoice.vendor_name
+        template.field_rules = json.dumps(rules)
+        template.source_invoice_id = invoice.id
+        template.last_used_at = datetime.utcnow()
+        db.flush()
+
+        self._evict_stored(db, invoice.user_id)
+        db.commit()
+
+        self._remember(invoice.user_id, fingerprint, _CachedTemplate(template.id, rules))
+        logger.info("Learned vendor template %s for %s (%d fields)", fingerprint[:8], invoice.vendor_name, len(rules))
+        return template
+
+    def invalidate(self, db: Session, user_id: str, text: str) -> None:
+        """
+        Drop the template for a document's layout
+
+        Args:
+            db: Database session
+            user_id: Owner of the template
+            text: PDF text layer of a document with that layout
+        """
+        fingerprint = layout_fingerprint(text or "")
+        if fingerprint is None:
+            return
+        db.query(VendorTemplate).filter(
+            VendorTemplate.user_id == user_id,
+            VendorTemplate.fingerprint == fingerprint
+        ).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self._index.pop((user_id, fingerprint), None)
+        logger.info("Invalidated vendor template %s", fingerprint[:8])
+
+    def clear(self) -> None:
+        """Empty the in-memory index"""
+        with self._lock:
+            self._index.clear()
+
+    # --- Internals ---
+
+    def _lookup(self, user_id: str, fingerprint: str) -> _CachedTemplate:
+        key = (user_id, fingerprint)
+        with self._lock:
+            cached = self._index.get(key)
+            if cached is not None:
+                ttl = MISS_TTL_SECONDS if cached.rules is None else HIT_TTL_SECONDS
+                if time.monotonic() - cached.loaded_at < ttl:
+                    self._index.move_to_end(key)
+                    return cached
+
+        db = SessionLocal()
+        try:
+            template = db.query(VendorTemplate).filter(
+                VendorTemplate.user_id == user_id,
+                VendorTemplate.fingerprint == fingerprint
+            ).first()
+            entry = _CachedTemplate(template.id, json.loads(template.field_rules)) if template else _CachedTemplate(None, None)
+        finally:
+            db.close()
+
+        if cached is not None and cached.template_id is not None and cached.template_id == entry.template_id:
+            # Same template reloaded: keep its unwritten usage
+            with self._lock:
+                entry.touched_at, entry.pending_hits = cached.touched_at, cached.pending_hits
+
+        self._remember(user_id, fingerprint, entry)
+        return entry
+
+    def _remember(self, user_id: str, fingerprint: str, entry: _CachedTemplate) -> None:
+        with self._lock:
+            self._index[(user_id, fingerprint)] = entry
+            self._index.move_to_end((user_id, fingerprint))
+            while len(self._index) > self.max_cached:
+                self._index.popitem(last=False)
+
+    def _touch(self, entry: _CachedTemplate) -> None:
+        """Count a hit; usage is written back at most every TOUCH_INTERVAL_SECONDS"""
+        with self._lock:
+            entry.pending_hits += 1
+            if time.monotonic() - entry.touched_at < TOUCH_INTERVAL_SECONDS:
+                return
+            hits, entry.pending_hits = entry.pending_hits, 0
+            entry.touched_at = time.monotonic()
+
+        db = SessionLocal()
+        try:
+            db.query(VendorTemplate).filter(VendorTemplate.id == entry.template_id).update(
+                {
+                    VendorTemplate.hit_count: VendorTemplate.hit_count + hits,
+                    VendorTemplate.last_used_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning("Could not record vendor template usage: %s", e)
+        finally:
+            db.close()
+
+    def _evict_stored(self, db: Session, user_id: str) -> None:
+        """Delete the user's least recently used templates beyond max_per_user"""
+        stale = db.query(VendorTemplate.id, VendorTemplate.fingerprint).filter(
+            VendorTemplate.user_id == user_id
+        ).order_by(VendorTemplate.last_used_at.desc()).offset(self.max_per_user).all()
+        if not stale:
+            return
+        db.query(VendorTemplate).filter(
+            VendorTemplate.id.in_([template_id for template_id, _ in stale])
+        ).delete(synchronize_session=False)
+        with self._lock:
+            for _, fingerprint in stale:
+                self._index.pop((user_id, fingerprint), None)
+
+
+def extract_with_template(user_id: Optional[str], text: str) -> Optional[InvoiceExtractionResponse]:
+    """
+    Template extraction for the processing pipeline (no-op without a user
+    or when templates are disabled); lookup failures never block extraction
+    """
+    if not settings.VENDOR_TEMPLATES_ENABLED or not user_id or not text.strip():
+        return None
+    try:
+        return vendor_template_store.extract(user_id, text)
+    except Exception as e:
+        logger.warning("Vendor template lookup failed: %s", e)
+        return None
+
+
+# Global vendor template store instance
+vendor_template_store = VendorTemplateStore(
+    max_cached=settings.VENDOR_TEMPLATE_CACHE_SIZE,
+    max_per_user=settings.VENDOR_TEMPLATE_MAX_PER_USER
+)
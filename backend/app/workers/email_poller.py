@@ -6,15 +6,11 @@ import logging
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
+from app.core.logging import setup_logging
 from app.db.session import SessionLocal
 from app.crud import email_credential as email_crud
 from app.services.email_polling import EmailPollingService
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -193,6 +189,7 @@ def stop_background_polling():
 
 if __name__ == "__main__":
     # Run standalone worker
+    setup_logging()
     logger.info("Starting standalone email poller worker")
     worker = EmailPollerWorker(check_interval_seconds=60)
     asyncio.run(worker.start())
@@ -0,0 +1,122 @@
+"""
+Concurrent upload latency: blocking vs async extraction path
+
+Serves a minimal app with the old blocking call (/sync) and the async
+path (/async), fires N concurrent uploads plus a stream of /ping probes,
+and reports how long uploads and unrelated requests take on one worker.
+
+Usage (from backend/):
+    python -m benchmarks.async_upload --uploads 10 --latency 1.0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from benchmarks.common import configure_environment, percentile, FakeGeminiClient
+
+configure_environment()
+
+import fitz  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import FastAPI, UploadFile, File  # noqa: E402
+from app.services import gemini_extraction, invoice_processing  # noqa: E402
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/sync")
+    async def sync_upload(file: UploadFile = File(...)):
+        contents = await file.read()
+        result = invoice_processing.process_invoice_document(contents, file.content_type)
+        return {"invoice_id": result.extraction.invoice_id}
+
+    @app.post("/async")
+    async def async_upload(file: UploadFile = File(...)):
+        contents = await file.read()
+        result = await invoice_processing.process_invoice_document_async(contents, file.content_type)
+        return {"invoice_id": result.extraction.invoice_id}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def sample_pdf() -> bytes:
+    document = fitz.open()
+    for page_num in range(3):
+        page = document.new_page()
+        page.insert_text(
+            (72, 72),
+            f"Acme Corporation\nInvoice Number: INV-1001\nPage {page_num + 1}\n"
+            "Invoice Date: 2024-01-15\nTotal Due: USD 1,250.50\n" * 5
+        )
+    return document.tobytes()
+
+
+async def run_mode(client: httpx.AsyncClient, path: str, uploads: int, pdf: bytes) -> dict:
+    upload_latencies = []
+    ping_latencies = []
+    done = asyncio.Event()
+
+    async def upload(submitted_at: float):
+        response = await client.post(path, files={"file": ("invoice.pdf", pdf, "application/pdf")})
+        response.raise_for_status()
+        upload_latencies.append(time.perf_counter() - submitted_at)
+
+    async def probe():
+        # A ping is "sent" every 50ms; latency includes time spent waiting
+        # for a blocked event loop to get around to it
+        next_send = time.perf_counter()
+        while True:
+            await client.get("/ping")
+            ping_latencies.append(time.perf_counter() - next_send)
+            if done.is_set():
+                break
+            next_send += 0.05
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    start = time.perf_counter()
+    probe_task = asyncio.create_task(probe())
+    await asyncio.gather(*(upload(start) for _ in range(uploads)))
+    wall = time.perf_counter() - start
+    done.set()
+    await probe_task
+
+    return {
+        "mode": path.strip("/"),
+        "uploads": uploads,
+        "wall_seconds": round(wall, 3),
+        "upload_p50": round(percentile(upload_latencies, 50), 3),
+        "upload_p95": round(percentile(upload_latencies, 95), 3),
+        "upload_max": round(max(upload_latencies), 3),
+        "ping_p50": round(percentile(ping_latencies, 50), 3),
+        "ping_max": round(max(ping_latencies, default=0.0), 3),
+        "ping_count": len(ping_latencies),
+    }
+
+
+async def main(uploads: int, latency: float) -> None:
+    for name in ("multipart", "python_multipart"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    gemini_extraction.set_client(FakeGeminiClient(latency=latency))
+    pdf = sample_pdf()
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = [
+            await run_mode(client, "/sync", uploads, pdf),
+            await run_mode(client, "/async", uploads, pdf),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=10, help="Concurrent uploads per mode")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated model latency (s)")
+    args = parser.parse_args()
+    asyncio.run(main(args.uploads, args.latency))
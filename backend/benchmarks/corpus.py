@@ -0,0 +1,133 @@
+"""
+Synthetic invoice corpus for the pipeline benchmarks
+Generates, deterministically from a seed:
+- text PDFs: one-page invoices with a text layer
+- scanned PDFs: the same invoices rasterized into image-only pages
+- statements: multi-page text PDFs with repeated headers and line items
+- phone JPEGs: large, slightly rotated, noisy camera shots of an invoice
+"""
+import io
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFilter
+
+VENDORS = [
+    "Acme Corporation", "Globex Industries", "Initech Supplies Ltd", "Umbrella Logistics GmbH",
+    "Stark Office Solutions", "Wayne Facilities Inc", "Nordlicht Handels AG", "Tata Print Services",
+]
+
+# (file bytes, MIME type) per document
+Document = Tuple[bytes, str]
+
+
+def _invoice_lines(generator: random.Random, items: int) -> List[str]:
+    vendor = generator.choice(VENDORS)
+    issued = date(2024, 1, 1) + timedelta(days=generator.randrange(365))
+    lines = [
+        vendor,
+        f"{generator.randrange(1, 999)} Market Street, Springfield",
+        "INVOICE",
+        f"Invoice Number: INV-{generator.randrange(100000):05d}",
+        f"Invoice Date: {issued.isoformat()}",
+        f"Due Date: {(issued + timedelta(days=30)).isoformat()}",
+        "Bill To: Example Corp, 1 Main Road",
+        "Description                 Qty     Unit      Amount",
+    ]
+    total = 0.0
+    for index in range(items):
+        quantity = generator.randrange(1, 20)
+        price = round(generator.uniform(5, 500), 2)
+        total += quantity * price
+        lines.append(f"Service item {index + 1:<15} {quantity:>4} {price:>9.2f} {quantity * price:>10.2f}")
+    lines += [f"Subtotal: {total:,.2f}", f"Total Due: USD {total:,.2f}", "Thank you for your business."]
+    return lines
+
+
+def _text_pdf(pages: List[List[str]]) -> bytes:
+    with fitz.open() as document:
+        for lines in pages:
+            page = document.new_page()
+            page.insert_text((56, 64), "\n".join(lines), fontsize=10)
+        return document.tobytes()
+
+
+def text_pdf(generator: random.Random) -> bytes:
+    """One-page invoice with a text layer"""
+    return _text_pdf([_invoice_lines(generator, generator.randrange(3, 12))])
+
+
+def scanned_pdf(generator: random.Random, dpi: int = 200) -> bytes:
+    """One-page invoice rasterized into an image-only PDF"""
+    with fitz.open(stream=text_pdf(generator), filetype="pdf") as source, fitz.open() as scanned:
+        for page in source:
+            pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            target = scanned.new_page(width=page.rect.width, height=page.rect.height)
+            target.insert_image(target.rect, stream=pixmap.tobytes("jpeg"))
+        return scanned.tobytes()
+
+
+def statement(generator: random.Random, pages: int = 12) -> bytes:
+    """Multi-page statement: the header repeats on every page, totals on the last"""
+    lines = _invoice_lines(generator, pages * 40)
+    header, items, footer = lines[:8], lines[8:-3], lines[-3:]
+    per_page = max(len(items) // pages, 1)
+    page_lines = []
+    for index in range(pages):
+        chunk = items[index * per_page:(index + 1) * per_page]
+        page_lines.append(header + chunk + [f"Page {index + 1} of {pages}"])
+    page_lines[-1] += footer
+    return _text_pdf(page_lines)
+
+
+# EXIF orientation -> transpose that stores an upright photo the way a
+# sideways-held phone writes it (the inverse of what viewers apply)
+_STORED_AS = {3: Image.ROTATE_180, 6: Image.ROTATE_90, 8: Image.ROTATE_270}
+
+
+def phone_jpeg(generator: random.Random, size: Tuple[int, int] = (4032, 3024), orientation: int = 1) -> bytes:
+    """
+    Large camera-style JPEG of a printed invoice on a darker background;
+    orientation 3, 6 or 8 stores it rotated with a matching EXIF tag
+    """
+    width, height = size
+    photo = Image.new("RGB", size, (92, 84, 76))
+    paper = Image.new("RGB", (int(width * 0.6), int(height * 0.9)), (246, 244, 238))
+    draw = ImageDraw.Draw(paper)
+    for row, line in enumerate(_invoice_lines(generator, generator.randrange(3, 12))):
+        draw.text((80, 80 + row * 60), line, fill=(20, 20, 20))
+    paper = paper.rotate(generator.uniform(-4, 4), expand=True, fillcolor=(92, 84, 76))
+    photo.paste(paper, ((width - paper.width) // 2, (height - paper.height) // 2))
+
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    photo = Image.blend(photo, noise, 0.08).filter(ImageFilter.GaussianBlur(0.6))
+    exif = Image.Exif()
+    if orientation in _STORED_AS:
+        photo = photo.transpose(_STORED_AS[orientation])
+        exif[0x0112] = orientation  # Orientation tag
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def build_corpus(documents: int, statement_pages: int = 12, seed: int = 0) -> Dict[str, List[Document]]:
+    """
+    Generate the benchmark corpus
+
+    Args:
+        documents: Documents per kind
+        statement_pages: Pages per multi-page statement
+        seed: Seed for repeatable corpora
+
+    Returns:
+        Documents by kind: text_pdf, scanned_pdf, statement, phone_jpeg
+    """
+    generator = random.Random(seed)
+    return {
+        "text_pdf": [(text_pdf(generator), "application/pdf") for _ in range(documents)],
+        "scanned_pdf": [(scanned_pdf(generator), "application/pdf") for _ in range(documents)],
+        "statement": [(statement(generator, statement_pages), "application/pdf") for _ in range(documents)],
+        "phone_jpeg": [(phone_jpeg(generator), "image/jpeg") for _ in range(documents)],
+    }
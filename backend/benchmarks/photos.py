@@ -0,0 +1,124 @@
+"""
+Phone photo normalization: decode time and payload size
+
+Generates large camera-style JPEGs (12 MP and 48 MP, upright and with
+EXIF rotation tags) and compares, per photo:
+- full: full-resolution decode and a JPEG re-encode at native size,
+  roughly what sending the photo as uploaded costs
+- normalized: prepare_photo() (draft-mode decode, EXIF transpose, size
+  cap, single encode)
+- normalized+crop: the same with auto_crop enabled
+
+Reports median/p95 decode and total milliseconds, median payload bytes and
+output dimensions per variant as JSON.
+
+Usage (from backend/):
+    python -m benchmarks.photos --photos 6 --output photos.json
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.common import configure_environment, percentile
+
+configure_environment()
+
+from PIL import Image, ImageOps  # noqa: E402
+
+from benchmarks.corpus import phone_jpeg  # noqa: E402
+from app.services.document_analysis import image_options  # noqa: E402
+from app.services.image_preparation import prepare_photo  # noqa: E402
+
+SIZES = {"12mp": (4032, 3024), "48mp": (8000, 6000)}
+ORIENTATIONS = (1, 6, 3, 8)
+
+
+def full_resolution(data: bytes) -> dict:
+    """Decode everything and re-encode at native size (no normalization)"""
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    decode = time.perf_counter() - start
+    img = ImageOps.exif_transpose(img)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=80)
+    return {
+        "decode": decode,
+        "total": time.perf_counter() - start,
+        "bytes": len(buffer.getvalue()),
+        "size": img.size,
+    }
+
+
+def normalized(auto_crop: bool) -> Callable[[bytes], dict]:
+    options = image_options()
+    options.auto_crop = auto_crop
+
+    def run(data: bytes) -> dict:
+        start = time.perf_counter()
+        prepared = prepare_photo(data, options)
+        return {
+            "decode": prepared.timings["decode"],
+            "total": time.perf_counter() - start,
+            "bytes": len(prepared.data),
+            "size": prepared.size,
+        }
+
+    return run
+
+
+def run(photos: int, seed: int) -> dict:
+    generator = random.Random(seed)
+    variants: Dict[str, Callable[[bytes], dict]] = {
+        "full": full_resolution,
+        "normalized": normalized(auto_crop=False),
+        "normalized+crop": normalized(auto_crop=True),
+    }
+    report: Dict[str, dict] = {}
+    for label, size in SIZES.items():
+        started = time.perf_counter()
+        corpus = [phone_jpeg(generator, size, ORIENTATIONS[index % len(ORIENTATIONS)]) for index in range(photos)]
+        print(f"{label}: generated {photos} photo(s) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        for name, variant in variants.items():
+            results: List[dict] = [variant(data) for data in corpus]
+            decode = [result["decode"] for result in results]
+            total = [result["total"] for result in results]
+            payload = sorted(result["bytes"] for result in results)
+            stats = {
+                "photos": photos,
+                "input_bytes_median": sorted(len(data) for data in corpus)[len(corpus) // 2],
+                "decode_p50_ms": round(percentile(decode, 50) * 1000, 1),
+                "decode_p95_ms": round(percentile(decode, 95) * 1000, 1),
+                "total_p50_ms": round(percentile(total, 50) * 1000, 1),
+                "total_p95_ms": round(percentile(total, 95) * 1000, 1),
+                "payload_bytes_median": payload[len(payload) // 2],
+                "output_size": list(results[0]["size"]),
+            }
+            report[f"{label}/{name}"] = stats
+            print(
+                f"{label + '/' + name:<22} decode p50={stats['decode_p50_ms']:>7.1f}ms "
+                f"total p50={stats['total_p50_ms']:>7.1f}ms payload={stats['payload_bytes_median']:>9,}B "
+                f"out={stats['output_size'][0]}x{stats['output_size'][1]}",
+                file=sys.stderr
+            )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=6, help="Photos per resolution")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.photos, args.seed)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
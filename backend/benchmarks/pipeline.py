@@ -0,0 +1,288 @@
+"""
+Extraction pipeline benchmark over a synthetic invoice corpus
+
+Generates text PDFs, scanned (image-only) PDFs, multi-page statements and
+large phone JPEGs, then runs each pipeline stage against the fake
+extraction backend (no model quota is used) and reports per stage:
+p50/p95/p99 latency, throughput and peak RSS of this process and of the
+document engine workers. Peak RSS is reset between stages where the kernel
+allows it (Linux /proc/<pid>/clear_refs), so each figure is that stage's
+own high-water mark.
+
+Output is JSON (stdout or --output) keyed by stage, so runs on different
+commits can be diffed or compared with --compare.
+
+Usage (from backend/):
+    python -m benchmarks.pipeline --documents 20 --model-latency 0.0 --output bench.json
+    python -m benchmarks.pipeline --compare bench.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, TextIO
+
+from benchmarks.common import configure_environment, percentile
+
+configure_environment()
+
+from benchmarks.corpus import build_corpus  # noqa: E402
+
+
+def _read_peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM (peak resident set) of a process in MB, None where unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak_rss(pid: int) -> None:
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass  # Not Linux or not permitted: peaks stay cumulative
+
+
+def _worker_pids() -> List[int]:
+    return [child.pid for child in multiprocessing.active_children()]
+
+
+def _process_peak_rss_mb() -> float:
+    peak = _read_peak_rss_mb(os.getpid())
+    if peak is not None:
+        return peak
+    # ru_maxrss is KB on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+def run_stage(name: str, items: List, call: Callable, concurrency: int) -> dict:
+    """
+    Time call(item) for every item
+
+    Args:
+        name: Stage name for the report
+        items: Inputs, one call each
+        call: Function under test
+        concurrency: Worker threads issuing calls
+
+    Returns:
+        Stage statistics
+    """
+    for pid in [os.getpid()] + _worker_pids():
+        _reset_peak_rss(pid)
+
+    latencies: List[float] = []
+    errors = 0
+
+    def timed(item) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call(item)
+        except Exception as e:
+            errors += 1
+            print(f"[{name}] {type(e).__name__}: {e}", file=sys.stderr)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, items))
+    else:
+        for item in items:
+            timed(item)
+    wall = time.perf_counter() - started
+
+    worker_peaks = [peak for peak in map(_read_peak_rss_mb, _worker_pids()) if peak is not None]
+    stats = {
+        "count": len(items),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(items) / wall, 2) if wall > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "peak_rss_mb": round(_process_peak_rss_mb(), 1),
+        "workers_peak_rss_mb": round(max(worker_peaks), 1) if worker_peaks else None,
+    }
+    print(
+        f"{name:<32} n={stats['count']:<4} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+        f"p99={stats['p99_ms']:>9.2f}ms {stats['throughput_per_second']}/s rss={stats['peak_rss_mb']}MB",
+        file=sys.stderr
+    )
+    return stats
+
+
+def benchmark_create_invoice(count: int) -> dict:
+    """Insert invoices (duplicate checks included) into the SQLite benchmark database"""
+    from app.crud.invoice import create_invoice
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.user import User
+    from app.schemas.invoice import InvoiceCreate, InvoiceExtractionResponse
+    from app.services.extraction_backends import FakeBackend
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add(User(id="benchmark-user", email="benchmark@example.com"))
+        db.commit()
+
+        fake = FakeBackend(latency_median=0.0, latency_sigma=0.0)
+        extractions = [fake._invoice_for(str(index).encode()) for index in range(count)]
+
+        def insert(extraction: InvoiceExtractionResponse) -> None:
+            create_invoice(
+                db,
+                user_id="benchmark-user",
+                invoice_data=InvoiceCreate(original_filename=f"{extraction.invoice_id}.pdf", file_type="pdf"),
+                extraction_result=extraction,
+                extracted_text="benchmark"
+            )
+
+        return run_stage("create_invoice", extractions, insert, concurrency=1)
+    finally:
+        db.close()
+
+
+def run(documents: int, statement_pages: int, model_latency: float, concurrency: int, seed: int) -> dict:
+    from app.services import invoice_processing
+    from app.services.document_engine import document_engine
+    from app.services.extraction_backends import FakeBackend, set_backend
+
+    set_backend(FakeBackend(latency_median=model_latency, latency_sigma=0.25 if model_latency else 0.0, seed=seed))
+    document_engine.start()
+
+    corpus_started = time.perf_counter()
+    corpus = build_corpus(documents, statement_pages, seed)
+    print(f"corpus: {documents} document(s) per kind in {time.perf_counter() - corpus_started:.1f}s", file=sys.stderr)
+
+    stages: Dict[str, dict] = {}
+    stages["extract_text_from_pdf[text_pdf]"] = run_stage(
+        "extract_text_from_pdf[text_pdf]", corpus["text_pdf"],
+        lambda document: invoice_processing.extract_text_from_pdf(document[0]), concurrency
+    )
+    stages["extract_text_from_pdf[statement]"] = run_stage(
+        "extract_text_from_pdf[statement]", corpus["statement"],
+        lambda document: invoice_processing.extract_text_from_pdf(document[0]), concurrency
+    )
+    stages["convert_pdf_to_images[scanned_pdf]"] = run_stage(
+        "convert_pdf_to_images[scanned_pdf]", corpus["scanned_pdf"],
+        lambda document: invoice_processing.convert_pdf_to_images(document[0]), concurrency
+    )
+    for kind, documents_of_kind in corpus.items():
+        name = f"process_invoice_file[{kind}]"
+        stages[name] = run_stage(
+            name, documents_of_kind,
+            lambda document: invoice_processing.process_invoice_file(*document), concurrency
+        )
+    stages["create_invoice"] = benchmark_create_invoice(documents * len(corpus))
+
+    document_engine.shutdown()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "documents_per_kind": documents,
+            "statement_pages": statement_pages,
+            "model_latency_seconds": model_latency,
+            "concurrency": concurrency,
+            "seed": seed,
+            "corpus_bytes": {kind: sum(len(data) for data, _ in docs) for kind, docs in corpus.items()},
+        },
+        "stages": stages,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def _report_stdout() -> Iterator[TextIO]:
+    """
+    Send everything written to stdout (app log lines, including those of the
+    spawned document engine workers) to stderr, and yield the real stdout so
+    the JSON report is the only thing on it
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    stdout = os.fdopen(saved, "w")
+    try:
+        yield stdout
+    finally:
+        sys.stdout.flush()
+        stdout.flush()
+        os.dup2(saved, 1)
+        stdout.close()
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """Print per-stage changes against a previous run (to stderr)"""
+    print(f"{'stage':<36} {'p50':>16} {'p95':>16} {'throughput':>18}", file=sys.stderr)
+    for name, stats in current["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            print(f"{name:<36} (new)", file=sys.stderr)
+            continue
+
+        def change(key: str) -> str:
+            old, new = before.get(key), stats.get(key)
+            if not old or new is None:
+                return "n/a"
+            return f"{new:g} ({(new - old) / old:+.0%})"
+
+        print(
+            f"{name:<36} {change('p50_ms'):>16} {change('p95_ms'):>16} {change('throughput_per_second'):>18}",
+            file=sys.stderr
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20, help="Documents per corpus kind")
+    parser.add_argument("--statement-pages", type=int, default=12, help="Pages per multi-page statement")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Median fake model latency (s)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads issuing calls per stage")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and latency seed")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON report to compare this run against")
+    args = parser.parse_args()
+
+    with _report_stdout() as stdout:
+        report = run(args.documents, args.statement_pages, args.model_latency, args.concurrency, args.seed)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(report, output, indent=2)
+        else:
+            stdout.write(json.dumps(report, indent=2) + "\n")
+        if args.compare:
+            with open(args.compare) as baseline:
+                compare(json.load(baseline), report)
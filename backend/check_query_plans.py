@@ -0,0 +1,256 @@
+"""
+Query plan check for the hot per-user queries
+Seeds a scratch database with many users' invoices and email processing
+logs, runs the real CRUD/service queries against it, and EXPLAINs every
+statement they issue. Fails (exit code 1) if a statement:
+- scans the whole invoices or email_processing_logs table
+- sorts rows (an ordered query's index should return them in order)
+- finds a selective lookup's rows by user_id alone and filters them
+  afterwards (the index should cover the other predicates too)
+
+- SQLite: EXPLAIN QUERY PLAN ("SCAN <table>", "USE TEMP B-TREE FOR ORDER
+  BY", "SEARCH ... (user_id=?)")
+- PostgreSQL: EXPLAIN with enable_seqscan off ("Seq Scan", "Sort", a
+  "Filter" on an index scan)
+
+Usage (from backend/):
+    python check_query_plans.py                       # temporary SQLite file
+    python check_query_plans.py --database-url postgresql://.../scratch_db
+
+tests/test_query_plans.py runs the SQLite check as part of the test suite.
+
+The database must not have the app's tables yet; they are created, seeded
+and dropped again.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Set, Tuple
+
+from benchmarks.common import configure_environment
+
+# The app's own engine is never used here; keep it off disk
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+configure_environment()
+
+from sqlalchemy import create_engine, event, inspect  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.db.base import Base  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.invoice import Invoice, InvoiceStatus  # noqa: E402
+from app.models.email_credential import EmailProcessingLog  # noqa: E402
+from app.crud import invoice as invoice_crud  # noqa: E402
+from app.crud import email_credential as email_credential_crud  # noqa: E402
+from app.services.email_polling import EmailPollingService  # noqa: E402
+from app.services.invoice_fingerprint import invoice_fingerprint, recent_fingerprints  # noqa: E402
+
+CHECKED_TABLES = ("invoices", "email_processing_logs")
+VENDORS = ["Acme Corporation", "Globex Industries", "Initech", "Umbrella Supplies", "Stark Logistics"]
+STATUSES = [InvoiceStatus.COMPLETED] * 6 + [InvoiceStatus.PENDING, InvoiceStatus.PROCESSING, InvoiceStatus.FAILED]
+LOG_STATUSES = ["success", "success", "success", "partial", "failed"]
+
+
+def seed(session, users: int, rows_per_user: int, generator: random.Random) -> List[str]:
+    """Insert users with invoices and processing logs; returns the user ids"""
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    session.execute(User.__table__.insert(), [
+        {"id": user_id, "email": f"user{index}@example.com", "created_at": datetime.utcnow()}
+        for index, user_id in enumerate(user_ids)
+    ])
+
+    start = datetime.utcnow() - timedelta(days=365)
+    for user_id in user_ids:
+        invoices, logs = [], []
+        for index in range(rows_per_user):
+            vendor = generator.choice(VENDORS)
+            amount = round(generator.uniform(10, 5000), 2)
+            invoice_date = (start + timedelta(days=generator.randrange(365))).date().isoformat()
+            created_at = start + timedelta(minutes=index * 30 + generator.randrange(30))
+            invoices.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "invoice_id": f"INV-{index:06d}",
+                "vendor_name": vendor,
+                "amount_due": amount,
+                "invoice_date": invoice_date,
+                "original_filename": f"invoice-{index}.pdf",
+                "content_sha256": uuid.uuid4().hex * 2,
+                "dedupe_fingerprint": invoice_fingerprint(f"{vendor} {index}", amount, invoice_date),
+                "status": generator.choice(STATUSES).name,
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+            logs.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "email_credential_id": user_id,
+                "email_message_id": f"<{uuid.uuid4().hex}@mail.example.com>",
+                "attachments_found": 1,
+                "attachments_processed": 1,
+                "invoices_created": 1,
+                "status": generator.choice(LOG_STATUSES),
+                "processed_at": created_at,
+            })
+        session.execute(Invoice.__table__.insert(), invoices)
+        session.execute(EmailProcessingLog.__table__.insert(), logs)
+    session.commit()
+    return user_ids
+
+
+# Extra rule per check: "exact" (no filtering after the index lookup)
+EXACT = "exact"
+
+
+def hot_queries(session, user_id: str) -> Dict[str, Tuple[Callable[[], object], Set[str]]]:
+    """The per-user queries to check, each run through the code that issues it, with their rules"""
+    sample = session.query(Invoice).filter(
+        Invoice.user_id == user_id,
+        Invoice.dedupe_fingerprint.isnot(None)
+    ).first()
+    message_id = session.query(EmailProcessingLog.email_message_id).filter(
+        EmailProcessingLog.user_id == user_id
+    ).first()[0]
+    polling = SimpleNamespace(db=session, email_credential=SimpleNamespace(user_id=user_id))
+
+    return {
+        "get_invoices": (lambda: invoice_crud.get_invoices(session, user_id, skip=20, limit=10), set()),
+        "get_invoices(status)": (lambda: invoice_crud.get_invoices(
+            session, user_id, limit=10, status=InvoiceStatus.COMPLETED
+        ), {EXACT}),
+        "get_invoice_stats": (lambda: invoice_crud.get_invoice_stats(session, user_id), {EXACT}),
+        "find_duplicate_invoice": (lambda: invoice_crud.find_duplicate_invoice(
+            session,
+            user_id=user_id,
+            invoice_id="INV-NEW",
+            vendor_name="New Vendor",
+            amount_due=sample.amount_due,
+            invoice_date=sample.invoice_date,
+            original_filename=sample.original_filename
+        ), {EXACT}),
+        "find_invoice_by_content": (lambda: invoice_crud.find_invoice_by_content(
+            session, user_id, sample.content_sha256, include_in_progress=True
+        ), set()),
+        "get_processing_logs": (lambda: email_credential_crud.get_processing_logs(session, user_id, limit=50), set()),
+        "already_processed": (lambda: EmailPollingService._already_processed(polling, message_id), {EXACT}),
+    }
+
+
+def capture_statements(engine, run: Callable[[], object]) -> List[Tuple[str, object]]:
+    """Run a query function and return the SELECT statements it executed"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def sqlite_plan(connection, statement: str, parameters, rules: Set[str]) -> Tuple[List[str], List[str]]:
+    """(plan steps, problem steps)"""
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    steps = [row[-1] for row in rows]
+    tables = "|".join(CHECKED_TABLES)
+    problems = [step for step in steps if re.match(r"^SCAN (%s)\b" % tables, step)]
+    problems += [step for step in steps if step.startswith("USE TEMP B-TREE FOR ORDER BY")]
+    if EXACT in rules and _filters_beyond_user(statement):
+        problems += [step for step in steps if re.match(r"^SEARCH (%s) .*\(user_id=\?\)$" % tables, step)]
+    return steps, problems
+
+
+def _filters_beyond_user(statement: str) -> bool:
+    """Whether a statement's WHERE clause has predicates on columns other than user_id"""
+    where = re.split(r"\bWHERE\b", statement, maxsplit=1)[-1] if re.search(r"\bWHERE\b", statement) else ""
+    columns = set(re.findall(r"\w+\.(\w+)\s*(?:=|!=|IN\b|IS\b)", where))
+    return bool(columns - {"user_id"})
+
+
+def postgresql_plan(connection, statement: str, parameters, rules: Set[str]) -> Tuple[List[str], List[str]]:
+    """(plan nodes, problem nodes)"""
+    plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    steps, problems = [], []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        relation = node.get("Relation Name")
+        step = f"{node['Node Type']} on {relation} ({node.get('Index Name', '')})" if relation else node["Node Type"]
+        if node.get("Filter"):
+            step += f" filter {node['Filter']}"
+        steps.append(step)
+        if relation in CHECKED_TABLES and (
+            node["Node Type"] == "Seq Scan"
+            # A filter on an index-only scan reads included columns, not the table
+            or (EXACT in rules and node.get("Filter") and node["Node Type"] != "Index Only Scan")
+        ):
+            problems.append(step)
+        if node["Node Type"] in ("Sort", "Incremental Sort"):
+            problems.append(step)
+        nodes.extend(node.get("Plans", []))
+    return steps, problems
+
+
+def run(database_url: str, users: int, rows_per_user: int, seed_value: int) -> int:
+    engine = create_engine(database_url)
+    existing = set(inspect(engine).get_table_names()) & {table.name for table in Base.metadata.sorted_tables}
+    if existing:
+        print(f"Refusing to run: {engine.url} already has app tables ({', '.join(sorted(existing))})")
+        return 2
+
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        user_ids = seed(session, users, rows_per_user, random.Random(seed_value))
+        with engine.connect() as connection:
+            connection.exec_driver_sql("ANALYZE")
+            connection.commit()
+        print(f"Seeded {users} users x {rows_per_user} invoices and processing logs ({engine.dialect.name})")
+
+        recent_fingerprints.clear()
+        checks = hot_queries(session, user_ids[len(user_ids) // 2])
+        explain = postgresql_plan if engine.dialect.name == "postgresql" else sqlite_plan
+        failures = 0
+        with engine.connect() as connection:
+            if engine.dialect.name == "postgresql":
+                connection.exec_driver_sql("SET enable_seqscan = off")
+            for name, (query, rules) in checks.items():
+                for statement, parameters in capture_statements(engine, query):
+                    steps, problems = explain(connection, statement, parameters, rules)
+                    failures += bool(problems)
+                    print(f"{'FAIL' if problems else 'ok':<5}{name}")
+                    for step in steps:
+                        print(f"       {'!' if step in problems else ' '} {step}")
+        print(f"{failures} statement(s) not served by an index" if failures else "All checked statements use indexes")
+        return 1 if failures else 0
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Empty scratch database (default: a temporary SQLite file)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows-per-user", type=int, default=500, help="Invoices and processing logs per user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.database_url:
+        sys.exit(run(args.database_url, args.users, args.rows_per_user, args.seed))
+    with tempfile.TemporaryDirectory() as directory:
+        sys.exit(run(f"sqlite:///{os.path.join(directory, 'query_plans.db')}", args.users, args.rows_per_user, args.seed))
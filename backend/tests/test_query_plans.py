@@ -0,0 +1,14 @@
+"""
+Query plan regression test: the hot per-user queries must be served by
+indexes (see check_query_plans.py for the rules)
+"""
+import os
+import tempfile
+
+import check_query_plans
+
+
+def test_hot_queries_use_indexes():
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'query_plans.db')}"
+        assert check_query_plans.run(url, users=20, rows_per_user=500, seed_value=0) == 0